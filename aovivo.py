@@ -0,0 +1,228 @@
+# aovivo.py
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+
+# -------------------------
+# Ao vivo: novas mensagens do histórico para os participantes (SSE)
+# -------------------------
+# Quem grava HistoricoMensagens não precisa fazer nada: um listener da sessão
+# do SQLAlchemy junta as mensagens novas no flush e, no commit, publica um
+# evento por aventura num arquivo SQLite compartilhado (o mesmo esquema da
+# fila e das métricas). Em cada processo, uma única thread lê os eventos novos
+# desse arquivo e repassa para as conexões abertas daquela aventura; cada
+# conexão ociosa só espera na própria fila em memória (nenhuma consulta ao
+# banco por conexão). Eventos publicados no próprio processo são entregues na
+# hora, sem esperar a leitura do arquivo.
+#
+# Cada conexão prende uma thread (gthread) ou greenlet (gevent) enquanto está
+# aberta: para milhares de conexões use `gunicorn -k gevent`. Com workers
+# síncronos (o padrão do gunicorn) cada conexão ocuparia um worker inteiro,
+# por isso AOVIVO vem desligado.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS eventos (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    aventura_id INTEGER NOT NULL,
+    origem TEXT NOT NULL,
+    dados TEXT NOT NULL,
+    criado_em REAL NOT NULL
+);
+"""
+
+
+class Assinatura:
+    """Conexão de um participante: recebe os eventos da aventura numa fila limitada."""
+
+    def __init__(self, aventura_id, max_itens=100):
+        self.aventura_id = aventura_id
+        self.fila = queue.Queue(max_itens)
+        self.encerrada = False
+
+    def entregar(self, evento):
+        try:
+            self.fila.put_nowait(evento)
+        except queue.Full:
+            # cliente lento: encerra; o EventSource reconecta e recupera pelo Last-Event-ID
+            self.encerrada = True
+
+    def proximo(self, timeout):
+        """Próximo evento ou None após `timeout` segundos."""
+        try:
+            return self.fila.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class AoVivo:
+    def __init__(self, caminho="aovivo.sqlite3", intervalo=0.5, retencao=600):
+        self.caminho = caminho
+        self.intervalo = intervalo  # leitura dos eventos publicados por outros processos
+        self.retencao = retencao  # eventos mais velhos que isso são apagados do arquivo
+        self.origem = None  # identifica este processo nos eventos (ver _origem)
+        self._assinantes = {}  # aventura_id -> set(Assinatura)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None  # processo dono da thread de leitura
+        self._pid_origem = None
+        self._preparado = False
+
+    def init_app(self, app):
+        self.caminho = app.config.get("AOVIVO_DB_PATH", self.caminho)
+        self.intervalo = float(app.config.get("AOVIVO_INTERVALO", self.intervalo))
+        app.extensions["aovivo"] = self
+
+    # -------------------------
+    # SQLite
+    # -------------------------
+    def _conectar(self):
+        conn = sqlite3.connect(self.caminho, timeout=10, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        if not self._preparado:
+            conn.executescript(SCHEMA)
+            self._preparado = True
+        return conn
+
+    def _origem(self):
+        # uma por pid: com `gunicorn --preload` os workers herdam o objeto criado no
+        # processo mestre, e uma origem repetida faria cada um ignorar os eventos dos outros
+        pid = os.getpid()
+        if self._pid_origem != pid:
+            self.origem = uuid.uuid4().hex
+            self._pid_origem = pid
+        return self.origem
+
+    # -------------------------
+    # Publicação
+    # -------------------------
+    def publicar(self, aventura_id, dados):
+        """Entrega `dados` aos assinantes locais e grava para os outros processos."""
+        evento = {"aventura_id": aventura_id, "dados": dados}
+        self._entregar(evento)
+        conn = self._conectar()
+        try:
+            conn.execute(
+                "INSERT INTO eventos (aventura_id, origem, dados, criado_em) VALUES (?, ?, ?, ?)",
+                (aventura_id, self._origem(), json.dumps(dados, ensure_ascii=False), time.time()),
+            )
+        finally:
+            conn.close()
+
+    # -------------------------
+    # Assinatura
+    # -------------------------
+    def assinar(self, aventura_id):
+        self._iniciar()
+        assinatura = Assinatura(aventura_id)
+        with self._lock:
+            self._assinantes.setdefault(aventura_id, set()).add(assinatura)
+        return assinatura
+
+    def cancelar(self, assinatura):
+        with self._lock:
+            conjunto = self._assinantes.get(assinatura.aventura_id)
+            if conjunto is not None:
+                conjunto.discard(assinatura)
+                if not conjunto:
+                    del self._assinantes[assinatura.aventura_id]
+
+    def conexoes(self):
+        with self._lock:
+            return sum(len(c) for c in self._assinantes.values())
+
+    def _entregar(self, evento):
+        with self._lock:
+            destino = list(self._assinantes.get(evento["aventura_id"], ()))
+        for assinatura in destino:
+            assinatura.entregar(evento)
+
+    # -------------------------
+    # Leitura dos eventos de outros processos
+    # -------------------------
+    def _iniciar(self):
+        # thread por processo (depois de um fork do gunicorn, o filho sobe a sua)
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            origem = self._origem()
+            conn = self._conectar()
+            try:
+                ultimo = conn.execute("SELECT COALESCE(MAX(id), 0) FROM eventos").fetchone()[0]
+            finally:
+                conn.close()
+            self._thread = threading.Thread(target=self._loop, args=(ultimo, origem), name="aovivo", daemon=True)
+            self._thread.start()
+
+    def _loop(self, ultimo, minha_origem):
+        conn = self._conectar()
+        ultima_limpeza = time.monotonic()
+        while True:
+            time.sleep(self.intervalo)
+            try:
+                if time.monotonic() - ultima_limpeza > 60:
+                    conn.execute("DELETE FROM eventos WHERE criado_em < ?", (time.time() - self.retencao,))
+                    ultima_limpeza = time.monotonic()
+                with self._lock:
+                    ocioso = not self._assinantes
+                if ocioso:
+                    # ninguém ouvindo: só avança o cursor, para o próximo assinante
+                    # não receber de uma vez tudo o que foi publicado enquanto isso
+                    maximo = conn.execute("SELECT MAX(id) FROM eventos").fetchone()[0]
+                    ultimo = max(ultimo, maximo or 0)
+                    continue
+                linhas = conn.execute(
+                    "SELECT id, aventura_id, origem, dados FROM eventos WHERE id > ? ORDER BY id", (ultimo,)
+                ).fetchall()
+            except sqlite3.Error:
+                continue
+            for evento_id, aventura_id, origem, dados in linhas:
+                ultimo = evento_id
+                if origem != minha_origem:
+                    self._entregar({"aventura_id": aventura_id, "dados": json.loads(dados)})
+
+
+# -------------------------
+# Publicação a partir da sessão do SQLAlchemy
+# -------------------------
+def conectar_sessao(sessao, modelo, serializar, atual):
+    """Publica as instâncias novas de `modelo` quando a transação da sessão é confirmada.
+
+    serializar(obj) -> dict; os objetos são lidos no flush (no commit já estão expirados).
+    atual() -> AoVivo que publica, ou None (ao vivo desligado). A sessão (db.session)
+    é a mesma para todas as apps do processo, então a instância é resolvida a cada vez.
+    """
+    from sqlalchemy import event
+
+    def depois_do_flush(session, contexto):
+        if atual() is None:
+            return
+        # no after_flush, session.new ainda mostra o estado de antes do flush, já com os ids
+        novas = [obj for obj in session.new if isinstance(obj, modelo)]
+        if novas:
+            pendentes = session.info.setdefault("aovivo", {})
+            for obj in novas:
+                pendentes.setdefault(obj.aventura_id, []).append(serializar(obj))
+
+    def depois_do_commit(session):
+        pendentes = session.info.pop("aovivo", None)
+        aovivo = atual() if pendentes else None
+        if aovivo is None:
+            return
+        for aventura_id, mensagens in pendentes.items():
+            try:
+                aovivo.publicar(aventura_id, {"mensagens": mensagens, "cursor": mensagens[-1]["id"]})
+            except sqlite3.Error:
+                pass  # o push é melhor esforço: a mensagem já está no banco
+
+    def depois_do_rollback(session):
+        session.info.pop("aovivo", None)
+
+    event.listen(sessao, "after_flush", depois_do_flush)
+    event.listen(sessao, "after_commit", depois_do_commit)
+    event.listen(sessao, "after_rollback", depois_do_rollback)
@@ -1,15 +1,37 @@
 # app.py
 import os
-from datetime import datetime
-from flask import Flask, render_template, redirect, url_for, request, flash, session, abort, jsonify, current_app
+from datetime import datetime, timedelta
+from flask import g, has_app_context, Flask, Blueprint, before_render_template, template_rendered, render_template, redirect, url_for, request, flash, session, abort, jsonify, current_app, Response, stream_with_context, make_response
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from itsdangerous import URLSafeTimedSerializer
+from werkzeug.local import LocalProxy
 from forms import LoginForm, SignupForm, AventuraForm, ForgotPasswordForm, SetPasswordForm, TurnoForm, PersonagemForm
-from models import db, Usuario, Personagem, Item, Aventura, Sessao, Participacao, HistoricoMensagens
-from sqlalchemy import text
+from models import db, Usuario, Personagem, Item, Aventura, Sessao, SessaoAuditoria, Participacao, HistoricoMensagens, AcaoRodada, CODEC_AUDITORIA, opcoes_engine, configurar_sqlite
+from sqlalchemy import text, event
+from sqlalchemy.orm import make_transient_to_detached, object_session
+from cache import CacheTTL, InvalidacoesCompartilhadas
 from flask_mail import Mail, Message
-from openai import OpenAI
+from correio import FilaEmails
+from senhas import PoolSenhas, SenhasOcupadas
+from fila import FilaJobs
+from metricas import Metricas
+from narrador import Narrador, NarradorIndisponivel
+from aovivo import AoVivo, conectar_sessao
+from arquivo import ArquivoFrio, arquivar_aventura
+from consultas import ContadorConsultas, OrcamentoExcedido, instalar as instalar_contador
+from prompts import PromptBuilder, PRIORIDADE_ESSENCIAL, PRIORIDADE_ALTA, PRIORIDADE_MEDIA, PRIORIDADE_BAIXA
+from dados import REGRAS_PADRAO, descrever, distribuicao, resolver_rodada, validar_limites
+from resumo import SYSTEM_PROMPT_RESUMO, cursor_resumo, precisa_resumir, sessoes_nao_resumidas, montar_prompt_resumo, aplicar_resumo
+from flask_migrate import Migrate, upgrade
+import sqlite3
+import time
+import uuid
+import hashlib
+import click
+from types import SimpleNamespace
+from functools import partial
+from flask.json.provider import DefaultJSONProvider
 
 
 import json
@@ -17,49 +39,220 @@ import json
 # -------------------------
 # Config
 # -------------------------
-app = Flask(__name__)
-
-
-app.config["SECRET_KEY"] = os.getenv("FLASK_SECRET_KEY", "dev-secret-key")
-app.config["SQLALCHEMY_DATABASE_URI"] = os.getenv("DATABASE_URL", "sqlite:///db.sqlite3")
-app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
-# app.config['SERVER_NAME'] = 'corujal-rpg.onrender.com'
-
-# Mail
-app.config["MAIL_SERVER"] = "smtp.gmail.com"
-app.config["MAIL_PORT"] = 587
-app.config["MAIL_USE_TLS"] = True
-app.config["MAIL_USERNAME"] = os.getenv("MAIL_USER")
-app.config["MAIL_PASSWORD"] = os.getenv("MAIL_PASS")
-app.config["MAIL_DEFAULT_SENDER"] = os.getenv("MAIL_TO", app.config["MAIL_USERNAME"])
+def configurar(app):
+    app.config["SECRET_KEY"] = os.getenv("FLASK_SECRET_KEY", "dev-secret-key")
+    app.config["SQLALCHEMY_DATABASE_URI"] = os.getenv("DATABASE_URL", "sqlite:///db.sqlite3")
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    # app.config['SERVER_NAME'] = 'corujal-rpg.onrender.com'
+
+    # Banco: pool de conexões (Postgres) e pragmas por conexão (SQLite), ver models.opcoes_engine
+    app.config["DB_POOL_SIZE"] = int(os.getenv("DB_POOL_SIZE", 5))
+    app.config["DB_MAX_OVERFLOW"] = int(os.getenv("DB_MAX_OVERFLOW", 10))
+    app.config["DB_POOL_TIMEOUT"] = int(os.getenv("DB_POOL_TIMEOUT", 30))
+    app.config["DB_POOL_RECYCLE"] = int(os.getenv("DB_POOL_RECYCLE", 1800))
+    app.config["DB_POOL_PRE_PING"] = os.getenv("DB_POOL_PRE_PING", "1") != "0"
+    app.config["SQLITE_JOURNAL_MODE"] = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+    app.config["SQLITE_SYNCHRONOUS"] = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+    app.config["SQLITE_BUSY_TIMEOUT"] = int(os.getenv("SQLITE_BUSY_TIMEOUT", 5000))  # ms
+
+    # Mail
+    app.config["MAIL_SERVER"] = "smtp.gmail.com"
+    app.config["MAIL_PORT"] = 587
+    app.config["MAIL_USE_TLS"] = True
+    app.config["MAIL_USERNAME"] = os.getenv("MAIL_USER")
+    app.config["MAIL_PASSWORD"] = os.getenv("MAIL_PASS")
+    app.config["MAIL_DEFAULT_SENDER"] = os.getenv("MAIL_TO", app.config["MAIL_USERNAME"])
+    # Hash de senhas (senhas.PoolSenhas): custo no formato do Werkzeug, hashes simultâneos e espera por vaga
+    app.config["SENHA_METODO"] = os.getenv("SENHA_METODO", "scrypt:32768:8:1")
+    app.config["SENHA_WORKERS"] = int(os.getenv("SENHA_WORKERS", 0)) or None  # None = nº de CPUs
+    app.config["SENHA_ESPERA"] = float(os.getenv("SENHA_ESPERA", 10))
+
+    # Envio em segundo plano (correio.FilaEmails); MAIL_ASYNC=0 volta ao envio dentro da requisição
+    app.config["MAIL_ASYNC"] = os.getenv("MAIL_ASYNC", "1") != "0"
+    app.config["MAIL_TENTATIVAS"] = int(os.getenv("MAIL_TENTATIVAS", 5))
+    app.config["MAIL_BACKOFF"] = float(os.getenv("MAIL_BACKOFF", 2.0))
+    app.config["MAIL_OCIOSO"] = float(os.getenv("MAIL_OCIOSO", 30))
+
+    # Fila de jobs da IA (turnos / introdução de personagem)
+    # TURNO_MODO: "stream" (padrão: a narração chega aos poucos por SSE na própria requisição),
+    # "fila" (enfileira e o dashboard acompanha o job; a narração aparece inteira no fim)
+    # ou "rodada" (junta as ações de todos os jogadores numa narração só; ver registrar_acao_rodada).
+    # Sem JavaScript o formulário vai para /enviar_turno, que sempre usa a fila.
+    os.makedirs(app.instance_path, exist_ok=True)
+    app.config["FILA_DB_PATH"] = os.getenv("FILA_DB_PATH", os.path.join(app.instance_path, "fila_jobs.sqlite3"))
+    app.config["FILA_WORKERS"] = int(os.getenv("FILA_WORKERS", 4))
+    # Por quanto tempo o resultado de um job fica disponível (e a chave de idempotência vale)
+    app.config["FILA_RETENCAO"] = int(os.getenv("FILA_RETENCAO", 3600))
+    app.config["TURNO_MODO"] = os.getenv("TURNO_MODO", "stream")
+    # Modo rodada: segundos desde a primeira ação até narrar mesmo sem todos terem jogado
+    app.config["RODADA_ESPERA"] = float(os.getenv("RODADA_ESPERA", 90))
+
+    # Ao vivo (aovivo.py): mensagens novas chegam ao dashboard de todos os participantes por SSE.
+    # Cada conexão aberta prende uma thread/greenlet: só ligue com `gunicorn -k gevent` (ou gthread).
+    # PING: comentário de keep-alive; DURACAO: a conexão é encerrada e o navegador reconecta.
+    app.config["AOVIVO"] = os.getenv("AOVIVO", "0") == "1"
+    app.config["AOVIVO_DB_PATH"] = os.getenv("AOVIVO_DB_PATH", os.path.join(app.instance_path, "aovivo.sqlite3"))
+    app.config["AOVIVO_INTERVALO"] = float(os.getenv("AOVIVO_INTERVALO", 0.5))
+    app.config["AOVIVO_PING"] = float(os.getenv("AOVIVO_PING", 20))
+    app.config["AOVIVO_DURACAO"] = float(os.getenv("AOVIVO_DURACAO", 300))
+    app.config["AOVIVO_MAX_CONEXOES"] = int(os.getenv("AOVIVO_MAX_CONEXOES", 2000))
+
+    # Arquivo frio (arquivo.py): `flask arquivar` move turnos com mais de ARQUIVO_DIAS dias
+    # (ou de aventuras concluídas) para ARQUIVO_DIR/<aventura_id>/*.jsonl.gz
+    app.config["ARQUIVO_DIR"] = os.getenv("ARQUIVO_DIR", os.path.join(app.instance_path, "arquivo"))
+    app.config["ARQUIVO_DIAS"] = int(os.getenv("ARQUIVO_DIAS", 180))
+
+    # Caches em memória (cache.py), por processo: máximo de entradas e TTL em segundos
+    app.config["CACHE_USUARIOS_MAX"] = int(os.getenv("CACHE_USUARIOS_MAX", 2048))
+    app.config["CACHE_USUARIOS_TTL"] = int(os.getenv("CACHE_USUARIOS_TTL", 60))
+    app.config["CACHE_DASHBOARD_MAX"] = int(os.getenv("CACHE_DASHBOARD_MAX", 1024))
+    app.config["CACHE_DASHBOARD_TTL"] = int(os.getenv("CACHE_DASHBOARD_TTL", 300))
+    # Invalidações do cache de usuários entre workers (ver load_user): um usuário
+    # desativado/alterado em outro worker perde o cache aqui em até VERIFICAR segundos
+    app.config["CACHE_USUARIOS_VERIFICAR"] = float(os.getenv("CACHE_USUARIOS_VERIFICAR", 1.0))
+    app.config["CACHE_USUARIOS_DB_PATH"] = os.getenv(
+        "CACHE_USUARIOS_DB_PATH", os.path.join(app.instance_path, "cache_usuarios.sqlite3"))
+
+    # Histórico: mensagens por página no dashboard (as mais antigas carregam sob demanda)
+    app.config["HISTORICO_PAGINA"] = int(os.getenv("HISTORICO_PAGINA", 50))
+
+    # Resumo incremental: a cada RESUMO_A_CADA sessões, resumo_atual é refeito em até RESUMO_MAX_TOKENS
+    app.config["RESUMO_A_CADA"] = int(os.getenv("RESUMO_A_CADA", 5))
+    app.config["RESUMO_MAX_TOKENS"] = int(os.getenv("RESUMO_MAX_TOKENS", 400))
+
+    # Métricas (Prometheus em /metrics), somadas entre workers num SQLite compartilhado;
+    # com METRICAS_TOKEN, o scrape precisa de "Authorization: Bearer <token>"
+    app.config["METRICAS_DB_PATH"] = os.getenv("METRICAS_DB_PATH", os.path.join(app.instance_path, "metricas.sqlite3"))
+    app.config["METRICAS_INTERVALO"] = float(os.getenv("METRICAS_INTERVALO", 5))
+    app.config["METRICAS_TOKEN"] = os.getenv("METRICAS_TOKEN")
+
+    # Orçamento de consultas SQL por rota (consultas.py): "desligado", "log" ou "erro".
+    # Em "erro" a requisição que passar do orçamento ou repetir SQL (N+1) falha — para dev/CI.
+    app.config["CONSULTAS_MODO"] = os.getenv("CONSULTAS_MODO", "desligado")
+    app.config["CONSULTAS_REPETICOES"] = int(os.getenv("CONSULTAS_REPETICOES", 3))
+    app.config["CONSULTAS_ORCAMENTOS"] = {
+        "rpg.dashboard": 8,
+        "rpg.lista_aventuras": 3,
+        "rpg.enviar_turno": 14,  # vale também para o modo rodada
+        "rpg.enviar_turno_stream": 14,  # no modo rodada repassa para enviar_turno
+        "rpg.enviar_turno_stream:sse": 12,  # a parte que roda durante o stream
+        "rpg.criar_personagem": 8,
+        "rpg.historico": 4,
+    }
 
+    # Narrador (narrador.py): backend "openai" ou "local" (determinístico, sem rede), timeout por
+    # chamada, chamadas simultâneas por processo, repetições e disjuntor (falhas seguidas / pausa em s)
+    app.config["NARRADOR_BACKEND"] = os.getenv("NARRADOR_BACKEND", "openai")
+    app.config["NARRADOR_MODELO"] = os.getenv("NARRADOR_MODELO", "gpt-4o-mini")
+    app.config["NARRADOR_TIMEOUT"] = float(os.getenv("NARRADOR_TIMEOUT", 60))
+    app.config["NARRADOR_CONCORRENCIA"] = int(os.getenv("NARRADOR_CONCORRENCIA", 8))
+    app.config["NARRADOR_ESPERA"] = float(os.getenv("NARRADOR_ESPERA", 10))
+    app.config["NARRADOR_TENTATIVAS"] = int(os.getenv("NARRADOR_TENTATIVAS", 3))
+    app.config["NARRADOR_BACKOFF"] = float(os.getenv("NARRADOR_BACKOFF", 1.0))
+    app.config["NARRADOR_FALHAS"] = int(os.getenv("NARRADOR_FALHAS", 5))
+    app.config["NARRADOR_PAUSA"] = float(os.getenv("NARRADOR_PAUSA", 30))
+    # API compatível com a da OpenAI (None = api.openai.com); aponte para
+    # benchmarks/fake_openai.py para testes de carga sem gastar tokens
+    app.config["OPENAI_BASE_URL"] = os.getenv("OPENAI_BASE_URL") or None
+
+    # Orçamento de tokens do prompt (None = padrão do modelo em prompts.ORCAMENTOS)
+    app.config["PROMPT_MAX_TOKENS"] = int(os.getenv("PROMPT_MAX_TOKENS", 0)) or None
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
 # Token serializer for password reset
-serializer = URLSafeTimedSerializer(app.config["SECRET_KEY"])
+def serializador():
+    return URLSafeTimedSerializer(current_app.config["SECRET_KEY"])
 
 # -------------------------
 # Extensions
 # -------------------------
-db.init_app(app)
-login_manager = LoginManager(app)
-login_manager.login = "home"
-login_manager.login_view = "home"  
+# db, login_manager, mail e migrate guardam o estado na própria app. As nossas
+# (fila, métricas, narrador, caches...) têm threads, conexões e dados em memória:
+# create_app() (no fim do arquivo) cria uma instância de cada por app em
+# app.extensions, e os nomes abaixo apontam para a da app atual.
+login_manager = LoginManager()
+login_manager.login = "rpg.home"
+login_manager.login_view = "rpg.home"  
 login_manager.login_message = "Você precisa estar logado para acessar essa página."
 login_manager.login_message_category = "warning"
 
-mail = Mail(app)
+mail = Mail()
+
+# Esquema versionado em migrations/ (Alembic): aplicar com `flask db upgrade`
+migrate = Migrate()
+
+
+def extensao(nome):
+    return LocalProxy(lambda: current_app.extensions[nome])
+
+
+fila_emails = extensao("fila_emails")
+pool_senhas = extensao("senhas")
+fila = extensao("fila")
+metricas = extensao("metricas")
+narrador = extensao("narrador")
+aovivo = extensao("aovivo")
+arquivo = extensao("arquivo")
+
+bp = Blueprint("rpg", __name__, cli_group=None)
 
-with app.app_context():
-    db.create_all()
-    
 # -------------------------
 # Login manager
 # -------------------------
+# Cache de identidade: evita o SELECT do usuário em toda requisição autenticada.
+# Guarda uma cópia desanexada das colunas e a reanexa à sessão com merge(load=False),
+# que não emite SQL. Escritas em Usuario (senha, desativação...) invalidam a entrada
+# neste processo na hora e, após o commit, nos outros workers em até
+# CACHE_USUARIOS_VERIFICAR segundos (invalidações publicadas em CACHE_USUARIOS_DB_PATH,
+# SQLite compartilhado, lido no máximo uma vez por intervalo).
+cache_usuarios = extensao("cache_usuarios")
+invalidacoes_usuarios = extensao("invalidacoes_usuarios")
+
+
 @login_manager.user_loader
 def load_user(user_id):
-    return Usuario.query.get(int(user_id))
+    user_id = int(user_id)
+    try:
+        invalidacoes_usuarios.aplicar()
+        copia = cache_usuarios.obter(user_id)
+    except sqlite3.Error:
+        # sem como saber se o usuário foi revogado em outro worker: vai ao banco
+        current_app.logger.exception("Erro lendo invalidações do cache de usuários")
+        copia = None
+    if copia is not None:
+        return db.session.merge(copia, load=False)
+
+    user = db.session.get(Usuario, user_id)
+    if user is not None:
+        copia = Usuario(**{c.key: getattr(user, c.key) for c in Usuario.__mapper__.column_attrs})
+        make_transient_to_detached(copia)
+        cache_usuarios.guardar(user_id, copia)
+    return user
+
+
+@event.listens_for(Usuario, "after_update")
+@event.listens_for(Usuario, "after_delete")
+def invalidar_cache_usuario(mapper, connection, target):
+    cache_usuarios.invalidar(target.id)
+    sessao = object_session(target)
+    if sessao is not None:
+        sessao.info.setdefault("usuarios_alterados", set()).add(target.id)
+
+
+@event.listens_for(db.session, "after_commit")
+def publicar_usuarios_alterados(sessao):
+    # só depois do commit: antes, outro worker poderia recarregar a linha antiga e guardá-la
+    for usuario_id in sessao.info.pop("usuarios_alterados", ()):
+        try:
+            invalidacoes_usuarios.publicar(usuario_id)
+        except sqlite3.Error:
+            current_app.logger.exception("Erro publicando invalidação do usuário %s", usuario_id)
+
+
+@event.listens_for(db.session, "after_rollback")
+def descartar_usuarios_alterados(sessao):
+    sessao.info.pop("usuarios_alterados", None)
+
 
 
 
@@ -79,6 +272,15 @@ def validate_password_rules(pw):
     return errors
 
 
+# Hash de senha fora do model: custo e limite de concorrência vêm do pool_senhas (senhas.py)
+def definir_senha(usuario, senha):
+    usuario.password_hash = pool_senhas.gerar(senha)
+
+
+def senha_confere(usuario, senha):
+    return pool_senhas.verificar(usuario.password_hash, senha)
+
+
 # -------------------------
 # Functions
 # -------------------------
@@ -92,10 +294,47 @@ def safe_json(data):
     except Exception:
         return {}
 
+def pagina_historico(aventura_id, cursor, limite):
+    """Página de HistoricoMensagens anterior ao cursor (keyset por criado_em, id).
+
+    Devolve (mensagens em ordem cronológica, cursor da próxima página ou None).
+    O cursor é "criado_em|id" da mensagem mais antiga já exibida. Quando as
+    linhas quentes acabam, a página continua no arquivo frio (arquivo.py).
+    """
+    query = HistoricoMensagens.query.filter(HistoricoMensagens.aventura_id == aventura_id)
+    if cursor:
+        criado_em, msg_id = cursor
+        query = query.filter(
+            (HistoricoMensagens.criado_em < criado_em) |
+            ((HistoricoMensagens.criado_em == criado_em) & (HistoricoMensagens.id < msg_id))
+        )
+    linhas = (
+        query.order_by(HistoricoMensagens.criado_em.desc(), HistoricoMensagens.id.desc())
+        .limit(limite + 1)
+        .all()
+    )
+    if len(linhas) <= limite:
+        antes = (linhas[-1].criado_em, linhas[-1].id) if linhas else cursor
+        linhas += arquivo.mensagens_antes(aventura_id, antes, limite + 1 - len(linhas))
+    tem_mais = len(linhas) > limite
+    linhas = linhas[:limite]
+    linhas.reverse()
+    proximo = f"{linhas[0].criado_em.isoformat()}|{linhas[0].id}" if tem_mais else None
+    return linhas, proximo
+
+
+def ler_cursor_historico(valor):
+    try:
+        criado_em, msg_id = valor.rsplit("|", 1)
+        return datetime.fromisoformat(criado_em), int(msg_id)
+    except (AttributeError, ValueError):
+        return None
+
+
 def send_password_reset_email(user):
     # Gera token de redefinição de senha
-    token = serializer.dumps(user.email, salt="password-reset-salt")
-    reset_url = url_for("password_reset_confirm", token=token, _external=True)
+    token = serializador().dumps(user.email, salt="password-reset-salt")
+    reset_url = url_for("rpg.password_reset_confirm", token=token, _external=True)
 
     # Cria mensagem de e-mail
     msg = Message(
@@ -110,14 +349,35 @@ def send_password_reset_email(user):
         reset_url=reset_url
     )
     
-    # Envia e-mail
-    mail.send(msg)
+    # Envia e-mail (enfileirado: a requisição não espera o SMTP)
+    if current_app.config["MAIL_ASYNC"]:
+        fila_emails.enviar(msg)
+    else:
+        mail.send(msg)
 
 # -------------------------
 # Routes
 # -------------------------
 
-@app.route("/", methods=["GET", "POST"])
+@bp.app_errorhandler(SenhasOcupadas)
+def senhas_ocupadas(e):
+    resposta = make_response("Servidor ocupado, tente novamente em instantes.", 503)
+    resposta.headers["Retry-After"] = "5"
+    return resposta
+
+
+@bp.app_errorhandler(NarradorIndisponivel)
+def narrador_indisponivel(e):
+    if request.headers.get("X-Requested-With") == "XMLHttpRequest" or request.is_json:
+        resposta = jsonify({"status": "error", "error": str(e)})
+        resposta.status_code = 503
+        resposta.headers["Retry-After"] = str(e.tentar_em)
+        return resposta
+    flash(str(e), "warning")
+    return redirect(url_for("rpg.dashboard"))
+
+
+@bp.route("/", methods=["GET", "POST"])
 def home():
     login_form = LoginForm()
     signup_form = SignupForm()
@@ -128,13 +388,17 @@ def home():
     # -------------------------
     if login_form.validate_on_submit() and login_form.submit.data:
         user = Usuario.query.filter_by(username=login_form.username.data).first()
-        if user and user.check_password(login_form.password.data):
+        if user and senha_confere(user, login_form.password.data):
+            # custo de hash mudou (SENHA_METODO): regrava com o atual, já que temos a senha em claro
+            if pool_senhas.desatualizado(user.password_hash):
+                definir_senha(user, login_form.password.data)
+                db.session.commit()
             login_user(user)
             flash(f"Bem-vindo, {user.username}!", "success")
-            next_url = request.args.get("next") or url_for("lista_aventuras")
+            next_url = request.args.get("next") or url_for("rpg.lista_aventuras")
             return redirect(next_url)
         flash("Usuário ou senha incorretos.", "danger")
-        return redirect(url_for("home"))
+        return redirect(url_for("rpg.home"))
 
     # Obs: signup_form e forgot_form não são tratados aqui.
     return render_template(
@@ -145,7 +409,7 @@ def home():
     )
 
 
-@app.route("/signup", methods=["POST"])
+@bp.route("/signup", methods=["POST"])
 def signup():
     form = SignupForm()
     if form.validate_on_submit():
@@ -159,24 +423,24 @@ def signup():
 
         if existente:
             flash("Usuário ou e-mail já cadastrado!", "danger")
-            return redirect(url_for("home"))
+            return redirect(url_for("rpg.home"))
         else:
             novo = Usuario(username=username, email=email)
-            novo.set_password(password)
+            definir_senha(novo, password)
             db.session.add(novo)
             db.session.commit()
             login_user(novo)
             flash("Cadastro realizado com sucesso!", "success")
-            return redirect(url_for("lista_aventuras"))
+            return redirect(url_for("rpg.lista_aventuras"))
 
     flash("Erro ao processar cadastro.", "danger")
-    return redirect(url_for("home"))
+    return redirect(url_for("rpg.home"))
 
 
 # -------------------------
 # Rota de recuperação
 # -------------------------
-@app.route("/forgot-password/", methods=["POST"])
+@bp.route("/forgot-password/", methods=["POST"])
 def forgot_password():
     form = ForgotPasswordForm()
     if form.validate_on_submit():
@@ -192,61 +456,82 @@ def forgot_password():
     else:
         flash("Formulário inválido.", "danger")
     
-    return redirect(url_for("home"))
+    return redirect(url_for("rpg.home"))
 
-@app.route("/logout/")
+@bp.route("/logout/")
 @login_required
 def logout():
     logout_user()
     flash("Você saiu da conta.", "info")
-    return redirect(url_for("home"))
+    return redirect(url_for("rpg.home"))
     
 
-@app.route("/dashboard")
-@login_required
-def dashboard():
-    aventura_id = session.get("aventura_id")
+# Cache do dashboard: dados (não o HTML, que leva CSRF e chave de idempotência)
+# por (aventura, usuário, versão). Aventura.versao é incrementada em toda escrita
+# que aparece no dashboard, então entradas antigas simplesmente deixam de ser lidas,
+# inclusive nos outros workers.
+cache_dashboard = extensao("cache_dashboard")
 
-    if not aventura_id:
-        flash("Nenhuma aventura ativa. Entre em uma aventura primeiro.", "warning")
-        return redirect(url_for("lista_aventuras"))
 
-    participacao = Participacao.query.filter_by(
-        usuario_id=current_user.id,
-        aventura_id=aventura_id
-    ).first()
+def tocar_aventura(aventura_id):
+    """Incrementa a versão da aventura (invalida cache/ETag do dashboard). Vale no commit."""
+    db.session.execute(
+        db.update(Aventura).where(Aventura.id == aventura_id).values(versao=Aventura.versao + 1)
+    )
+    cache_dashboard.invalidar_se(lambda chave: chave[0] == aventura_id)
+
+
+def tocar_aventuras_do_personagem(personagem_id):
+    """Incrementa a versão de todas as aventuras em que o personagem participa."""
+    tocar_aventuras_dos_personagens([personagem_id])
+
+
+def tocar_aventuras_dos_personagens(personagem_ids):
+    """Como tocar_aventuras_do_personagem, para vários personagens num único UPDATE."""
+    if not personagem_ids:
+        return
+    ids = {
+        aid for (aid,) in db.session.execute(
+            db.update(Aventura)
+            .where(Aventura.id.in_(
+                db.select(Participacao.aventura_id).where(Participacao.personagem_id.in_(personagem_ids))
+            ))
+            .values(versao=Aventura.versao + 1)
+            .returning(Aventura.id)
+            .execution_options(synchronize_session=False)
+        )
+    }
+    cache_dashboard.invalidar_se(lambda chave: chave[0] in ids)
+
+
+def copiar(obj, *campos):
+    return SimpleNamespace(**{c: getattr(obj, c) for c in campos}) if obj is not None else None
 
-    if not participacao:
-        flash("Você não participa desta aventura.", "warning")
-        return redirect(url_for("lista_aventuras"))
+
+CAMPOS_PERSONAGEM = ("id", "nome", "classe", "raca", "descricao", "atributos", "inventario", "xp", "nivel", "ativo_na_sessao")
+
+
+def dados_dashboard(aventura_id, usuario_id, personagem_id):
+    """Consulta tudo que o dashboard exibe e devolve cópias simples (seguras para o cache)."""
+    aventura = db.session.get(Aventura, aventura_id)
 
     # Personagem atual (caso já tenha um)
     personagem = None
-    if participacao.personagem_id:
+    if personagem_id:
         personagem = Personagem.query.filter_by(
-            id=participacao.personagem_id,
-            usuario_id=current_user.id
+            id=personagem_id,
+            usuario_id=usuario_id
         ).first()
 
-    # Aventura e dados relacionados
-    aventura = participacao.aventura
-
-    mensagens = (
-        HistoricoMensagens.query
-        .filter_by(aventura_id=aventura.id)
-        .order_by(HistoricoMensagens.criado_em.asc())
-        .all()
-    )
+    # Só a página mais recente; as anteriores vêm de /historico ao rolar para cima
+    mensagens, cursor_antes = pagina_historico(aventura.id, None, current_app.config["HISTORICO_PAGINA"])
 
     ultima_sessao = (
         Sessao.query
         .filter_by(aventura_id=aventura.id)
         .order_by(Sessao.criado_em.desc())
         .first()
-    )
-
-    turno_form = TurnoForm()
-    personagem_form = PersonagemForm()
+    ) or arquivo.ultima_sessao(aventura.id)
 
     # Todos os personagens do usuário nesta aventura
     personagens = (
@@ -254,13 +539,11 @@ def dashboard():
         .join(Participacao)
         .filter(
             Participacao.aventura_id == aventura.id,
-            Personagem.usuario_id == current_user.id
+            Personagem.usuario_id == usuario_id
         )
         .all()
     )
 
-
-
     # Garante que a aventura tenha regras válidas (evita erro se for None)
     regras = aventura.regras if hasattr(aventura, "regras") and aventura.regras else {
         "erro_critico": 5,
@@ -269,23 +552,106 @@ def dashboard():
         "acerto_critico": 100
     }
 
-    return render_template(
-        "dashboard.html",
-        personagem=personagem,
-        personagens=personagens,
-        aventura=aventura,
-        regras=regras,  # passa regras explícitas também
-        mensagens=mensagens,
-        ultima_sessao=ultima_sessao,
-        form=turno_form,
-        personagem_form=personagem_form
+    return {
+        "personagem": copiar(personagem, *CAMPOS_PERSONAGEM),
+        "personagens": [copiar(p, *CAMPOS_PERSONAGEM) for p in personagens],
+        "aventura": copiar(aventura, "id", "titulo", "cenario", "status", "resumo_atual", "regras"),
+        "regras": regras,  # passa regras explícitas também
+        "mensagens": [copiar(m, "id", "autor", "mensagem", "criado_em") for m in mensagens],
+        "cursor_antes": cursor_antes,
+        "ultima_sessao": copiar(ultima_sessao, "criado_em"),
+    }
+
+
+def etag_dashboard(aventura_id, usuario_id, versao):
+    # O token CSRF da página depende da sessão e expira (WTF_CSRF_TIME_LIMIT, 1h):
+    # a janela de 30 min garante que uma página revalidada com 304 ainda tem token válido.
+    janela = int(time.time() // 1800)
+    base = f"{aventura_id}:{usuario_id}:{versao}:{session.get('csrf_token', '')}:{janela}:{current_app.config['TURNO_MODO']}"
+    return hashlib.sha1(base.encode("utf-8")).hexdigest()
+
+
+@bp.route("/dashboard")
+@login_required
+def dashboard():
+    aventura_id = session.get("aventura_id")
+
+    if not aventura_id:
+        flash("Nenhuma aventura ativa. Entre em uma aventura primeiro.", "warning")
+        return redirect(url_for("rpg.lista_aventuras"))
+
+    # Participação + versão da aventura numa consulta só
+    participacao = (
+        db.session.query(Participacao.personagem_id, Aventura.versao)
+        .join(Aventura, Participacao.aventura_id == Aventura.id)
+        .filter(Participacao.usuario_id == current_user.id, Participacao.aventura_id == aventura_id)
+        .first()
     )
 
+    if not participacao:
+        flash("Você não participa desta aventura.", "warning")
+        return redirect(url_for("rpg.lista_aventuras"))
+
+    personagem_id, versao = participacao
+
+    # Nada mudou desde a última visita deste navegador: 304
+    # (exceto se houver flash ou job pendentes, que precisam aparecer na página)
+    etag = etag_dashboard(aventura_id, current_user.id, versao)
+    revalidavel = not session.get("_flashes") and not session.get("job_pendente")
+    if revalidavel and etag in request.if_none_match:
+        resposta = make_response("", 304)
+        resposta.set_etag(etag)
+        return resposta
+
+    chave = (aventura_id, current_user.id, versao)
+    dados = cache_dashboard.obter(chave)
+    if dados is None:
+        dados = dados_dashboard(aventura_id, current_user.id, personagem_id)
+        cache_dashboard.guardar(chave, dados)
+
+    resposta = make_response(render_template(
+        "dashboard.html",
+        **dados,
+        form=TurnoForm(),
+        personagem_form=PersonagemForm(),
+        job_pendente=session.pop("job_pendente", None),
+        idempotency_key=uuid.uuid4().hex,
+        eventos_url=url_for("rpg.eventos_aventura", pk=aventura_id) if current_app.config["AOVIVO"] else None
+    ))
+    if revalidavel:
+        # recalculado: a primeira renderização pode ter criado o token CSRF da sessão
+        resposta.set_etag(etag_dashboard(aventura_id, current_user.id, versao))
+    resposta.headers["Cache-Control"] = "private, no-cache"
+    return resposta
+
+
+@bp.route("/historico")
+@login_required
+def historico():
+    """Páginas anteriores do histórico (JSON), carregadas ao rolar o dashboard para cima."""
+    aventura_id = session.get("aventura_id")
+    participacao = Participacao.query.filter_by(
+        usuario_id=current_user.id,
+        aventura_id=aventura_id
+    ).first() if aventura_id else None
+
+    if not participacao:
+        return jsonify({"status": "error", "error": "Você não participa desta aventura."}), 403
 
+    cursor = ler_cursor_historico(request.args.get("antes"))
+    if cursor is None:
+        return jsonify({"status": "error", "error": "Cursor inválido."}), 400
 
+    limite = min(request.args.get("limite", current_app.config["HISTORICO_PAGINA"], type=int), 200)
+    mensagens, proximo = pagina_historico(aventura_id, cursor, max(limite, 1))
+    return jsonify({
+        "status": "ok",
+        "mensagens": [mensagem_json(m) for m in mensagens],
+        "antes": proximo
+    })
 
 
-@app.route("/acao/", methods=["POST"])
+@bp.route("/acao/", methods=["POST"])
 @login_required
 def acao_jogador():
     acao = request.form.get("acao")
@@ -300,22 +666,22 @@ def acao_jogador():
     turno += 1
     session["narrativa"] = narrativa
     session["turno"] = turno
-    return redirect(url_for("dashboard"))
+    return redirect(url_for("rpg.dashboard"))
 
 # Aventuras CRUD
-@app.route("/aventuras/")
+@bp.route("/aventuras/")
 @login_required
 def lista_aventuras():
     aventuras = (
         Aventura.query
-        .filter_by(criador=current_user)
+        .filter_by(criador_id=current_user.id)
         .order_by(Aventura.criada_em.desc())
         .all()
     )
     return render_template("aventuras.html", aventuras=aventuras)
 
 
-@app.route("/aventuras/nova/", methods=["GET", "POST"])
+@bp.route("/aventuras/nova/", methods=["GET", "POST"])
 @login_required
 def nova_aventura():
     form = AventuraForm()
@@ -347,12 +713,12 @@ def nova_aventura():
         db.session.commit()
 
         flash("Aventura criada com sucesso.", "success")
-        return redirect(url_for("lista_aventuras"))
+        return redirect(url_for("rpg.lista_aventuras"))
 
     return render_template("nova_aventura.html", form=form)
 
 
-@app.route("/aventuras/<int:pk>/editar/", methods=["GET", "POST"])
+@bp.route("/aventuras/<int:pk>/editar/", methods=["GET", "POST"])
 @login_required
 def editar_aventura(pk):
     aventura = Aventura.query.get_or_404(pk)
@@ -379,14 +745,32 @@ def editar_aventura(pk):
             "acerto_critico_min": 100  # fixo, não editável
         }
 
+        tocar_aventura(aventura.id)
         db.session.commit()
         flash("Aventura atualizada com sucesso.", "success")
-        return redirect(url_for("lista_aventuras"))
+        return redirect(url_for("rpg.lista_aventuras"))
 
     return render_template("nova_aventura.html", form=form, editando=True)
 
 
-@app.route("/aventuras/<int:pk>/entrar/")
+@bp.route("/aventuras/regras/probabilidades")
+@login_required
+def probabilidades_regras():
+    """Tabela de probabilidades (atributos 1..99) para os limites informados; usada ao vivo no formulário."""
+    try:
+        limites_regras = validar_limites(
+            request.args.get(chave, padrao) for chave, padrao in REGRAS_PADRAO.items()
+        )
+    except ValueError as e:
+        return jsonify({"erro": str(e)}), 400
+
+    resposta = jsonify(distribuicao(limites_regras))
+    # depende só dos limites (determinístico): o navegador pode reaproveitar
+    resposta.headers["Cache-Control"] = "private, max-age=86400"
+    return resposta
+
+
+@bp.route("/aventuras/<int:pk>/entrar/")
 @login_required
 def entrar_aventura(pk):
     aventura = Aventura.query.get_or_404(pk)
@@ -408,10 +792,10 @@ def entrar_aventura(pk):
 
     session["aventura_id"] = aventura.id
     flash(f"Entrou na aventura: {aventura.titulo}", "success")
-    return redirect(url_for("dashboard"))
+    return redirect(url_for("rpg.dashboard"))
 
 
-@app.route("/aventuras/<int:pk>/excluir/", methods=["GET", "POST"])
+@bp.route("/aventuras/<int:pk>/excluir/", methods=["GET", "POST"])
 @login_required
 def excluir_aventura(pk):
     aventura = Aventura.query.get_or_404(pk)
@@ -421,21 +805,22 @@ def excluir_aventura(pk):
     if request.method == "POST":
         db.session.delete(aventura)
         db.session.commit()
+        arquivo.remover(pk)
         flash("Aventura excluída com sucesso.", "success")
-        return redirect(url_for("lista_aventuras"))
+        return redirect(url_for("rpg.lista_aventuras"))
 
     return render_template("confirma_exclusao.html", aventura=aventura)
 
 
 
 
-@app.route("/reset/<token>/", methods=["GET", "POST"])
+@bp.route("/reset/<token>/", methods=["GET", "POST"])
 def password_reset_confirm(token):
     try:
-        email = serializer.loads(token, salt="password-reset-salt", max_age=3600)
+        email = serializador().loads(token, salt="password-reset-salt", max_age=3600)
     except Exception:
         flash("Token inválido ou expirado.", "danger")
-        return redirect(url_for("home"))
+        return redirect(url_for("rpg.home"))
 
     user = Usuario.query.filter_by(email=email).first_or_404()
     form = SetPasswordForm()
@@ -445,9 +830,9 @@ def password_reset_confirm(token):
         if errors:
             for e in errors:
                 flash(e, "danger")
-            return redirect(url_for("password_reset_confirm", token=token))
+            return redirect(url_for("rpg.password_reset_confirm", token=token))
 
-        user.set_password(form.new_password1.data)
+        definir_senha(user, form.new_password1.data)
         db.session.commit()
         flash("Senha redefinida com sucesso.", "success")
         return render_template("password_reset_complete.html")
@@ -455,64 +840,47 @@ def password_reset_confirm(token):
     return render_template("password_reset_confirm.html", form=form)
 
 
-@app.route("/sobre/")
+@bp.route("/admin/cache")
+@login_required
+def estatisticas_cache():
+    if not (current_user.is_staff or current_user.is_superuser):
+        abort(403)
+    return jsonify({
+        "usuarios": cache_usuarios.estatisticas(),
+        "dashboard": cache_dashboard.estatisticas()
+    })
+
+
+@bp.route("/sobre/")
 def sobre():
     return render_template("sobre.html")
 
-@app.route("/contato/")
+@bp.route("/contato/")
 def contato():
     return render_template("contato.html")
 
-@app.route("/servicos/")
+@bp.route("/servicos/")
 def servicos():
     return render_template("servicos.html")
 
 
 
-'''
-@app.route("/db_reset")
-def db_reset():
-    try:
-        # Lista das tabelas do seu models.py com prefixo core_
-        tabelas = [
-            "core_historicomensagens",
-            "core_participacao",
-            "core_sessao",
-            "core_aventura",
-            "core_item",
-            "core_personagem",
-            "core_usuario"
-        ]
-
-        # Derruba apenas essas tabelas
-        for tabela in tabelas:
-            db.session.execute(text(f'DROP TABLE IF EXISTS {tabela} CASCADE'))
-
-        db.session.commit()
-
-        # Recria de acordo com os models atuais
-        db.create_all()
-
-        return jsonify({"status": "ok", "msg": "Tabelas core_* resetadas com sucesso!"})
-
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({"status": "erro", "msg": str(e)})
-'''
 
 
 import json
 from flask import current_app
 
-@app.route('/enviar_turno', methods=['POST'])
-@login_required
-def enviar_turno():
-    form = TurnoForm()
+# -------------------------
+# Turno: etapas compartilhadas
+# -------------------------
+SYSTEM_PROMPT_TURNO = "Você é um mestre de RPG, narrando a aventura para os jogadores de forma concisa e interessante."
 
-    # detecta se a chamada é AJAX (fetch/XHR) ou JSON
-    is_ajax = request.headers.get("X-Requested-With") == "XMLHttpRequest" or request.is_json
 
-    # --- 1) Ler rolagens (suporta vários formatos) ---
+def ler_rolagens():
+    """Lê os pedidos de rolagem enviados pelo cliente (suporta vários formatos).
+
+    Só personagem e tipo são usados: valor e resultado vêm de resolver_rolagens.
+    """
     rolagens = []
     try:
         # se cliente enviou JSON no body (ex: fetch(..., body: JSON.stringify({...})))
@@ -552,194 +920,944 @@ def enviar_turno():
                         current_app.logger.debug("rolagens: não foi possível parsear campo 'rolagens'")
     except Exception as e:
         current_app.logger.exception("Erro lendo rolagens: %s", e)
+    return rolagens
 
-    # --- 2) Validar formulário (CSRF etc) ---
-    if not form.validate_on_submit():
-        # fallback: se não for AJAX, redireciona para dashboard para evitar mostrar JSON cru
-        if not is_ajax:
-            flash("Erro no envio do formulário.", "danger")
-            return redirect(url_for("dashboard"))
-        return jsonify({"status": "error", "error": "Erro no envio do formulário."})
 
-    # --- 3) verificar aventura / participação ---
-    aventura_id = session.get("aventura_id")
-    if not aventura_id:
-        if not is_ajax: 
-            flash("Nenhuma aventura ativa.", "warning")
-            return redirect(url_for("lista_aventuras"))
-        return jsonify({"status": "error", "error": "Nenhuma aventura ativa."})
+def resolver_rolagens(aventura, pedidos):
+    """Rola no servidor, em lote, os pedidos da rodada para personagens desta aventura."""
+    normalizados = [
+        {"personagem_id": r.get("personagem_id") or r.get("personagem"), "tipo": r.get("tipo")}
+        for r in pedidos if isinstance(r, dict)
+    ]
+    ids = {int(r["personagem_id"]) for r in normalizados if str(r["personagem_id"] or "").isdigit()}
+    personagens = {
+        p.id: p for p in
+        Personagem.query.join(Participacao)
+        .filter(Participacao.aventura_id == aventura.id, Personagem.id.in_(ids))
+        .all()
+    } if ids else {}
+    return resolver_rodada(normalizados, personagens, aventura.regras)
 
-    participacao = Participacao.query.filter_by(usuario_id=current_user.id, aventura_id=aventura_id).first()
-    if not participacao:
-        if not is_ajax:
-            flash("Você não está participando desta aventura.", "warning")
-            return redirect(url_for("lista_aventuras"))
-        return jsonify({"status": "error", "error": "Você não está participando desta aventura."})
 
-    aventura = participacao.aventura
-    personagem = participacao.personagem
+def atualizar_personagens_ativos(aventura_id):
+    """Aplica os checkboxes 'personagem_<id>' do formulário em ativo_na_sessao.
 
-    # --- 4) Atualizar checkboxes de personagens ativos ---
+    O UPDATE só alcança os personagens do usuário nesta aventura cujo valor muda
+    (em geral nenhum): as linhas dos outros jogadores não são escritas nem travadas.
+    Devolve os personagens ativos da aventura (linhas simples) para o prompt.
+    """
+    marcados = {
+        int(chave.split("_", 1)[1]) for chave in request.form
+        if chave.startswith("personagem_") and chave.split("_", 1)[1].isdigit()
+    }
+    nesta_aventura = db.select(Participacao.personagem_id).where(Participacao.aventura_id == aventura_id)
+    novo_valor = Personagem.id.in_(marcados) if marcados else db.false()
     try:
-        personagens_usuario = Personagem.query.filter_by(usuario_id=current_user.id).all()
-        for p in personagens_usuario:
-            marcado = f"personagem_{p.id}" in request.form
-            if p.ativo_na_sessao != marcado:
-                p.ativo_na_sessao = marcado
-                db.session.add(p)
+        alterados = db.session.execute(
+            db.update(Personagem)
+            .where(
+                Personagem.id.in_(nesta_aventura),
+                Personagem.usuario_id == current_user.id,
+                Personagem.ativo_na_sessao.is_distinct_from(novo_valor),
+            )
+            .values(ativo_na_sessao=novo_valor)
+            .returning(Personagem.id)
+            .execution_options(synchronize_session=False)
+        ).scalars().all()
+        if alterados:
+            # o checkbox aparece no dashboard de toda aventura em que o personagem está
+            tocar_aventuras_dos_personagens(alterados)
         db.session.commit()
     except Exception:
         db.session.rollback()
         current_app.logger.exception("Erro atualizando ativo_na_sessao")
 
-    # --- 5) Personagens ativos na aventura (construir prompt) ---
-    personagens_ativos = (
-        Personagem.query.join(Participacao)
-        .filter(Participacao.aventura_id == aventura.id, Personagem.ativo_na_sessao == True)
-        .all()
-    )
+    # linhas simples (não instâncias): o commit não as expira
+    return db.session.execute(
+        db.select(Personagem.id, Personagem.nome, Personagem.classe, Personagem.descricao, Personagem.atributos)
+        .where(Personagem.id.in_(nesta_aventura), Personagem.ativo_na_sessao == True)
+    ).all()
 
-    prompt_parts = []
-    if aventura.resumo_atual:
-        prompt_parts.append(f"Resumo da aventura até agora:\n{aventura.resumo_atual}")
-    if aventura.ultimo_turno:
-        prompt_parts.append(f"Último turno:\n{aventura.ultimo_turno.get('texto', '')}")
-    if form.contexto.data:
-        prompt_parts.append(f"Importante! Considere a seguinte instrução adicional do jogador:\n{form.contexto.data}")
 
-    prompt_parts.append(f"Ação de {personagem.nome}:\n{form.acao.data}")
+def montar_prompt(aventura, personagens_ativos, contexto, acao, rolagens):
+    """Prompt (PromptMontado) dentro do orçamento de tokens do modelo, com as seções comuns a turno e rodada.
 
-   # anexar rolagens textualmente, se houver
-    if rolagens:
-        try:
-            rolagens_texto = []
-    
-            # opcional: criar mapa se quiser resolver IDs em lote
-            ids = [int(r["personagem"]) for r in rolagens if r.get("personagem") and str(r.get("personagem")).isdigit()]
-            personagens_map = {
-                p.id: p.nome for p in Personagem.query.filter(Personagem.id.in_(ids)).all()
-            } if ids else {}
-
-            print("ROLAGENS RECEBIDAS:", rolagens)
-            
-            for r in rolagens:
-                pid = r.get("personagem_nome") or r.get("p")
-                nome_personagem = (
-                    personagens_map.get(int(pid)) if pid and str(pid).isdigit()
-                    else r.get("personagem_nome") or f"Personagem {pid}"
-                )
-                valor = r.get("valor", r.get("v", "?"))
-                tipo = r.get("tipo", r.get("atributo", ""))
-                resultado = r.get("resultado", r.get("texto", r.get("resultado_texto", "")))
-    
-                # ✅ Aqui trocamos o PID pelo nome
-                rolagens_texto.append(f"- {nome_personagem} | {tipo} => {valor} ({resultado})")
+    Resumo, último turno e ficha dos personagens ativos vêm da aventura; contexto e
+    acao são (titulo, texto) de quem chama e rolagens, linhas de dados.descrever.
+    """
+    builder = PromptBuilder(narrador.modelo, current_app.config["PROMPT_MAX_TOKENS"])
+    builder.adicionar("resumo", aventura.resumo_atual, PRIORIDADE_MEDIA,
+                      titulo="Resumo da aventura até agora:")
+    if aventura.ultimo_turno:
+        builder.adicionar("ultimo_turno", aventura.ultimo_turno.get('texto', ''), PRIORIDADE_ALTA,
+                          titulo="Último turno:")
+    builder.adicionar("contexto", contexto[1], PRIORIDADE_ALTA, titulo=contexto[0], manter="inicio")
+    builder.adicionar("acao", acao[1], PRIORIDADE_ESSENCIAL, titulo=acao[0])
 
-            prompt_parts.append("Rolagens de dados nesta rodada:\n" + "\n".join(rolagens_texto))
-    
-        except Exception:
-            current_app.logger.exception("Erro formatando rolagens para prompt")
+    # rolagens já resolvidas no servidor (dados.resolver_rodada)
+    builder.adicionar("rolagens", "\n".join(rolagens), PRIORIDADE_ALTA,
+                      titulo="Rolagens de dados nesta rodada:", manter="inicio")
 
     if personagens_ativos:
         detalhes_personagens = []
         for p in personagens_ativos:
             atributos_str = ", ".join([f"{k}: {v}" for k, v in (p.atributos or {}).items()])
             detalhes_personagens.append(f"- {p.nome} ({p.classe}, {atributos_str}) - {p.descricao}")
-        prompt_parts.append("Personagens ativos na cena:\n" + "\n".join(detalhes_personagens))
+        builder.adicionar("personagens", "\n".join(detalhes_personagens), PRIORIDADE_BAIXA,
+                          titulo="Personagens ativos na cena:", manter="inicio")
 
-    prompt_final = "\n\n".join(prompt_parts)
+    return builder.montar()
 
-    print(f"PROMPT FINAL ENVIADO À IA:\n{prompt_final}")
-    
-    # --- 6) Chamada IA (mantive seu bloco) ---
+
+def montar_prompt_turno(aventura, personagem, form, rodada, personagens_ativos):
+    """Prompt do turno de um jogador."""
+    return montar_prompt(
+        aventura, personagens_ativos,
+        contexto=("Importante! Considere a seguinte instrução adicional do jogador:", form.contexto.data),
+        acao=(f"Ação de {personagem.nome}:", form.acao.data),
+        rolagens=descrever(rodada or {}),
+    )
+
+
+def gravar_turno(aventura, usuario_id, autor, acao, prompt_final, resultado_turno, resposta_bruta, rodada=None):
+    """Grava Sessao + HistoricoMensagens do turno e atualiza ultimo_turno."""
+    tem_rolagens = bool(rodada and rodada.get("itens"))
+    nova_sessao = Sessao(
+        aventura_id=aventura.id,
+        narrador_ia=resultado_turno,
+        acoes_jogadores=[acao],
+        rolagens=rodada if tem_rolagens else None,
+        resultado=resultado_turno,
+        prompt_usado=prompt_final,
+        resposta_bruta=resposta_bruta
+    )
+    db.session.add(nova_sessao)
+
+    # as rolagens aparecem junto da ação do jogador no histórico
+    mensagem = acao
+    if tem_rolagens:
+        mensagem += "\n\n🎲 Rolagens:\n" + "\n".join(descrever(rodada))
+
+    mensagem_jogador = HistoricoMensagens(
+        usuario_id=usuario_id,
+        aventura_id=aventura.id,
+        mensagem=mensagem,
+        autor=autor
+    )
+    db.session.add(mensagem_jogador)
+
+    mensagem_mestre = HistoricoMensagens(
+        usuario_id=None,
+        aventura_id=aventura.id,
+        mensagem=resultado_turno,
+        autor="Mestre IA"
+    )
+    db.session.add(mensagem_mestre)
+
+    aventura.ultimo_turno = {"texto": resultado_turno}
+    tocar_aventura(aventura.id)
+    db.session.commit()
+    return mensagem_jogador, mensagem_mestre
+
+
+# -------------------------
+# Modo rodada
+# -------------------------
+# As ações ficam em AcaoRodada até todos os jogadores com personagem agirem
+# (ou RODADA_ESPERA segundos desde a primeira ação); então um único job
+# "rodada" narra todas juntas. Todos os jogadores acompanham o mesmo job.
+# Os jobs de uma aventura têm o mesmo grupo na fila, então rodam um de cada
+# vez e cada narração parte do ultimo_turno gravado pela anterior.
+
+def grupo_aventura(aventura_id):
+    return f"aventura:{aventura_id}"
+
+
+def participa_da_rodada(job):
+    """Job de rodada: qualquer participante da aventura pode acompanhar."""
+    if job["tipo"] != "rodada" or not (job["grupo"] or "").startswith("aventura:"):
+        return False
+    aventura_id = int(job["grupo"].split(":", 1)[1])
+    return Participacao.query.filter_by(usuario_id=current_user.id, aventura_id=aventura_id).first() is not None
+
+
+def registrar_acao_rodada(aventura, personagem, form, rodada, chave, apos_id):
+    """Guarda a ação do jogador na rodada aberta (abrindo uma, com o job dela, se preciso).
+
+    tocar_aventura é a primeira escrita da transação: segura a aventura (lock da
+    linha no Postgres, do banco no SQLite) até o commit, então duas ações ao
+    mesmo tempo não abrem duas rodadas e o job não fecha a rodada no meio.
+    Reenvio com a mesma chave devolve a rodada da ação já registrada: enquanto
+    ela não é narrada, pela própria AcaoRodada; depois, pela entrada
+    "rodada_acao" da fila (chave do jogador -> job da rodada), que sobrevive à
+    AcaoRodada apagada em gravar_rodada.
+    Uma segunda ação do mesmo jogador na rodada aberta substitui a primeira, e
+    isso é avisado (substituida=True) para o jogador não perder a ação de vista.
+    Devolve (job_id, ações, jogadores, substituida).
+    """
+    if chave:
+        ja_enviada = AcaoRodada.query.filter_by(aventura_id=aventura.id, usuario_id=current_user.id,
+                                                chave=chave).first()
+        job_id = ja_enviada and ja_enviada.rodada and fila.buscar_por_chave(None, f"rodada:{ja_enviada.rodada}")
+        if job_id:
+            abertas = AcaoRodada.query.filter_by(aventura_id=aventura.id, rodada=ja_enviada.rodada).count()
+            return job_id, abertas, contar_jogadores(aventura.id), False
+
+    campos = {
+        "personagem_id": personagem.id,
+        "autor": personagem.nome,
+        "acao": form.acao.data,
+        "contexto": form.contexto.data,
+        "rolagens": rodada if rodada and rodada.get("itens") else None,
+        "apos_id": apos_id,
+        "chave": chave,
+    }
+
+    tocar_aventura(aventura.id)
+    abertas = AcaoRodada.query.filter_by(aventura_id=aventura.id, fechada=False).all()
+    rodada_id = next((a.rodada for a in abertas if a.rodada), None) or uuid.uuid4().hex
+
+    acao = next((a for a in abertas if a.usuario_id == current_user.id), None)
+    substituida = False
+    if acao is None:
+        acao = AcaoRodada(aventura_id=aventura.id, usuario_id=current_user.id, **campos)
+        db.session.add(acao)
+        abertas.append(acao)
+    else:
+        substituida = not (chave and acao.chave == chave)
+        for campo, valor in campos.items():
+            setattr(acao, campo, valor)
+    for a in abertas:
+        a.rodada = rodada_id  # inclui sobras de uma rodada cuja narração falhou
+
+    jogadores = contar_jogadores(aventura.id)
+
+    chave_job = f"rodada:{rodada_id}"
+    job_id = fila.buscar_por_chave(None, chave_job) or fila.enfileirar(
+        "rodada", {"aventura_id": aventura.id, "rodada": rodada_id}, chave=chave_job,
+        grupo=grupo_aventura(aventura.id), atraso=current_app.config["RODADA_ESPERA"])
+    db.session.commit()
+
+    if chave:
+        ref_id, novo = fila.registrar_externo("rodada_acao", {"aventura_id": aventura.id}, current_user.id, chave)
+        if novo:
+            fila.finalizar(ref_id, resultado={"job_id": job_id})
+    if len(abertas) >= jogadores:
+        fila.antecipar(job_id)
+    return job_id, len(abertas), jogadores, substituida
+
+
+def job_da_chave(job_id):
+    """Job que um reenvio deve acompanhar: no modo rodada, a chave aponta para o job da rodada."""
+    job = fila.status(job_id)
+    if job and job["tipo"] == "rodada_acao" and job["resultado"]:
+        return job["resultado"]["job_id"]
+    return job_id
+
+
+def contar_jogadores(aventura_id):
+    """Participantes com personagem (os que a rodada espera)."""
+    return db.session.query(db.func.count(db.distinct(Participacao.usuario_id))).filter(
+        Participacao.aventura_id == aventura_id, Participacao.personagem_id.isnot(None)
+    ).scalar()
+
+
+def montar_prompt_rodada(aventura, acoes, personagens_ativos):
+    """Prompt de uma rodada com as ações de vários jogadores."""
+    return montar_prompt(
+        aventura, personagens_ativos,
+        contexto=("Importante! Considere as seguintes instruções adicionais dos jogadores:",
+                  "\n".join(f"- {a.autor}: {a.contexto}" for a in acoes if a.contexto)),
+        acao=("Ações dos jogadores nesta rodada (narre todas numa cena só):",
+              "\n".join(f"- {a.autor}: {a.acao}" for a in acoes)),
+        rolagens=[linha for a in acoes for linha in descrever(a.rolagens or {})],
+    )
+
+
+def gravar_rodada(aventura, acoes, prompt_final, resultado, resposta_bruta):
+    """Grava a rodada (uma Sessao, a ação de cada jogador e a narração) e apaga as AcaoRodada.
+
+    Devolve a primeira mensagem gravada.
+    """
+    com_rolagens = [a.rolagens for a in acoes if a.rolagens]
+    db.session.add(Sessao(
+        aventura_id=aventura.id,
+        narrador_ia=resultado,
+        acoes_jogadores=[f"{a.autor}: {a.acao}" for a in acoes],
+        # um registro (semente + itens) por jogador; "itens" junta todos para leitura
+        rolagens={"itens": [i for r in com_rolagens for i in r["itens"]], "registros": com_rolagens}
+        if com_rolagens else None,
+        resultado=resultado,
+        prompt_usado=prompt_final,
+        resposta_bruta=resposta_bruta
+    ))
+
+    mensagens = []
+    for a in acoes:
+        texto = a.acao
+        if a.rolagens:
+            texto += "\n\n🎲 Rolagens:\n" + "\n".join(descrever(a.rolagens))
+        mensagens.append(HistoricoMensagens(usuario_id=a.usuario_id, aventura_id=aventura.id,
+                                            mensagem=texto, autor=a.autor))
+    mensagens.append(HistoricoMensagens(usuario_id=None, aventura_id=aventura.id,
+                                        mensagem=resultado, autor="Mestre IA"))
+    db.session.add_all(mensagens)
+    for a in acoes:
+        db.session.delete(a)
+
+    aventura.ultimo_turno = {"texto": resultado}
+    tocar_aventura(aventura.id)
+    db.session.commit()
+    return mensagens[0]
+
+
+def personagens_em_cena(aventura_id):
+    return [
+        copiar(p, "id", "nome", "classe", "descricao", "atributos")
+        for p in Personagem.query.join(Participacao)
+        .filter(Participacao.aventura_id == aventura_id, Personagem.ativo_na_sessao == True)
+    ]
+
+
+def ler_cursor(valor):
+    """Converte o cursor 'apos_id' enviado pelo cliente (id da última mensagem exibida)."""
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "Você é um mestre de RPG, narrando a aventura para os jogadores de forma concisa e interessante."},
-                {"role": "user", "content": prompt_final}
-            ],
-            temperature=0.8,
-            max_tokens=800
-        )
-        resultado_turno = response.choices[0].message.content.strip()
-    except Exception as e:
-        current_app.logger.exception("Erro OpenAI: %s", e)
-        if not is_ajax:
-            flash("Erro ao processar o turno (IA).", "danger")
-            return redirect(url_for("dashboard"))
-        return jsonify({"status": "error", "error": f"Erro ao processar o turno: {e}"})
+        return int(valor) if valor not in (None, "") else None
+    except (TypeError, ValueError):
+        return None
+
+
+def serializar_mensagens(aventura, apos_id):
+    """Mensagens da aventura com id > apos_id (o cliente só anexa as novas)."""
+    mensagens = HistoricoMensagens.query.filter(
+        HistoricoMensagens.aventura_id == aventura.id,
+        HistoricoMensagens.id > apos_id
+    ).order_by(HistoricoMensagens.id.asc()).all()
+    return [mensagem_json(m) for m in mensagens]
+
+
+def mensagem_json(m):
+    return {"id": m.id, "autor": m.autor, "mensagem": m.mensagem, "criado_em": m.criado_em.strftime("%d/%m %H:%M")}
+
+
+def aovivo_da_app():
+    if has_app_context() and current_app.config["AOVIVO"]:
+        return current_app.extensions["aovivo"]
+    return None
+
+
+# Mensagens gravadas em qualquer lugar (rota, job) vão para o aovivo da app que commitou
+conectar_sessao(db.session, HistoricoMensagens, mensagem_json, aovivo_da_app)
+
+
+def resposta_turno(aventura, apos_id, primeira_nova):
+    """Payload final do turno: só as mensagens depois do cursor e o novo cursor.
+
+    Sem cursor do cliente, devolve apenas as mensagens gravadas neste turno.
+    """
+    if apos_id is None:
+        apos_id = primeira_nova.id - 1
+    mensagens = serializar_mensagens(aventura, apos_id)
+    cursor = mensagens[-1]["id"] if mensagens else apos_id
+    return {"status": "ok", "mensagens": mensagens, "cursor": cursor}
+
+
+def chamar_ia(mensagens, temperatura=0.8, max_tokens=800):
+    """narrador.completar (sem stream) medindo tempo e tokens; devolve narrador.Resposta."""
+    try:
+        with metricas.fase("llm"):
+            resposta = narrador.completar(mensagens, temperatura, max_tokens)
+    except NarradorIndisponivel:
+        metricas.registrar_llm("recusado")
+        raise
+    except Exception:
+        metricas.registrar_llm("erro")
+        raise
+    metricas.registrar_llm("ok", resposta.prompt_tokens, resposta.completion_tokens)
+    return resposta
+
+
+def narrar_em_partes(system_prompt, prompt):
+    """Chama a IA em modo stream; gera (delta, chunk) conforme os tokens chegam.
+
+    Só o tempo esperando a IA conta como fase "llm" (não o de quem consome os deltas).
+    """
+    status, prompt_tokens, completion_tokens = "erro", 0, 0
+    stream = narrador.stream([
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": prompt}
+    ])
+    try:
+        while True:
+            with metricas.fase("llm"):
+                trecho = next(stream, None)
+            if trecho is None:
+                break
+            prompt_tokens = trecho.prompt_tokens or prompt_tokens
+            completion_tokens = trecho.completion_tokens or completion_tokens
+            yield trecho.texto, trecho.bruto
+        status = "ok"
+    except NarradorIndisponivel:
+        status = "recusado"
+        raise
+    finally:
+        stream.close()
+        metricas.registrar_llm(status, prompt_tokens, completion_tokens)
+
+
+# -------------------------
+# Jobs da fila
+# -------------------------
+INTERVALO_PARCIAL = 0.25  # segundos entre gravações do texto parcial do job
+
+# Handlers dos jobs por tipo: (função, rota nas métricas ou None). create_app()
+# registra todos na FilaJobs de cada app (fila.registrar + metricas.instrumentado).
+TAREFAS = {}
+
+
+def tarefa(tipo, medida=None):
+    def decorator(func):
+        TAREFAS[tipo] = (func, medida)
+        return func
+    return decorator
+
+
+@tarefa("turno", medida="job:turno")
+def job_turno(payload, progresso):
+    partes = []
+    ultimo_chunk = None
+    ultima_gravacao = 0.0
+    for delta, chunk in narrar_em_partes(SYSTEM_PROMPT_TURNO, payload["prompt"]):
+        ultimo_chunk = chunk
+        if delta:
+            partes.append(delta)
+            if time.monotonic() - ultima_gravacao > INTERVALO_PARCIAL:
+                progresso("".join(partes))
+                ultima_gravacao = time.monotonic()
+    resultado_turno = "".join(partes).strip()
+
+    aventura = db.session.get(Aventura, payload["aventura_id"])
+    try:
+        mensagem_jogador, _ = gravar_turno(aventura, payload["usuario_id"], payload["autor"], payload["acao"],
+                                           payload["prompt"], resultado_turno, str(ultimo_chunk),
+                                           rodada=payload.get("rolagens"))
+    except Exception:
+        db.session.rollback()
+        raise
+
+    agendar_resumo(aventura)
+    return resposta_turno(aventura, payload.get("apos_id"), mensagem_jogador)
+
 
-    # --- 7) Gravar sessão e histórico (igual ao seu fluxo) ---
+@tarefa("rodada_acao")
+def job_rodada_acao(payload, progresso):
+    """Referência chave -> job da rodada (registrar_acao_rodada); nasce concluída e nunca executa."""
+    raise RuntimeError("Referência de rodada sem job.")
+
+
+@tarefa("turno_stream")
+def job_turno_stream(payload, progresso):
+    """Turno narrado em stream (fila.registrar_externo): só chega aqui se o processo morreu no meio."""
+    raise RuntimeError("O stream do turno foi interrompido.")
+
+
+@tarefa("introducao", medida="job:introducao")
+def job_introducao(payload, progresso):
+    response = chamar_ia([
+        {"role": "system", "content": "Você é um mestre de RPG narrando a aventura."},
+        {"role": "user", "content": payload["prompt"]}
+    ])
+    narrativa_inicial = response.texto.strip()
+
+    aventura = db.session.get(Aventura, payload["aventura_id"])
     try:
         nova_sessao = Sessao(
             aventura_id=aventura.id,
-            narrador_ia=resultado_turno,
-            acoes_jogadores=[form.acao.data],
-            resultado=resultado_turno,
-            prompt_usado=prompt_final,
+            narrador_ia=narrativa_inicial,
+            resultado=narrativa_inicial,
+            acoes_jogadores=[],
+            prompt_usado=payload["prompt"],
             resposta_bruta=str(response)
         )
         db.session.add(nova_sessao)
 
-        mensagem_jogador = HistoricoMensagens(
-            usuario_id=current_user.id,
-            aventura_id=aventura.id,
-            mensagem=form.acao.data,
-            autor=personagem.nome
-        )
-        db.session.add(mensagem_jogador)
-
         mensagem_mestre = HistoricoMensagens(
             usuario_id=None,
             aventura_id=aventura.id,
-            mensagem=resultado_turno,
+            mensagem=narrativa_inicial,
             autor="Mestre IA"
         )
         db.session.add(mensagem_mestre)
 
-        aventura.ultimo_turno = {"texto": resultado_turno}
+        aventura.ultimo_turno = {"texto": narrativa_inicial}
+        tocar_aventura(aventura.id)
         db.session.commit()
     except Exception:
         db.session.rollback()
-        current_app.logger.exception("Erro gravando sessão/histórico")
-        if not is_ajax:
-            flash("Erro ao salvar o turno.", "danger")
-            return redirect(url_for("dashboard"))
-        return jsonify({"status": "error", "error": "Erro ao salvar o turno."})
-
-    # --- 8) Preparar resposta ---
-    mensagens = HistoricoMensagens.query.filter_by(aventura_id=aventura.id)\
-        .order_by(HistoricoMensagens.criado_em.asc()).all()
-    mensagens_serializadas = [
-        {"autor": m.autor, "mensagem": m.mensagem, "criado_em": m.criado_em.strftime("%d/%m %H:%M")}
-        for m in mensagens
+        raise
+
+    agendar_resumo(aventura)
+    return resposta_turno(aventura, None, mensagem_mestre)
+
+
+@tarefa("rodada", medida="job:rodada")
+def job_rodada(payload, progresso):
+    aventura_id = payload["aventura_id"]
+
+    # fecha a rodada (sob o lock da aventura): ações que chegarem agora vão para a próxima;
+    # sobras de uma rodada que falhou (rodada None) entram nesta
+    tocar_aventura(aventura_id)
+    ids = [
+        acao_id for (acao_id,) in db.session.execute(
+            db.update(AcaoRodada)
+            .where(
+                AcaoRodada.aventura_id == aventura_id,
+                AcaoRodada.fechada == False,
+                db.or_(AcaoRodada.rodada == payload["rodada"], AcaoRodada.rodada.is_(None)),
+            )
+            .values(fechada=True)
+            .returning(AcaoRodada.id)
+            .execution_options(synchronize_session=False)
+        )
     ]
+    db.session.commit()
+    acoes = AcaoRodada.query.filter(AcaoRodada.id.in_(ids)).order_by(AcaoRodada.criado_em, AcaoRodada.id).all()
+    if not acoes:
+        return {"status": "ok", "mensagens": [], "cursor": None}
+
+    aventura = db.session.get(Aventura, aventura_id)
+    cursores = [a.apos_id for a in acoes if a.apos_id is not None]
+    partes = []
+    ultimo_chunk = None
+    ultima_gravacao = 0.0
+    try:
+        prompt = montar_prompt_rodada(aventura, acoes, personagens_em_cena(aventura_id))
+        current_app.logger.info("Prompt da rodada (%s ações): %s tokens %s", len(acoes), prompt.total_tokens,
+                                prompt.tamanhos())
+        for delta, chunk in narrar_em_partes(SYSTEM_PROMPT_TURNO, prompt.texto):
+            ultimo_chunk = chunk
+            if delta:
+                partes.append(delta)
+                if time.monotonic() - ultima_gravacao > INTERVALO_PARCIAL:
+                    progresso("".join(partes))
+                    ultima_gravacao = time.monotonic()
+    except Exception:
+        # devolve as ações para a rodada aberta: entram na próxima rodada que for narrada
+        db.session.rollback()
+        db.session.execute(
+            db.update(AcaoRodada).where(AcaoRodada.id.in_(ids)).values(fechada=False, rodada=None)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        raise
+
+    try:
+        primeira = gravar_rodada(aventura, acoes, prompt.texto, "".join(partes).strip(), str(ultimo_chunk))
+    except Exception:
+        db.session.rollback()
+        raise
+
+    agendar_resumo(aventura)
+    return resposta_turno(aventura, min(cursores) if cursores else None, primeira)
+
+
+def agendar_resumo(aventura):
+    """Enfileira o job de resumo quando há sessões suficientes fora de resumo_atual.
+
+    A chave (aventura + cursor do resumo) faz os turnos seguintes reaproveitarem o
+    job já enfileirado em vez de criar outro; o grupo da aventura impede dois
+    resumos (ou um resumo e uma rodada) da mesma aventura rodando juntos.
+    """
+    try:
+        if precisa_resumir(aventura, current_app.config["RESUMO_A_CADA"]):
+            fila.enfileirar("resumo", {"aventura_id": aventura.id},
+                            chave=f"resumo:{aventura.id}:{cursor_resumo(aventura)}",
+                            grupo=grupo_aventura(aventura.id))
+    except Exception:
+        current_app.logger.exception("Erro agendando resumo da aventura %s", aventura.id)
+
+
+@tarefa("resumo", medida="job:resumo")
+def job_resumo(payload, progresso):
+    aventura = db.session.get(Aventura, payload["aventura_id"])
+    a_cada = current_app.config["RESUMO_A_CADA"]
+    max_tokens = current_app.config["RESUMO_MAX_TOKENS"]
+
+    # Outro job pode ter resumido estas sessões enquanto este esperava na fila
+    sessoes = sessoes_nao_resumidas(aventura, 3 * a_cada)
+    if len(sessoes) < a_cada:
+        return {"status": "ok", "resumidas": 0}
 
+    response = chamar_ia([
+        {"role": "system", "content": SYSTEM_PROMPT_RESUMO},
+        {"role": "user", "content": montar_prompt_resumo(aventura.resumo_atual, sessoes, max_tokens)}
+    ], temperatura=0.3, max_tokens=max_tokens)
+    try:
+        aplicar_resumo(aventura, response.texto.strip(), sessoes[-1].id)
+        tocar_aventura(aventura.id)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    return {"status": "ok", "resumidas": len(sessoes)}
+
+
+@bp.route("/jobs/<job_id>")
+@login_required
+def status_job(job_id):
+    job = fila.status(job_id)
+    if not job or (job["usuario_id"] != current_user.id and not participa_da_rodada(job)):
+        return jsonify({"status": "error", "error": "Job não encontrado."}), 404
+    return jsonify({
+        "job_id": job["id"],
+        "status": job["status"],
+        "parcial": job["parcial"],
+        "resultado": job["resultado"],
+        "error": job["erro"]
+    })
+
+
+@bp.route('/enviar_turno', methods=['POST'])
+@login_required
+def enviar_turno():
+    form = TurnoForm()
+
+    # detecta se a chamada é AJAX (fetch/XHR) ou JSON
+    is_ajax = request.headers.get("X-Requested-With") == "XMLHttpRequest" or request.is_json
+
+    # --- 1) Ler rolagens (suporta vários formatos) ---
+    rolagens = ler_rolagens()
+
+    # --- 2) Validar formulário (CSRF etc) ---
+    if not form.validate_on_submit():
+        # fallback: se não for AJAX, redireciona para dashboard para evitar mostrar JSON cru
+        if not is_ajax:
+            flash("Erro no envio do formulário.", "danger")
+            return redirect(url_for("rpg.dashboard"))
+        return jsonify({"status": "error", "error": "Erro no envio do formulário."})
+
+    # --- 2b) Idempotência: reenvio (duplo clique, retry do fetch) reaproveita o job ---
+    chave = ler_chave_idempotencia()
+    job_id = fila.buscar_por_chave(current_user.id, chave)
+    if job_id:
+        return resposta_job_turno(job_da_chave(job_id), chave, is_ajax, reaproveitado=True)
+
+    # --- 2c) Mestre IA fora do ar (disjuntor aberto): recusa já, sem enfileirar ---
+    narrador.verificar()
+
+    # --- 3) verificar aventura / participação ---
+    aventura_id = session.get("aventura_id")
+    if not aventura_id:
+        if not is_ajax: 
+            flash("Nenhuma aventura ativa.", "warning")
+            return redirect(url_for("rpg.lista_aventuras"))
+        return jsonify({"status": "error", "error": "Nenhuma aventura ativa."})
+
+    participacao = Participacao.query.filter_by(usuario_id=current_user.id, aventura_id=aventura_id).first()
+    if not participacao:
+        if not is_ajax:
+            flash("Você não está participando desta aventura.", "warning")
+            return redirect(url_for("rpg.lista_aventuras"))
+        return jsonify({"status": "error", "error": "Você não está participando desta aventura."})
+
+    aventura = participacao.aventura
+    personagem = participacao.personagem
+
+    # --- 4) Atualizar checkboxes de personagens ativos ---
+    personagens_ativos = atualizar_personagens_ativos(aventura.id)
+
+    # --- 4b) Rolagens resolvidas no servidor (o valor enviado pelo cliente é ignorado) ---
+    rodada = resolver_rolagens(aventura, rolagens)
+
+    # --- 4c) Modo rodada: guarda a ação; um job só narra as ações de todos ---
+    if current_app.config["TURNO_MODO"] == "rodada":
+        job_id, acoes, jogadores, substituida = registrar_acao_rodada(
+            aventura, personagem, form, rodada, chave, ler_cursor(request.form.get("apos_id")))
+        return resposta_job_turno(job_id, chave, is_ajax,
+                                  rodada={"acoes": acoes, "jogadores": jogadores, "substituida": substituida})
+
+    # --- 5) Personagens ativos na aventura (construir prompt) ---
+    prompt = montar_prompt_turno(aventura, personagem, form, rodada, personagens_ativos)
+    prompt_final = prompt.texto
+
+    current_app.logger.info("Prompt do turno: %s tokens %s", prompt.total_tokens, prompt.tamanhos())
+    
+    # --- 6) Enfileirar chamada IA: o worker grava sessão e histórico ao terminar ---
+    try:
+        job_id = fila.enfileirar("turno", {
+            "aventura_id": aventura.id,
+            "usuario_id": current_user.id,
+            "autor": personagem.nome,
+            "acao": form.acao.data,
+            "prompt": prompt_final,
+            "rolagens": rodada,
+            "apos_id": ler_cursor(request.form.get("apos_id"))
+        }, usuario_id=current_user.id, chave=chave)
+    except Exception as e:
+        current_app.logger.exception("Erro enfileirando turno: %s", e)
+        if not is_ajax:
+            flash("Erro ao processar o turno.", "danger")
+            return redirect(url_for("rpg.dashboard"))
+        return jsonify({"status": "error", "error": f"Erro ao processar o turno: {e}"})
+
+    # --- 7) Responder com o id do job ---
+    return resposta_job_turno(job_id, chave, is_ajax, prompt_tokens=prompt.tamanhos())
+
+
+def ler_chave_idempotencia():
+    """Chave de idempotência do envio (header Idempotency-Key ou campo idempotency_key)."""
+    chave = request.headers.get("Idempotency-Key") or request.form.get("idempotency_key") or ""
+    chave = chave.strip()[:100]
+    return chave or None
+
+
+def resposta_job_turno(job_id, chave, is_ajax, reaproveitado=False, prompt_tokens=None, rodada=None):
     if not is_ajax:
-        # se o envio foi normal (sem JS), redireciona para dashboard (evita mostrar JSON cru)
-        flash("Turno enviado.", "success")
-        return redirect(url_for("dashboard"))
+        # sem JS: o dashboard acompanha o job pendente e recarrega ao concluir
+        session["job_pendente"] = job_id
+        if rodada:
+            if rodada["substituida"]:
+                flash("Você já tinha agido nesta rodada: a ação anterior foi substituída por esta.", "warning")
+            flash(f"Ação registrada ({rodada['acoes']}/{rodada['jogadores']} jogadores). "
+                  "O Mestre IA narra quando todos jogarem.", "success")
+        elif not reaproveitado:
+            flash("Turno enviado. O Mestre IA está narrando...", "success")
+        return redirect(url_for("rpg.dashboard"))
+
+    corpo = {
+        "status": "pendente",
+        "job_id": job_id,
+        "status_url": url_for("rpg.status_job", job_id=job_id),
+        "idempotency_key": chave,
+        "reaproveitado": reaproveitado
+    }
+    if prompt_tokens is not None:
+        corpo["prompt_tokens"] = prompt_tokens
+    if rodada is not None:
+        corpo["rodada"] = rodada
+    resposta = jsonify(corpo)
+    if chave:
+        resposta.headers["Idempotency-Key"] = chave
+    return resposta, 202
+
 
-    return jsonify({"status": "ok", "mensagens": mensagens_serializadas})
+def resposta_turno_repetido(job_id, chave):
+    """Reenvio de um turno em stream: o resultado já gravado, ou o job para acompanhar."""
+    job_id = job_da_chave(job_id)
+    job = fila.status(job_id)
+    if job and job["status"] == "concluido" and job["resultado"]:
+        return jsonify({**job["resultado"], "reaproveitado": True})
+    return resposta_job_turno(job_id, chave, True, reaproveitado=True)
 
 
+def sse(evento, dados):
+    """Formata um evento Server-Sent Events."""
+    return f"event: {evento}\ndata: {json.dumps(dados, ensure_ascii=False)}\n\n"
 
 
+@bp.route('/enviar_turno/stream', methods=['POST'])
+@login_required
+def enviar_turno_stream():
+    """Mesmo fluxo de enviar_turno, mas repassa a narração token a token via SSE.
+
+    Eventos: 'delta' ({"texto"}), 'fim' ({"status", "mensagens", "cursor"}) e 'erro' ({"error"}).
+    Sessao/HistoricoMensagens só são gravados quando o stream termina.
+
+    Idempotência: o turno fica registrado na fila como job externo com a chave do
+    envio; um reenvio recebe o resultado (JSON) ou, se o primeiro ainda estiver
+    narrando, o job para acompanhar, como no modo fila.
+
+    No modo rodada não há narração individual: o envio segue para enviar_turno
+    (a ação entra na rodada) e o cliente acompanha o job da rodada.
+    """
+    if current_app.config["TURNO_MODO"] == "rodada":
+        return enviar_turno()
+
+    form = TurnoForm()
+    rolagens = ler_rolagens()
+
+    if not form.validate_on_submit():
+        return jsonify({"status": "error", "error": "Erro no envio do formulário."})
+
+    chave = ler_chave_idempotencia()
+    job_id = fila.buscar_por_chave(current_user.id, chave)
+    if job_id:
+        return resposta_turno_repetido(job_id, chave)
+
+    narrador.verificar()
+
+    aventura_id = session.get("aventura_id")
+    if not aventura_id:
+        return jsonify({"status": "error", "error": "Nenhuma aventura ativa."})
+
+    participacao = Participacao.query.filter_by(usuario_id=current_user.id, aventura_id=aventura_id).first()
+    if not participacao:
+        return jsonify({"status": "error", "error": "Você não está participando desta aventura."})
+
+    aventura = participacao.aventura
+    personagem = participacao.personagem
+
+    personagens_ativos = atualizar_personagens_ativos(aventura.id)
+    rodada = resolver_rolagens(aventura, rolagens)
+    prompt = montar_prompt_turno(aventura, personagem, form, rodada, personagens_ativos)
+    prompt_final = prompt.texto
+    current_app.logger.info("Prompt do turno: %s tokens %s", prompt.total_tokens, prompt.tamanhos())
+
+    # O gerador roda depois que a view retorna: guarda só valores simples
+    usuario_id = current_user.id
+    autor = personagem.nome
+    acao = form.acao.data
+    apos_id = ler_cursor(request.form.get("apos_id"))
+
+    # reserva a chave antes de narrar: um reenvio concorrente não abre outra narração
+    job_id, novo = fila.registrar_externo("turno_stream", {"aventura_id": aventura_id}, usuario_id, chave)
+    if not novo:
+        return resposta_turno_repetido(job_id, chave)
+
+    finalizado = []
+    jobs = current_app.extensions["fila"]  # ao_fechar pode rodar já fora do contexto da app
+
+    def finalizar(**kwargs):
+        jobs.finalizar(job_id, **kwargs)
+        finalizado.append(True)
+
+    def gerar():
+        partes = []
+        ultimo_chunk = None
+        try:
+            for delta, chunk in narrar_em_partes(SYSTEM_PROMPT_TURNO, prompt_final):
+                ultimo_chunk = chunk
+                if delta:
+                    partes.append(delta)
+                    yield sse("delta", {"texto": delta})
+        except Exception as e:
+            current_app.logger.exception("Erro do narrador (stream): %s", e)
+            finalizar(erro=str(e))
+            yield sse("erro", {"error": f"Erro ao processar o turno: {e}"})
+            return
+
+        resultado_turno = "".join(partes).strip()
+        aventura_atual = db.session.get(Aventura, aventura_id)
+        try:
+            mensagem_jogador, _ = gravar_turno(aventura_atual, usuario_id, autor, acao, prompt_final,
+                                               resultado_turno, str(ultimo_chunk), rodada=rodada)
+        except Exception:
+            db.session.rollback()
+            current_app.logger.exception("Erro gravando sessão/histórico")
+            finalizar(erro="Erro ao salvar o turno.")
+            yield sse("erro", {"error": "Erro ao salvar o turno."})
+            return
+
+        agendar_resumo(aventura_atual)
+        resultado = resposta_turno(aventura_atual, apos_id, mensagem_jogador)
+        finalizar(resultado=resultado)
+        yield sse("fim", resultado)
+
+    def gerar_medido():
+        # a requisição já terminou (after_request) quando o stream roda: mede e confere à parte
+        metricas.iniciar("rpg.enviar_turno_stream:sse")
+        try:
+            if current_app.config["CONSULTAS_MODO"] == "desligado":
+                yield from gerar()
+                return
+            with ContadorConsultas() as contador:
+                yield from gerar()
+            conferir_consultas(contador, "rpg.enviar_turno_stream:sse")
+        finally:
+            metricas.finalizar()
+
+    def ao_fechar():
+        # cliente desconectou antes do fim: nada foi gravado, a chave fica livre para o reenvio
+        if not finalizado:
+            jobs.finalizar(job_id, erro="Stream interrompido pelo cliente.")
+
+    resposta = Response(
+        stream_with_context(gerar_medido()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+    resposta.call_on_close(ao_fechar)
+    return resposta
 
 
-@app.route("/criar_personagem", methods=["POST"])
+@bp.route("/aventuras/<int:pk>/eventos")
+@login_required
+def eventos_aventura(pk):
+    """Mensagens novas do histórico da aventura via SSE (evento 'mensagens': {"mensagens", "cursor"}).
+
+    Ao conectar, reenvia o que veio depois de Last-Event-ID (reconexão) ou de ?apos=
+    (último id exibido na página); depois fica só esperando os eventos do aovivo.
+    """
+    config = current_app.config
+    if not config["AOVIVO"]:
+        abort(404)
+
+    participa = db.session.query(
+        Participacao.query.filter_by(usuario_id=current_user.id, aventura_id=pk).exists()
+    ).scalar()
+    if not participa:
+        abort(403)
+
+    if aovivo.conexoes() >= config["AOVIVO_MAX_CONEXOES"]:
+        return jsonify({"status": "error", "error": "Muitas conexões ao vivo."}), 503, {"Retry-After": "30"}
+
+    # assina antes de ler o banco: nada publicado entre a leitura e a espera se perde
+    assinatura = aovivo.assinar(pk)
+    cursor = ler_cursor(request.headers.get("Last-Event-ID") or request.args.get("apos"))
+    pendentes = HistoricoMensagens.query.filter(
+        HistoricoMensagens.aventura_id == pk,
+        HistoricoMensagens.id > cursor
+    ).order_by(HistoricoMensagens.id.asc()).limit(200).all() if cursor is not None else []
+    pendentes = [mensagem_json(m) for m in pendentes]
+    # a conexão pode ficar aberta por minutos: devolve a conexão do banco ao pool já
+    db.session.close()
+
+    ping = config["AOVIVO_PING"]
+    fim = time.monotonic() + config["AOVIVO_DURACAO"]
+
+    def gerar(cursor):
+        yield "retry: 3000\n\n"
+        if pendentes:
+            cursor = pendentes[-1]["id"]
+            yield f"id: {cursor}\n" + sse("mensagens", {"mensagens": pendentes, "cursor": cursor})
+        while not assinatura.encerrada and time.monotonic() < fim:
+            evento = assinatura.proximo(min(ping, max(fim - time.monotonic(), 0)))
+            if evento is None:
+                yield ": ping\n\n"
+                continue
+            dados = evento["dados"]
+            if dados["cursor"] <= cursor:
+                continue
+            cursor = dados["cursor"]
+            yield f"id: {cursor}\n" + sse("mensagens", dados)
+
+    resposta = Response(
+        gerar(cursor or 0),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+    # cancela mesmo se o cliente sumir antes do gerador começar (já fora do contexto da app)
+    resposta.call_on_close(partial(current_app.extensions["aovivo"].cancelar, assinatura))
+    return resposta
+
+
+
+
+
+
+@bp.route("/criar_personagem", methods=["POST"])
 @login_required
 def criar_personagem():
     form = PersonagemForm()
     if not form.validate_on_submit():
         flash("Erro ao validar o formulário de personagem.", "danger")
-        return redirect(url_for("dashboard"))
+        return redirect(url_for("rpg.dashboard"))
 
     aventura_id = session.get("aventura_id")
     if not aventura_id:
         flash("Nenhuma aventura ativa.", "warning")
-        return redirect(url_for("lista_aventuras"))
+        return redirect(url_for("rpg.lista_aventuras"))
 
     participacao = Participacao.query.filter_by(
         usuario_id=current_user.id,
@@ -748,7 +1866,7 @@ def criar_personagem():
 
     if not participacao:
         flash("Você não participa desta aventura.", "danger")
-        return redirect(url_for("lista_aventuras"))
+        return redirect(url_for("rpg.lista_aventuras"))
 
     aventura = participacao.aventura
 
@@ -760,7 +1878,7 @@ def criar_personagem():
 
     if total_pontos > 200:
         flash("Distribuição de atributos inválida! O total de pontos deve ser até 50 adicionais à base.", "danger")
-        return redirect(url_for("dashboard"))
+        return redirect(url_for("rpg.dashboard"))
 
     atributos = {"Força": forca, "Destreza": destreza, "Inteligência": inteligencia}
 
@@ -773,67 +1891,47 @@ def criar_personagem():
         descricao=form.descricao.data
     )
     db.session.add(novo_personagem)
-    db.session.commit()
+    db.session.flush()  # id do personagem
 
     participacao.personagem_id = novo_personagem.id
+    tocar_aventura(aventura.id)
+    # um commit só; o commit expira os objetos e o prompt lê de cópias (senão, um SELECT por atributo)
+    aventura = copiar(aventura, "id", "titulo", "cenario", "descricao", "regras")
+    novo_personagem = copiar(novo_personagem, "nome", "classe", "raca", "atributos")
     db.session.commit()
 
     # Criar prompt inicial e gerar narrativa
-    import json
-    prompt_inicial = f"""
-Você é o mestre de uma campanha de RPG de mesa online. Um novo personagem acaba de ser criado.
+    builder = PromptBuilder(narrador.modelo, current_app.config["PROMPT_MAX_TOKENS"])
+    builder.adicionar("instrucao", "Você é o mestre de uma campanha de RPG de mesa online. "
+                      "Um novo personagem acaba de ser criado.", PRIORIDADE_ESSENCIAL)
+    builder.adicionar("aventura", f"Aventura: {aventura.titulo}\nCenário: {aventura.cenario}", PRIORIDADE_ESSENCIAL)
+    builder.adicionar("descricao", aventura.descricao, PRIORIDADE_MEDIA, titulo="Descrição:", manter="inicio")
+    builder.adicionar("regras", json.dumps(aventura.regras, ensure_ascii=False, indent=2), PRIORIDADE_BAIXA,
+                      titulo="Regras relevantes:", manter="inicio")
+    builder.adicionar("personagem",
+                      f"Personagem criado: {novo_personagem.nome}, {novo_personagem.classe}, {novo_personagem.raca}\n"
+                      f"Atributos: {json.dumps(novo_personagem.atributos, ensure_ascii=False, indent=2)}",
+                      PRIORIDADE_ESSENCIAL)
+    builder.adicionar("pedido", "Crie a introdução da história desta aventura incluindo este personagem levando em "
+                      "consideração as informações da aventura de forma concisa e interessante, sem mencionar IA.",
+                      PRIORIDADE_ESSENCIAL)
+    prompt = builder.montar()
+    prompt_inicial = prompt.texto
+    current_app.logger.info("Prompt de introdução: %s tokens %s", prompt.total_tokens, prompt.tamanhos())
 
-Aventura: {aventura.titulo}
-Descrição: {aventura.descricao}
-Cenário: {aventura.cenario}
-Regras relevantes: {json.dumps(aventura.regras, ensure_ascii=False, indent=2)}
-
-Personagem criado: {novo_personagem.nome}, {novo_personagem.classe}, {novo_personagem.raca}
-Atributos: {json.dumps(novo_personagem.atributos, ensure_ascii=False, indent=2)}
-
-Crie a introdução da história desta aventura incluindo este personagem levando em consideração as informações da aventura de forma concisa e interessante, sem mencionar IA.
-"""
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "Você é um mestre de RPG narrando a aventura."},
-                {"role": "user", "content": prompt_inicial}
-            ],
-            temperature=0.8,
-            max_tokens=800
-        )
-        narrativa_inicial = response.choices[0].message.content.strip()
-
-        nova_sessao = Sessao(
-            aventura_id=aventura.id,
-            narrador_ia=narrativa_inicial,
-            resultado=narrativa_inicial,
-            acoes_jogadores=[],
-            prompt_usado=prompt_inicial,
-            resposta_bruta=str(response)
-        )
-        db.session.add(nova_sessao)
-
-        mensagem_mestre = HistoricoMensagens(
-            usuario_id=None,
-            aventura_id=aventura.id,
-            mensagem=narrativa_inicial,
-            autor="Mestre IA"
-        )
-        db.session.add(mensagem_mestre)
-
-        aventura.ultimo_turno = {"texto": narrativa_inicial}
-        db.session.commit()
-
-        flash("Personagem criado e aventura iniciada com sucesso!", "success")
+        session["job_pendente"] = fila.enfileirar("introducao", {
+            "aventura_id": aventura.id,
+            "prompt": prompt_inicial
+        }, usuario_id=current_user.id, grupo=grupo_aventura(aventura.id))
+        flash("Personagem criado! O Mestre IA está preparando a introdução da aventura...", "success")
     except Exception as e:
         flash(f"Erro ao iniciar a aventura com IA: {e}", "danger")
 
-    return redirect(url_for("dashboard"))
+    return redirect(url_for("rpg.dashboard"))
 
 
-@app.route("/add_personagem", methods=["POST"])
+@bp.route("/add_personagem", methods=["POST"])
 @login_required
 def add_personagem():
     form = PersonagemForm()
@@ -857,7 +1955,7 @@ def add_personagem():
 
     if (forca + destreza + inteligencia) > 200:
         flash("Distribuição de atributos inválida! O total de pontos deve ser até 200.", "danger")
-        return redirect(url_for("dashboard"))
+        return redirect(url_for("rpg.dashboard"))
 
     atributos = {"Força": forca, "Destreza": destreza, "Inteligência": inteligencia}
 
@@ -866,13 +1964,14 @@ def add_personagem():
         personagem = Personagem.query.get_or_404(personagem_id)
         if personagem.usuario_id != current_user.id:
             flash("Você não tem permissão para editar esse personagem.", "danger")
-            return redirect(url_for("dashboard"))
+            return redirect(url_for("rpg.dashboard"))
 
         personagem.nome = request.form.get('nome', form.nome.data)
         personagem.classe = request.form.get('classe', form.classe.data)
         personagem.raca = request.form.get('raca', form.raca.data)
         personagem.descricao = request.form.get('descricao', form.descricao.data)
         personagem.atributos = atributos
+        tocar_aventuras_do_personagem(personagem.id)
         db.session.commit()
         flash("Personagem atualizado com sucesso!", "success")
 
@@ -906,38 +2005,26 @@ def add_personagem():
                     aventura_id=aventura_id
                 )
                 db.session.add(participacao)
+                tocar_aventura(aventura_id)
                 db.session.commit()
 
         flash("Novo personagem criado e vinculado à aventura!", "success")
 
-    return redirect(url_for("dashboard"))
+    return redirect(url_for("rpg.dashboard"))
 
 
 
 
-'''
-@app.route("/aumentar_tamanho_autor")
-def aumentar_tamanho_autor():
-    try:
-        # ALTER TABLE para mudar o tipo da coluna autor para VARCHAR(100)
-        db.session.execute(
-            text("ALTER TABLE core_historicomensagens ALTER COLUMN autor TYPE VARCHAR(100)")
-        )
-        db.session.commit()
-        return "Coluna 'autor' atualizada para VARCHAR(100) com sucesso!"
-    except Exception as e:
-        db.session.rollback()
-        return f"Erro: {e}"
-'''
 
 
 
 
 # Rota para excluir personagem
-@app.route("/excluir_personagem/<int:personagem_id>", methods=["POST"])
+@bp.route("/excluir_personagem/<int:personagem_id>", methods=["POST"])
 def excluir_personagem(personagem_id):
     personagem = Personagem.query.get_or_404(personagem_id)
     try:
+        tocar_aventuras_do_personagem(personagem.id)
         db.session.delete(personagem)
         db.session.commit()
         flash("Personagem excluído com sucesso!", "success")
@@ -945,25 +2032,224 @@ def excluir_personagem(personagem_id):
         db.session.rollback()
         flash(f"Erro ao excluir: {e}", "danger")
 
-    return redirect(url_for("dashboard"))
+    return redirect(url_for("rpg.dashboard"))
 
 
 # -------------------------
 # CLI convenience
 # -------------------------
-@app.cli.command("init-db")
+@bp.cli.command("init-db")
 def init_db():
-    db.create_all()
+    upgrade()
     if not Usuario.query.filter_by(username="admin").first():
         u = Usuario(username="admin", email="admin@example.com")
-        u.set_password("adminpass")
+        definir_senha(u, "adminpass")
         db.session.add(u)
         db.session.commit()
         print("Superuser 'admin' criado com senha 'adminpass'.")
     print("DB inicializado.")
 
+@bp.cli.command("compactar-auditoria")
+@click.option("--lote", default=500, show_default=True, help="Sessões por commit.")
+def compactar_auditoria(lote):
+    """Move prompt_usado/resposta_bruta antigos de core_sessao para core_sessaoauditoria (comprimidos)."""
+    pendentes = (
+        (Sessao.prompt_usado_legado.isnot(None) & (Sessao.prompt_usado_legado != "")) |
+        (Sessao.resposta_bruta_legado.isnot(None) & (Sessao.resposta_bruta_legado != ""))
+    )
+    total = bytes_antes = bytes_depois = 0
+    while True:
+        sessoes = (
+            Sessao.query
+            .options(db.undefer(Sessao.prompt_usado_legado), db.undefer(Sessao.resposta_bruta_legado))
+            .filter(pendentes)
+            .order_by(Sessao.id)
+            .limit(lote)
+            .all()
+        )
+        if not sessoes:
+            break
+        for s in sessoes:
+            prompt = s.prompt_usado_legado or ""
+            resposta = s.resposta_bruta_legado or ""
+            if s.auditoria is None:
+                s.auditoria = SessaoAuditoria(codec=CODEC_AUDITORIA)
+                s.auditoria.prompt_usado = prompt
+                s.auditoria.resposta_bruta = resposta
+            s.prompt_usado_legado = None
+            s.resposta_bruta_legado = None
+            bytes_antes += len(prompt.encode("utf-8")) + len(resposta.encode("utf-8"))
+            bytes_depois += len(s.auditoria.prompt_comprimido or b"") + len(s.auditoria.resposta_comprimida or b"")
+        db.session.commit()
+        total += len(sessoes)
+        print(f"{total} sessões compactadas...")
+
+    print(f"Concluído: {total} sessões, {bytes_antes} -> {bytes_depois} bytes ({CODEC_AUDITORIA}).")
+
+@bp.cli.command("arquivar")
+@click.option("--dias", type=int, default=None, help="Idade mínima dos turnos (padrão: ARQUIVO_DIAS).")
+@click.option("--aventura", "aventura_id", type=int, default=None, help="Só esta aventura.")
+@click.option("--lote", default=500, show_default=True, help="Linhas por commit.")
+def arquivar(dias, aventura_id, lote):
+    """Move Sessao/HistoricoMensagens antigos (ou de aventuras concluídas) para o arquivo frio."""
+    dias = current_app.config["ARQUIVO_DIAS"] if dias is None else dias
+    corte = datetime.utcnow() - timedelta(days=dias)
+    query = Aventura.query.order_by(Aventura.id)
+    if aventura_id is not None:
+        query = query.filter(Aventura.id == aventura_id)
+    total_mensagens = total_sessoes = 0
+    for id_ in [a.id for a in query.with_entities(Aventura.id)]:
+        aventura = db.session.get(Aventura, id_)
+        mensagens, sessoes = arquivar_aventura(arquivo, aventura, corte, lote)
+        if mensagens or sessoes:
+            print(f"Aventura {id_}: {mensagens} mensagens, {sessoes} sessões arquivadas.")
+        total_mensagens += mensagens
+        total_sessoes += sessoes
+    print(f"Concluído: {total_mensagens} mensagens e {total_sessoes} sessões em {arquivo.diretorio}.")
+
+# -------------------------
+# Métricas
+# -------------------------
+class JSONMedido(DefaultJSONProvider):
+    """Provider JSON padrão do Flask, com o tempo de serialização na fase "json"."""
+
+    def dumps(self, obj, **kwargs):
+        with self._app.extensions["metricas"].fase("json"):
+            return super().dumps(obj, **kwargs)
+
+
+def inicio_render(sender, template, context, **extra):
+    g.inicio_render = time.perf_counter()
+
+
+def fim_render(sender, template, context, **extra):
+    inicio = g.pop("inicio_render", None)
+    if inicio is not None:
+        metricas.somar_fase("render", time.perf_counter() - inicio)
+
+
+@bp.before_app_request
+def iniciar_medicao():
+    metricas.iniciar(request.endpoint or "sem_rota")
+
+
+@bp.after_app_request
+def finalizar_medicao(resposta):
+    metricas.finalizar(resposta.status_code, {"metodo": request.method})
+    return resposta
+
+
+@bp.teardown_app_request
+def medicao_com_erro(erro):
+    # exceção não tratada: after_request não roda
+    if metricas.atual is not None:
+        metricas.finalizar(500, {"metodo": request.method})
+
+
+@bp.before_app_request
+def iniciar_contagem_consultas():
+    if current_app.config["CONSULTAS_MODO"] != "desligado":
+        g.contador_consultas = ContadorConsultas().__enter__()
+
+
+@bp.after_app_request
+def verificar_consultas(resposta):
+    contador = g.get("contador_consultas")
+    if contador is None:
+        return resposta
+    resposta.headers["X-Consultas"] = str(contador.total)
+    conferir_consultas(contador, request.endpoint)
+    return resposta
+
+
+def conferir_consultas(contador, nome):
+    """Confere o contador com CONSULTAS_ORCAMENTOS[nome]: levanta em "erro", avisa em "log"."""
+    config = current_app.config
+    try:
+        contador.verificar(config["CONSULTAS_ORCAMENTOS"].get(nome), nome, config["CONSULTAS_REPETICOES"])
+    except OrcamentoExcedido as e:
+        if config["CONSULTAS_MODO"] == "erro":
+            raise
+        current_app.logger.warning("Orçamento de consultas: %s", e)
+
+
+@bp.teardown_app_request
+def encerrar_contagem_consultas(erro):
+    # sai do contador mesmo quando a view levantou exceção (after_request não roda):
+    # senão ele fica ativo na thread e soma as consultas das próximas requisições
+    contador = g.pop("contador_consultas", None)
+    if contador is not None:
+        contador.__exit__(None, None, None)
+
+
+@bp.route("/metrics")
+def exportar_metricas():
+    token = current_app.config["METRICAS_TOKEN"]
+    if token and request.headers.get("Authorization") != f"Bearer {token}":
+        abort(401)
+    return Response(metricas.exportar(), mimetype="text/plain; version=0.0.4; charset=utf-8")
+
+
+# -------------------------
+# App factory
+# -------------------------
+def create_app(config=None):
+    """Cria e configura a aplicação.
+
+    Não toca no banco nem na IA: o esquema é aplicado uma vez por deploy
+    (`flask init-db` / `flask db upgrade`) e o cliente OpenAI nasce no primeiro uso.
+    Cada chamada devolve uma app independente (fila, caches, métricas próprias);
+    o servidor usa a de wsgi.py.
+    """
+    app = Flask(__name__)
+    configurar(app)
+    if config:
+        app.config.update(config)
+    app.config.setdefault("SQLALCHEMY_ENGINE_OPTIONS", opcoes_engine(app.config))
+
+    db.init_app(app)
+    login_manager.init_app(app)
+    mail.init_app(app)
+    migrate.init_app(app, db, directory=os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations"))
+
+    # instâncias desta app (ver "Extensions"): nada é compartilhado entre apps
+    medidor = Metricas()
+    medidor.init_app(app)
+    PoolSenhas().init_app(app)
+    FilaEmails().init_app(app, mail)
+    Narrador().init_app(app)
+    AoVivo().init_app(app)
+    ArquivoFrio().init_app(app)
+    jobs = FilaJobs()
+    jobs.init_app(app)
+    for tipo, (func, medida) in TAREFAS.items():
+        jobs.registrar(tipo)(medidor.instrumentado(medida)(func) if medida else func)
+    usuarios = CacheTTL("usuarios", max_itens=app.config["CACHE_USUARIOS_MAX"], ttl=app.config["CACHE_USUARIOS_TTL"])
+    app.extensions["cache_usuarios"] = usuarios
+    app.extensions["invalidacoes_usuarios"] = InvalidacoesCompartilhadas(
+        usuarios, app.config["CACHE_USUARIOS_DB_PATH"], intervalo=app.config["CACHE_USUARIOS_VERIFICAR"],
+        converter=int)
+    app.extensions["cache_dashboard"] = CacheTTL(
+        "dashboard", max_itens=app.config["CACHE_DASHBOARD_MAX"], ttl=app.config["CACHE_DASHBOARD_TTL"])
+
+    with app.app_context():
+        configurar_sqlite(db.engine, app.config)  # cria o engine (sem conectar)
+        medidor.conectar_engine(db.engine)
+        if app.config["CONSULTAS_MODO"] != "desligado":
+            instalar_contador(db.engine)
+    app.json = JSONMedido(app)
+    before_render_template.connect(inicio_render, app)
+    template_rendered.connect(fim_render, app)
+
+    app.register_blueprint(bp)
+    return app
+
+
 # -------------------------
 # Run
 # -------------------------
 if __name__ == "__main__":
+    app = create_app()
+    with app.app_context():
+        upgrade()
     app.run(host="0.0.0.0", port=int(os.getenv("PORT", 5000)), debug=os.getenv("DEBUG", "False") == "True")
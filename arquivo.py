@@ -0,0 +1,189 @@
+# arquivo.py
+import gzip
+import json
+import os
+import shutil
+import threading
+from bisect import bisect_left
+from datetime import datetime
+from types import SimpleNamespace
+
+from cache import CacheTTL
+from models import HistoricoMensagens, Sessao, SessaoAuditoria, db
+from resumo import cursor_resumo
+
+# -------------------------
+# Arquivo frio de Sessao / HistoricoMensagens
+# -------------------------
+# `flask arquivar` tira das tabelas quentes os turnos mais velhos que
+# ARQUIVO_DIAS (ou tudo, em aventuras "concluida") e os grava em arquivos
+# gzip JSONL só de acréscimo, um por aventura e tipo:
+#     ARQUIVO_DIR/<aventura_id>/mensagens.jsonl.gz
+#     ARQUIVO_DIR/<aventura_id>/sessoes.jsonl.gz
+# Cada lote vira um membro gzip novo no fim do arquivo (o formato aceita
+# membros concatenados) e passa por fsync antes das linhas saírem do banco; se
+# o processo cair no meio, a próxima execução grava o lote de novo e a leitura
+# descarta ids repetidos.
+#
+# Só sai do banco o começo da linha do tempo: mensagens arquivadas são sempre
+# anteriores às que ficam, então a paginação do histórico (keyset por
+# criado_em, id) continua no arquivo quando as linhas quentes acabam. Sessões
+# só são arquivadas depois de entrarem no resumo (resumo.cursor_resumo), e a
+# última sessão de uma aventura em andamento fica no banco.
+
+TIPOS = ("mensagens", "sessoes")
+
+
+def _data(valor):
+    return datetime.fromisoformat(valor) if valor else None
+
+
+def _iso(valor):
+    return valor.isoformat() if valor else None
+
+
+def _chave(registro):
+    return (registro["criado_em"] or "", registro["id"])
+
+
+class ArquivoFrio:
+    def __init__(self, diretorio="arquivo", dias=180):
+        self.diretorio = diretorio
+        self.dias = dias
+        # arquivos já lidos, por (caminho, mtime, tamanho): um acréscimo invalida a entrada
+        self._cache = CacheTTL("arquivo", max_itens=64, ttl=600)
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.diretorio = app.config.get("ARQUIVO_DIR", self.diretorio)
+        self.dias = int(app.config.get("ARQUIVO_DIAS", self.dias))
+        app.extensions["arquivo"] = self
+
+    def caminho(self, aventura_id, tipo):
+        return os.path.join(self.diretorio, str(int(aventura_id)), f"{tipo}.jsonl.gz")
+
+    # -------------------------
+    # Escrita
+    # -------------------------
+    def anexar(self, aventura_id, tipo, registros):
+        """Acrescenta os registros (dicts com "id" e "criado_em") como um membro gzip novo."""
+        caminho = self.caminho(aventura_id, tipo)
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        dados = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in registros).encode("utf-8")
+        with self._lock, open(caminho, "ab") as f:
+            f.write(gzip.compress(dados, 6))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def remover(self, aventura_id):
+        shutil.rmtree(os.path.join(self.diretorio, str(int(aventura_id))), ignore_errors=True)
+
+    # -------------------------
+    # Leitura
+    # -------------------------
+    def ler(self, aventura_id, tipo):
+        """Registros arquivados, sem repetidos, em ordem (criado_em, id); [] se não houver arquivo."""
+        caminho = self.caminho(aventura_id, tipo)
+        try:
+            st = os.stat(caminho)
+        except FileNotFoundError:
+            return []
+        chave = (caminho, st.st_mtime_ns, st.st_size)
+        registros = self._cache.obter(chave)
+        if registros is None:
+            with gzip.open(caminho, "rt", encoding="utf-8") as f:
+                por_id = {r["id"]: r for r in map(json.loads, f)}
+            registros = sorted(por_id.values(), key=_chave)
+            self._cache.guardar(chave, registros)
+        return registros
+
+    def mensagens_antes(self, aventura_id, cursor, limite):
+        """Até `limite` mensagens arquivadas anteriores ao cursor (criado_em, id), da mais nova à mais velha.
+
+        Objetos com os mesmos campos de HistoricoMensagens usados nas páginas.
+        """
+        registros = self.ler(aventura_id, "mensagens")
+        fim = len(registros)
+        if cursor:
+            fim = bisect_left(registros, (_iso(cursor[0]), cursor[1]), key=_chave)
+        return [
+            SimpleNamespace(id=r["id"], usuario_id=r["usuario_id"], autor=r["autor"], mensagem=r["mensagem"],
+                            criado_em=_data(r["criado_em"]))
+            for r in reversed(registros[max(fim - limite, 0):fim])
+        ]
+
+    def ultima_sessao(self, aventura_id):
+        registros = self.ler(aventura_id, "sessoes")
+        if not registros:
+            return None
+        r = registros[-1]
+        return SimpleNamespace(**{**r, "criado_em": _data(r["criado_em"])})
+
+
+# -------------------------
+# Arquivamento (usado por `flask arquivar`)
+# -------------------------
+def mensagem_registro(m):
+    return {"id": m.id, "usuario_id": m.usuario_id, "autor": m.autor, "mensagem": m.mensagem,
+            "criado_em": _iso(m.criado_em)}
+
+
+def sessao_registro(s):
+    return {"id": s.id, "narrador_ia": s.narrador_ia, "acoes_jogadores": s.acoes_jogadores,
+            "rolagens": s.rolagens, "resultado": s.resultado, "criado_em": _iso(s.criado_em),
+            "prompt_usado": s.prompt_usado, "resposta_bruta": s.resposta_bruta}
+
+
+def arquivar_aventura(arquivo, aventura, corte, lote=500):
+    """Move para o arquivo frio os turnos da aventura anteriores a `corte` (tudo se "concluida").
+
+    Devolve (mensagens, sessoes) arquivadas. Commita a cada lote.
+    """
+    tudo = aventura.status == "concluida"
+    aventura_id = aventura.id
+
+    filtro = HistoricoMensagens.aventura_id == aventura_id
+    if not tudo:
+        filtro &= HistoricoMensagens.criado_em < corte
+    total_mensagens = 0
+    while True:
+        mensagens = (
+            HistoricoMensagens.query.filter(filtro)
+            .order_by(HistoricoMensagens.criado_em, HistoricoMensagens.id)
+            .limit(lote)
+            .all()
+        )
+        if not mensagens:
+            break
+        arquivo.anexar(aventura_id, "mensagens", [mensagem_registro(m) for m in mensagens])
+        ids = [m.id for m in mensagens]
+        db.session.execute(db.delete(HistoricoMensagens).where(HistoricoMensagens.id.in_(ids)))
+        db.session.commit()
+        total_mensagens += len(ids)
+
+    filtro = Sessao.aventura_id == aventura_id
+    if not tudo:
+        # só o que já entrou no resumo, e nunca a última sessão (o dashboard mostra a data dela)
+        ultima = db.session.query(db.func.max(Sessao.id)).filter(Sessao.aventura_id == aventura_id).scalar() or 0
+        filtro &= (Sessao.criado_em < corte) & (Sessao.id <= cursor_resumo(aventura)) & (Sessao.id < ultima)
+    total_sessoes = 0
+    while True:
+        sessoes = (
+            Sessao.query
+            .options(db.selectinload(Sessao.auditoria),
+                     db.undefer(Sessao.prompt_usado_legado), db.undefer(Sessao.resposta_bruta_legado))
+            .filter(filtro)
+            .order_by(Sessao.id)
+            .limit(lote)
+            .all()
+        )
+        if not sessoes:
+            break
+        arquivo.anexar(aventura_id, "sessoes", [sessao_registro(s) for s in sessoes])
+        ids = [s.id for s in sessoes]
+        db.session.execute(db.delete(SessaoAuditoria).where(SessaoAuditoria.sessao_id.in_(ids)))
+        db.session.execute(db.delete(Sessao).where(Sessao.id.in_(ids)))
+        db.session.commit()
+        total_sessoes += len(ids)
+
+    return total_mensagens, total_sessoes
@@ -0,0 +1,95 @@
+# benchmarks/bench_boot.py
+"""Tempo de boot de um worker: import do app.py até a primeira resposta.
+
+Cada medição roda num processo novo (como um worker do gunicorn). Mostra a
+mediana de import / create_app() / primeira requisição e os módulos mais caros
+de importar; com --limite-ms sai com erro se o total passar do limite, para
+acompanhar regressões.
+
+Uso: python benchmarks/bench_boot.py [-n 5] [--limite-ms 1500]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MEDICAO = """
+import json, sys, time
+inicio = time.perf_counter()
+import app as modulo
+importado = time.perf_counter()
+nova = modulo.create_app()
+criado = time.perf_counter()
+resposta = nova.test_client().get("/sobre/")
+pronto = time.perf_counter()
+assert resposta.status_code == 200, resposta.status_code
+print(json.dumps({
+    "import": importado - inicio,
+    "create_app": criado - importado,
+    "primeira_requisicao": pronto - criado,
+    "total": pronto - inicio,
+    "openai_carregado": "openai" in sys.modules,
+}))
+"""
+
+
+def ambiente():
+    tmp = tempfile.mkdtemp()
+    env = dict(os.environ)
+    env.setdefault("OPENAI_API_KEY", "x")
+    env.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tmp, "boot.db"))
+    env.setdefault("FILA_DB_PATH", os.path.join(tmp, "fila.db"))
+    return env
+
+
+def medir(env):
+    saida = subprocess.run([sys.executable, "-c", MEDICAO], cwd=RAIZ, env=env,
+                           capture_output=True, text=True, check=True)
+    return json.loads(saida.stdout.strip().splitlines()[-1])
+
+
+def modulos_caros(env, quantos=10):
+    saida = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"], cwd=RAIZ, env=env,
+                           capture_output=True, text=True, check=True)
+    linhas = []
+    for linha in saida.stderr.splitlines():
+        if not linha.startswith("import time:") or "|" not in linha:
+            continue
+        _, cumulativo, nome = linha.split("|")
+        # só imports de primeiro nível (feitos diretamente por app.py)
+        if nome.startswith("   ") and not nome.startswith("    "):
+            linhas.append((int(cumulativo), nome.strip()))
+    return sorted(linhas, reverse=True)[:quantos]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", type=int, default=5, help="processos medidos")
+    parser.add_argument("--limite-ms", type=float, default=None, help="falha se a mediana total passar disso")
+    args = parser.parse_args()
+
+    env = ambiente()
+    medicoes = [medir(env) for _ in range(args.n)]
+    print(f"{'fase':<22} {'mediana (ms)':>13} {'máx (ms)':>10}")
+    for fase in ("import", "create_app", "primeira_requisicao", "total"):
+        valores = [m[fase] * 1000 for m in medicoes]
+        print(f"{fase:<22} {statistics.median(valores):>13.1f} {max(valores):>10.1f}")
+    print(f"openai importado no boot: {any(m['openai_carregado'] for m in medicoes)}")
+
+    print("\nimports mais caros de app.py:")
+    for cumulativo, nome in modulos_caros(env):
+        print(f"  {cumulativo / 1000:>8.1f} ms  {nome}")
+
+    total = statistics.median(m["total"] * 1000 for m in medicoes)
+    if args.limite_ms is not None and total > args.limite_ms:
+        print(f"\nREGRESSÃO: boot de {total:.0f} ms acima do limite de {args.limite_ms:.0f} ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+# benchmarks/bench_concorrencia.py
+"""Escritas de turno concorrentes no SQLite: journal antigo x WAL.
+
+Várias threads gravam turnos (app.gravar_turno, o mesmo caminho do enviar_turno)
+em aventuras diferentes enquanto outras leem o histórico como o dashboard.
+Roda uma vez com o modo antigo (journal DELETE, synchronous FULL, sem busy_timeout) e outra com
+os pragmas padrão do app (WAL, synchronous NORMAL, busy_timeout) e compara
+vazão, latência das escritas e erros "database is locked".
+
+Uso: python benchmarks/bench_concorrencia.py [--escritores 8] [--leitores 8] [--turnos 50]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "x")
+
+from sqlalchemy.exc import OperationalError  # noqa: E402
+
+import app as modulo  # noqa: E402
+from models import Aventura, Usuario, db  # noqa: E402
+
+MODOS = {
+    # busy_timeout 0: sem ele o pragma padrão (5000 ms) continuaria valendo e esconderia os locks
+    "antigo (DELETE/FULL)": {"SQLITE_JOURNAL_MODE": "DELETE", "SQLITE_SYNCHRONOUS": "FULL", "SQLITE_BUSY_TIMEOUT": 0},
+    "WAL sem busy_timeout": {"SQLITE_BUSY_TIMEOUT": 0},
+    "WAL/NORMAL": {},
+}
+
+
+def preparar(config, escritores):
+    tmp = tempfile.mkdtemp()
+    app = modulo.create_app({
+        "SQLALCHEMY_DATABASE_URI": "sqlite:///" + os.path.join(tmp, "bench.db"),
+        "FILA_DB_PATH": os.path.join(tmp, "fila.db"),
+        **config,
+    })
+    with app.app_context():
+        db.create_all()
+        u = Usuario(username="bench", email="bench@example.com", password_hash="x")
+        db.session.add(u)
+        db.session.flush()
+        aventuras = [Aventura(titulo=f"A{i}", regras={}, criador_id=u.id) for i in range(escritores)]
+        db.session.add_all(aventuras)
+        db.session.commit()
+        return app, u.id, [a.id for a in aventuras]
+
+
+def rodar(nome, config, args):
+    app, usuario_id, aventura_ids = preparar(config, args.escritores)
+    latencias, erros = [], []
+    parar = threading.Event()
+    leituras = [0]
+
+    def escritor(aventura_id):
+        with app.app_context():
+            for i in range(args.turnos):
+                inicio = time.perf_counter()
+                try:
+                    aventura = db.session.get(Aventura, aventura_id)
+                    modulo.gravar_turno(aventura, usuario_id, "bench", f"ação {i}", "prompt " * 200,
+                                        "narração " * 150, "{}")
+                    latencias.append(time.perf_counter() - inicio)
+                except OperationalError as e:
+                    db.session.rollback()
+                    erros.append(str(e.orig))
+
+    def leitor():
+        with app.app_context():
+            while not parar.is_set():
+                for aventura_id in aventura_ids:
+                    try:
+                        modulo.pagina_historico(aventura_id, None, 50)
+                        leituras[0] += 1
+                    except OperationalError as e:
+                        erros.append(str(e.orig))
+                    db.session.rollback()
+
+    leitores = [threading.Thread(target=leitor) for _ in range(args.leitores)]
+    escritores = [threading.Thread(target=escritor, args=(aid,)) for aid in aventura_ids]
+    for t in leitores:
+        t.start()
+    inicio = time.perf_counter()
+    for t in escritores:
+        t.start()
+    for t in escritores:
+        t.join()
+    duracao = time.perf_counter() - inicio
+    parar.set()
+    for t in leitores:
+        t.join()
+
+    latencias.sort()
+    p95 = latencias[int(len(latencias) * 0.95) - 1] * 1000 if latencias else float("nan")
+    print(f"{nome:<22} {len(latencias) / duracao:>9.1f} {statistics.median(latencias) * 1000 if latencias else 0:>9.1f} "
+          f"{p95:>9.1f} {leituras[0] / duracao:>10.1f} {len(erros):>6}")
+    return erros
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--escritores", type=int, default=8)
+    parser.add_argument("--leitores", type=int, default=8)
+    parser.add_argument("--turnos", type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"{args.escritores} escritores x {args.turnos} turnos, {args.leitores} leitores\n")
+    print(f"{'modo':<22} {'turnos/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'leituras/s':>10} {'erros':>6}")
+    resultado = {nome: rodar(nome, config, args) for nome, config in MODOS.items()}
+    if resultado["WAL/NORMAL"]:
+        print(f"\nFALHOU: {len(resultado['WAL/NORMAL'])} erro(s) com WAL, ex.: {resultado['WAL/NORMAL'][0]}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+# benchmarks/bench_dados.py
+"""Rolagens por segundo do motor de dados: NumPy vetorizado x laço em Python puro.
+
+Uso: python benchmarks/bench_dados.py [--max 10000000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dados import (  # noqa: E402
+    ATRIBUTOS, RESULTADOS, _tabela, distribuicao, limites, reproduzir, resolver_rodada, rolar_vetor
+)
+
+
+def rolar_python(atributos, limites_regras, rng):
+    """Mesma regra de dados.rolar_vetor, um dado por vez (referência do front antigo)."""
+    saida = []
+    for atributo in atributos:
+        bonus = (atributo - 50) // 2
+        final = min(max(rng.randint(1, 100) + bonus, 1), 100)
+        faixa = 0
+        while faixa < len(limites_regras) and final > limites_regras[faixa]:
+            faixa += 1
+        saida.append((final, faixa))
+    return saida
+
+
+def medir(func, *args):
+    inicio = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - inicio
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--max", type=int, default=10_000_000, help="maior lote a medir")
+    parser.add_argument("--max-python", type=int, default=1_000_000, help="maior lote para o laço puro")
+    args = parser.parse_args()
+
+    lim = limites(None)
+    lim_lista = lim.tolist()
+    print(f"{'lote':>10} {'numpy (rol/s)':>16} {'python (rol/s)':>16} {'ganho':>8}")
+    n = 1_000
+    while n <= args.max:
+        atributos = np.random.default_rng(0).integers(10, 91, size=n)
+        t_np = medir(rolar_vetor, atributos, lim, np.random.default_rng(1))
+        if n <= args.max_python:
+            t_py = medir(rolar_python, atributos.tolist(), lim_lista, random.Random(1))
+            py, ganho = f"{n / t_py:>16,.0f}", f"{t_py / t_np:>7.1f}x"
+        else:
+            py, ganho = f"{'-':>16}", f"{'-':>8}"
+        print(f"{n:>10,} {n / t_np:>16,.0f} {py} {ganho}")
+        n *= 10
+
+    # Rodada típica (poucos dados) pelo caminho completo usado na rota + replay pela semente
+    personagens = {
+        i: SimpleNamespace(id=i, nome=f"P{i}", atributos={"Força": 40 + i, "Destreza": 60, "Inteligência": 50})
+        for i in range(1, 7)
+    }
+    pedidos = [{"personagem_id": i, "tipo": t} for i in personagens for t in ("forca", "destreza")]
+    repeticoes = 2_000
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        registro = resolver_rodada(pedidos, personagens, None)
+    t = (time.perf_counter() - inicio) / repeticoes
+    print(f"\nresolver_rodada ({len(pedidos)} rolagens): {t * 1e6:.1f} µs/rodada")
+    assert reproduzir(registro), "replay pela semente não bate"
+    assert all(item["resultado"] in RESULTADOS for item in registro["itens"])
+    print("replay pela semente: ok")
+
+    # Tabela de probabilidades: exata (enumeração) x Monte Carlo, e custo com/sem cache
+    limites_tupla = tuple(lim_lista)
+    _tabela.cache_clear()
+    t_frio = medir(distribuicao, limites_tupla)
+    t_quente = medir(distribuicao, limites_tupla)
+    print(f"\ndistribuicao: {t_frio * 1e3:.2f} ms sem cache, {t_quente * 1e3:.2f} ms com cache")
+    amostras = 20_000
+    atributos = np.repeat(ATRIBUTOS, amostras)
+    _, _, _, faixa = rolar_vetor(atributos, lim, np.random.default_rng(2))
+    simulado = np.stack([
+        np.bincount(f, minlength=len(RESULTADOS)) / amostras for f in faixa.reshape(len(ATRIBUTOS), amostras)
+    ])
+    exato = np.array([linha["probabilidades"] for linha in distribuicao(limites_tupla)["atributos"]])
+    print(f"Monte Carlo ({amostras:,}/atributo) x exato: erro máximo {np.abs(simulado - exato).max():.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+# benchmarks/bench_email.py
+"""Vazão de envio de e-mail: envio direto (uma conexão por mensagem) x correio.FilaEmails.
+
+Sobe um servidor SMTP local (aiosmtpd) no lugar do Gmail. --latencia simula o custo
+de abrir a sessão (EHLO/TLS/login), que é o que a conexão reaproveitada economiza;
+--falhas faz o servidor recusar com 451 parte das mensagens para exercitar o retry.
+
+Uso: pip install aiosmtpd; python benchmarks/bench_email.py [-n 200] [--latencia 0.05] [--falhas 0.1]
+"""
+import argparse
+import asyncio
+import os
+import random
+import socket
+import sys
+import time
+
+from aiosmtpd.controller import Controller
+from flask import Flask
+from flask_mail import Mail, Message
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from correio import FilaEmails  # noqa: E402
+
+
+class Servidor:
+    def __init__(self, latencia, falhas):
+        self.latencia = latencia
+        self.falhas = falhas
+        self.recebidas = 0
+        self.sessoes = 0
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        self.sessoes += 1
+        await asyncio.sleep(self.latencia)
+        session.host_name = hostname
+        return responses
+
+    async def handle_DATA(self, server, session, envelope):
+        if random.random() < self.falhas:
+            return "451 Tente mais tarde"
+        self.recebidas += 1
+        return "250 OK"
+
+
+def porta_livre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def criar_app(porta):
+    app = Flask(__name__)
+    app.config.update(MAIL_SERVER="127.0.0.1", MAIL_PORT=porta, MAIL_USE_TLS=False,
+                      MAIL_DEFAULT_SENDER="bench@example.com", MAIL_BACKOFF=0.05)
+    return app, Mail(app)
+
+
+def mensagens(n):
+    return [Message(subject=f"Teste {i}", recipients=[f"u{i}@example.com"], body="x") for i in range(n)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", type=int, default=200)
+    parser.add_argument("--latencia", type=float, default=0.05)
+    parser.add_argument("--falhas", type=float, default=0.0)
+    args = parser.parse_args()
+
+    servidor = Servidor(args.latencia, 0.0)
+    porta = porta_livre()
+    controller = Controller(servidor, hostname="127.0.0.1", port=porta)
+    controller.start()
+    app, mail = criar_app(porta)
+
+    # 1) Como era: mail.send dentro da requisição, uma sessão SMTP por mensagem
+    with app.app_context():
+        inicio = time.perf_counter()
+        for msg in mensagens(args.n):
+            mail.send(msg)
+        t_direto = time.perf_counter() - inicio
+    print(f"direto: {args.n / t_direto:8.1f} msg/s  ({servidor.sessoes} sessões, "
+          f"{t_direto / args.n * 1e3:.1f} ms bloqueando a requisição por mensagem)")
+
+    # 2) Fila: a requisição só enfileira; uma sessão SMTP reaproveitada
+    servidor.recebidas = servidor.sessoes = 0
+    servidor.falhas = args.falhas
+    fila = FilaEmails()
+    fila.init_app(app, mail)
+    with app.app_context():
+        lote = mensagens(args.n)
+    inicio = time.perf_counter()
+    for msg in lote:
+        fila.enviar(msg)
+    t_enfileirar = time.perf_counter() - inicio
+    while fila.estatisticas()["enviados"] + fila.estatisticas()["falhas"] < args.n:
+        time.sleep(0.01)
+    t_fila = time.perf_counter() - inicio
+    fila.parar()
+    print(f"fila:   {args.n / t_fila:8.1f} msg/s  ({servidor.sessoes} sessões, "
+          f"{t_enfileirar / args.n * 1e6:.0f} µs por mensagem na requisição)")
+    print(f"        {fila.estatisticas()} recebidas={servidor.recebidas}")
+    controller.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+# benchmarks/bench_senhas.py
+"""Logins/s (verificações de senha) por custo de hash, em 1 núcleo e no pool.
+
+Uso: python benchmarks/bench_senhas.py [--segundos 2] [--workers N]
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.security import generate_password_hash  # noqa: E402
+
+from senhas import PoolSenhas  # noqa: E402
+
+CUSTOS = [
+    "scrypt:16384:8:1",
+    "scrypt:32768:8:1",  # padrão do Werkzeug
+    "scrypt:65536:8:1",
+    "pbkdf2:sha256:260000",
+    "pbkdf2:sha256:600000",
+    "pbkdf2:sha256:1000000",
+]
+
+
+def medir(pool, senha_hash, segundos, concorrencia):
+    """Verificações concluídas por segundo com `concorrencia` requisições simultâneas."""
+    fim = time.perf_counter() + segundos
+    total = 0
+
+    def cliente():
+        n = 0
+        while time.perf_counter() < fim:
+            assert pool.verificar(senha_hash, "senha-de-teste")
+            n += 1
+        return n
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(concorrencia) as clientes:
+        total = sum(clientes.map(lambda _: cliente(), range(concorrencia)))
+    return total / (time.perf_counter() - inicio)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--segundos", type=float, default=2.0)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    print(f"{args.workers} worker(s) no pool\n")
+    print(f"{'custo':<24} {'ms/hash':>8} {'1 núcleo':>10} {'pool':>10} {'pool/núcleo':>12}")
+    for custo in CUSTOS:
+        senha_hash = generate_password_hash("senha-de-teste", custo)
+        um = medir(PoolSenhas(custo, workers=1), senha_hash, args.segundos, 1)
+        pool = medir(PoolSenhas(custo, workers=args.workers), senha_hash, args.segundos, args.workers * 2)
+        print(f"{custo:<24} {1000 / um:>8.1f} {um:>10.1f} {pool:>10.1f} {pool / args.workers:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+# benchmarks/carga.py
+"""Teste de carga: jogadores simulados contra o app com a IA falsa (fake_openai).
+
+Cada jogador é uma thread com a própria sessão HTTP: cadastra-se, entra na
+aventura do seu grupo (o primeiro de cada grupo cria a aventura), cria o
+personagem (criar_personagem), abre o dashboard e repete turnos: envia a ação
+(enviar_turno), acompanha o job até a narração ficar pronta e recarrega o
+dashboard. No fim imprime, por rota, requisições/s, erros e latências
+p50/p90/p99, além da vazão de turnos completos (envio até a narração).
+
+Sem --url, sobe o app neste processo (servidor threaded do Werkzeug, SQLite
+temporário) já apontado para a IA falsa. Com --url, bate num deploy
+existente; suba antes a IA falsa e aponte o deploy para ela, p.ex.:
+
+    python benchmarks/fake_openai.py --porta 8089 --latencia 0.5
+    OPENAI_BASE_URL=http://127.0.0.1:8089/v1 gunicorn -w 4 -b :8000 'app:create_app()'
+    python benchmarks/carga.py --url http://127.0.0.1:8000 --jogadores 40 --turnos 5
+
+Uso: python benchmarks/carga.py [--jogadores 20] [--grupo 4] [--turnos 5] [--pensar 0.5]
+                                [--url URL] [--fila-workers 4] [--latencia 0.3] [--tokens 120] ...
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import re
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode, urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fake_openai  # noqa: E402
+
+CSRF = re.compile(r'name="csrf_token"[^>]*value="([^"]+)"')
+LINK_ENTRAR = re.compile(r'/aventuras/(\d+)/entrar/')
+SENHA = "carga123"
+
+
+class Falha(Exception):
+    pass
+
+
+class Resultados:
+    def __init__(self):
+        self.latencias = defaultdict(list)
+        self.erros = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def registrar(self, rota, segundos, ok=True):
+        with self._lock:
+            self.latencias[rota].append(segundos)
+            if not ok:
+                self.erros[rota] += 1
+
+    def relatorio(self, duracao):
+        linhas = [f"{'rota':24s} {'req':>6s} {'erros':>6s} {'req/s':>8s} {'p50 ms':>8s} {'p90 ms':>8s} "
+                  f"{'p99 ms':>8s} {'máx ms':>8s}"]
+        for rota in sorted(self.latencias):
+            valores = sorted(self.latencias[rota])
+            linhas.append(f"{rota:24s} {len(valores):6d} {self.erros[rota]:6d} {len(valores) / duracao:8.2f} "
+                          f"{percentil(valores, 50):8.0f} {percentil(valores, 90):8.0f} "
+                          f"{percentil(valores, 99):8.0f} {valores[-1] * 1000:8.0f}")
+        return "\n".join(linhas)
+
+
+def percentil(valores, p):
+    """Percentil (ms) por interpolação; valores já ordenados."""
+    if len(valores) == 1:
+        return valores[0] * 1000
+    return statistics.quantiles(valores, n=100, method="inclusive")[p - 1] * 1000
+
+
+class Jogador:
+    """Cliente HTTP com cookies e keep-alive; não segue redirecionamentos (cada passo é medido sozinho)."""
+
+    def __init__(self, url, resultados, nome):
+        partes = urlsplit(url)
+        self.host = partes.netloc
+        self.resultados = resultados
+        self.nome = nome
+        self.cookies = {}
+        self.csrf = None
+        self.conexao = http.client.HTTPConnection(self.host, timeout=120)
+
+    def requisitar(self, rota, metodo, caminho, dados=None, headers=None, esperado=(200, 302)):
+        headers = dict(headers or {})
+        corpo = None
+        if dados is not None:
+            if self.csrf:
+                dados = {"csrf_token": self.csrf, **dados}
+            corpo = urlencode(dados, doseq=True)
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        if self.cookies:
+            headers["Cookie"] = "; ".join(f"{k}={v}" for k, v in self.cookies.items())
+        inicio = time.perf_counter()
+        try:
+            self.conexao.request(metodo, caminho, body=corpo, headers=headers)
+            resposta = self.conexao.getresponse()
+            conteudo = resposta.read()
+        except (OSError, http.client.HTTPException):
+            self.conexao.close()
+            self.resultados.registrar(rota, time.perf_counter() - inicio, ok=False)
+            raise
+        segundos = time.perf_counter() - inicio
+        for cabecalho in resposta.headers.get_all("Set-Cookie") or ():
+            for chave, morsel in SimpleCookie(cabecalho).items():
+                self.cookies[chave] = morsel.value
+        ok = resposta.status in esperado
+        if rota:
+            self.resultados.registrar(rota, segundos, ok)
+        if not ok:
+            raise Falha(f"{metodo} {caminho}: HTTP {resposta.status}")
+        return resposta, conteudo.decode("utf-8", "replace")
+
+    def ler_csrf(self, html):
+        encontrado = CSRF.search(html)
+        if encontrado:
+            self.csrf = encontrado.group(1)
+
+    # -------------------------
+    # Passos do roteiro
+    # -------------------------
+    def cadastrar(self):
+        _, html = self.requisitar("home", "GET", "/")
+        self.ler_csrf(html)
+        self.requisitar("signup", "POST", "/signup", {
+            "username": self.nome, "email": f"{self.nome}@example.com",
+            "password1": SENHA, "password2": SENHA, "submit": "Cadastrar",
+        })
+
+    def criar_aventura(self):
+        self.requisitar("nova_aventura", "POST", "/aventuras/nova/", {
+            "titulo": f"Carga {self.nome}", "descricao": "Aventura do teste de carga.", "cenario": "Floresta",
+            "status": "andamento", "erro_critico_max": 15, "erro_normal_max": 49, "acerto_normal_max": 85,
+            "submit": "Salvar",
+        })
+        _, html = self.requisitar("lista_aventuras", "GET", "/aventuras/")
+        return int(LINK_ENTRAR.search(html).group(1))
+
+    def entrar(self, aventura_id):
+        self.requisitar("entrar_aventura", "GET", f"/aventuras/{aventura_id}/entrar/")
+        self.dashboard()
+
+    def dashboard(self):
+        _, html = self.requisitar("dashboard", "GET", "/dashboard")
+        self.ler_csrf(html)
+
+    def criar_personagem(self):
+        self.requisitar("criar_personagem", "POST", "/criar_personagem", {
+            "nome": self.nome.capitalize(), "classe": "Guerreiro", "raca": "Humano", "descricao": "Simulado.",
+            "forca": random.randint(20, 80), "destreza": random.randint(20, 80),
+            "inteligencia": random.randint(20, 80), "ativo_na_sessao": "y", "submit": "Criar Personagem",
+        })
+
+    def turno(self, n, espera_job):
+        inicio = time.perf_counter()
+        _, corpo = self.requisitar("enviar_turno", "POST", "/enviar_turno", {
+            "acao": f"{self.nome} avança com cautela (turno {n}).", "contexto": "",
+            "idempotency_key": uuid.uuid4().hex,
+            "rolagens": json.dumps([{"tipo": random.choice(["forca", "destreza", "inteligencia"])}]),
+        }, headers={"X-Requested-With": "XMLHttpRequest"}, esperado=(202,))
+        job = json.loads(corpo)
+        while True:
+            time.sleep(espera_job)
+            _, corpo = self.requisitar("status_job", "GET", job["status_url"])
+            job = {**job, **json.loads(corpo)}
+            status = job["status"]
+            if status in ("concluido", "erro"):
+                break
+        if status == "erro":
+            print(f"{self.nome}: turno {n}: job falhou: {job.get('error')}", file=sys.stderr)
+        self.resultados.registrar("turno completo", time.perf_counter() - inicio, ok=status == "concluido")
+        self.dashboard()
+
+
+def jogar(jogador, grupo, args, barreira):
+    """Roteiro de um jogador; o líder do grupo cria a aventura e avisa os demais."""
+    try:
+        jogador.cadastrar()
+        if grupo["lider"] is jogador:
+            grupo["aventura_id"] = jogador.criar_aventura()
+            grupo["pronta"].set()
+        grupo["pronta"].wait()
+        if grupo["aventura_id"] is None:
+            return
+        jogador.entrar(grupo["aventura_id"])
+        jogador.criar_personagem()
+        jogador.dashboard()
+    except (Falha, OSError, http.client.HTTPException) as e:
+        print(f"{jogador.nome}: preparação falhou: {e}", file=sys.stderr)
+        grupo["pronta"].set()
+        return
+    finally:
+        barreira.wait()
+
+    for n in range(1, args.turnos + 1):
+        time.sleep(random.uniform(0, 2 * args.pensar))
+        try:
+            jogador.turno(n, args.espera_job)
+        except (Falha, OSError, http.client.HTTPException) as e:
+            print(f"{jogador.nome}: turno {n} falhou: {e}", file=sys.stderr)
+
+
+def subir_app(args, base_url):
+    """App neste processo, com SQLite temporário e a IA apontada para o servidor falso."""
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    os.environ.setdefault("OPENAI_API_KEY", "x")
+    import app as modulo
+
+    tmp = tempfile.mkdtemp()
+    app = modulo.create_app({
+        "SQLALCHEMY_DATABASE_URI": "sqlite:///" + os.path.join(tmp, "carga.db"),
+        "FILA_DB_PATH": os.path.join(tmp, "fila.db"),
+        "METRICAS_DB_PATH": os.path.join(tmp, "metricas.db"),
+        "FILA_WORKERS": args.fila_workers,
+        "SENHA_METODO": args.senha_metodo,
+        "OPENAI_BASE_URL": base_url,
+    })
+    with app.app_context():
+        modulo.db.create_all()
+    class Silencioso(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    servidor = make_server("127.0.0.1", 0, app, threaded=True, request_handler=Silencioso)
+    threading.Thread(target=servidor.serve_forever, name="app", daemon=True).start()
+    return f"http://127.0.0.1:{servidor.server_port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0],
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="deploy já rodando (sem isso sobe o app neste processo)")
+    parser.add_argument("--jogadores", type=int, default=20)
+    parser.add_argument("--grupo", type=int, default=4, help="jogadores por aventura")
+    parser.add_argument("--turnos", type=int, default=5, help="turnos por jogador")
+    parser.add_argument("--pensar", type=float, default=0.5, help="pausa média entre turnos (s)")
+    parser.add_argument("--espera-job", type=float, default=0.2, help="intervalo do polling do job (s)")
+    parser.add_argument("--fila-workers", type=int, default=4, help="só sem --url")
+    parser.add_argument("--senha-metodo", default="pbkdf2:sha256:1000",
+                        help="custo do hash no app local (o padrão scrypt domina o cadastro)")
+    parser.add_argument("--porta-fake", type=int, default=0, help="porta da IA falsa (0 = livre)")
+    parser.add_argument("--sem-fake", action="store_true", help="não sobe a IA falsa (o deploy já aponta para uma)")
+    fake_openai.adicionar_argumentos(parser)
+    args = parser.parse_args()
+    random.seed(args.semente)
+
+    config_fake = None
+    if not args.sem_fake:
+        servidor_fake, config_fake = fake_openai.iniciar(args.porta_fake, **fake_openai.opcoes(args))
+        base_url = f"http://127.0.0.1:{servidor_fake.server_port}/v1"
+        print(f"IA falsa em {base_url}")
+    url = args.url or subir_app(args, base_url)
+    print(f"App em {url}: {args.jogadores} jogadores, grupos de {args.grupo}, {args.turnos} turnos cada")
+
+    resultados = Resultados()
+    prefixo = uuid.uuid4().hex[:6]
+    jogadores = [Jogador(url, resultados, f"j{prefixo}{i}") for i in range(args.jogadores)]
+    grupos = {}
+    for i, jogador in enumerate(jogadores):
+        grupo = grupos.setdefault(i // args.grupo, {"lider": jogador, "aventura_id": None,
+                                                     "pronta": threading.Event()})
+        jogador.grupo = grupo
+
+    # todos terminam a preparação antes de medir a vazão dos turnos
+    barreira = threading.Barrier(args.jogadores + 1)
+    threads = [threading.Thread(target=jogar, args=(j, j.grupo, args, barreira)) for j in jogadores]
+    inicio = time.perf_counter()
+    for t in threads:
+        t.start()
+    barreira.wait()
+    preparacao = time.perf_counter() - inicio
+    inicio_turnos = time.perf_counter()
+    for t in threads:
+        t.join()
+    duracao = time.perf_counter() - inicio
+
+    print()
+    print(resultados.relatorio(duracao))
+    turnos = resultados.latencias.get("turno completo", [])
+    ok = len(turnos) - resultados.erros.get("turno completo", 0)
+    print(f"\npreparação {preparacao:.1f}s; turnos concluídos: {ok}/{len(turnos)} em "
+          f"{time.perf_counter() - inicio_turnos:.1f}s = {ok / max(time.perf_counter() - inicio_turnos, 1e-9):.2f} turnos/s")
+    if config_fake:
+        print(f"IA falsa: {config_fake.chamadas} chamadas, {config_fake.erros} falhas injetadas")
+
+
+if __name__ == "__main__":
+    main()
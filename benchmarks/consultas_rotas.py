@@ -0,0 +1,115 @@
+# benchmarks/consultas_rotas.py
+"""Conta as consultas SQL das rotas quentes e aponta N+1.
+
+Sobe o app com um SQLite temporário, cria um usuário com várias aventuras,
+personagens, histórico e sessões, e passa pelas rotas do dia a dia
+(lista de aventuras, dashboard, histórico, envio de turno) dentro de um
+ContadorConsultas. Para cada rota imprime o total de consultas, o orçamento
+de CONSULTAS_ORCAMENTOS e as consultas repetidas. Sai com código 1 se alguma
+rota passar do orçamento ou tiver N+1 — dá para usar no CI.
+
+Uso: python benchmarks/consultas_rotas.py [--aventuras 10] [--personagens 6] [--mensagens 80] [-v]
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "x")
+
+import app as modulo  # noqa: E402
+from consultas import ContadorConsultas, OrcamentoExcedido  # noqa: E402
+from models import Aventura, HistoricoMensagens, Participacao, Personagem, Sessao, Usuario, db  # noqa: E402
+
+REGRAS = {"erro_critico_max": 15, "erro_normal_max": 49, "acerto_normal_max": 85, "acerto_critico_min": 100}
+
+
+def preparar(args):
+    tmp = tempfile.mkdtemp()
+    app = modulo.create_app({
+        "SQLALCHEMY_DATABASE_URI": "sqlite:///" + os.path.join(tmp, "consultas.db"),
+        "FILA_DB_PATH": os.path.join(tmp, "fila.db"),
+        "METRICAS_DB_PATH": os.path.join(tmp, "metricas.db"),
+        "SENHA_METODO": "pbkdf2:sha256:1000",
+        "WTF_CSRF_ENABLED": False,
+        "TESTING": True,
+    })
+    with app.app_context():
+        db.create_all()
+        u = Usuario(username="bench", email="bench@example.com")
+        modulo.definir_senha(u, "segredo1")
+        db.session.add(u)
+        db.session.flush()
+        aventuras = [Aventura(titulo=f"Aventura {i}", descricao="...", cenario="Floresta", status="ativa",
+                              regras=REGRAS, criador_id=u.id) for i in range(args.aventuras)]
+        personagens = [Personagem(nome=f"P{i}", classe="Mago", raca="Elfo", descricao="...",
+                                  atributos={"Força": 50, "Destreza": 50, "Inteligência": 50}, usuario_id=u.id)
+                       for i in range(args.personagens)]
+        db.session.add_all(aventuras + personagens)
+        db.session.flush()
+        aventura = aventuras[0]
+        db.session.add_all(Participacao(usuario_id=u.id, aventura_id=aventura.id, personagem_id=p.id, papel="Jogador")
+                           for p in personagens)
+        for i in range(args.mensagens):
+            db.session.add(HistoricoMensagens(usuario_id=u.id if i % 2 == 0 else None, aventura_id=aventura.id,
+                                              autor=personagens[i % len(personagens)].nome if i % 2 == 0 else "Mestre IA",
+                                              mensagem=f"Mensagem {i}"))
+            if i % 2:
+                db.session.add(Sessao(aventura_id=aventura.id, narrador_ia=f"Narração {i}",
+                                      acoes_jogadores=[f"Ação {i}"]))
+        db.session.commit()
+        ultima = HistoricoMensagens.query.order_by(HistoricoMensagens.id.desc()).first()
+        cursor = f"{ultima.criado_em.isoformat()}|{ultima.id}"
+        return app, aventura.id, [p.id for p in personagens], cursor
+
+
+def medir(app, nome, requisicao, verbose):
+    with ContadorConsultas(db.engine) as contador:
+        resposta = requisicao()
+    maximo = app.config["CONSULTAS_ORCAMENTOS"].get(nome)
+    try:
+        contador.verificar(maximo, nome, app.config["CONSULTAS_REPETICOES"])
+        situacao = "ok"
+    except OrcamentoExcedido:
+        situacao = "EXCEDIDO"
+    print(f"{nome:26s} {resposta.status_code:4d} {contador.total:4d} consultas "
+          f"(orçamento {maximo if maximo is not None else '-'})  {situacao}")
+    if situacao != "ok" or verbose:
+        print("  " + contador.relatorio(app.config["CONSULTAS_REPETICOES"]).replace("\n", "\n  "))
+        if verbose:
+            for sql in contador.consultas:
+                print("    " + " ".join(sql.split())[:160])
+    return situacao == "ok"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--aventuras", type=int, default=10)
+    parser.add_argument("--personagens", type=int, default=6)
+    parser.add_argument("--mensagens", type=int, default=80)
+    parser.add_argument("-v", "--verbose", action="store_true", help="lista todas as consultas")
+    args = parser.parse_args()
+
+    app, aventura_id, personagem_ids, cursor = preparar(args)
+    ok = True
+    with app.app_context(), app.test_client() as c:
+        resposta = c.post("/", data={"username": "bench", "password": "segredo1", "submit": "Entrar"})
+        assert resposta.status_code == 302, resposta.status_code
+        c.get(f"/aventuras/{aventura_id}/entrar/")
+
+        ok &= medir(app, "rpg.lista_aventuras", lambda: c.get("/aventuras/"), args.verbose)
+        ok &= medir(app, "rpg.dashboard", lambda: c.get("/dashboard"), args.verbose)
+        ok &= medir(app, "rpg.historico", lambda: c.get("/historico", query_string={"antes": cursor, "limite": 20}), args.verbose)
+        ok &= medir(app, "rpg.enviar_turno", lambda: c.post("/enviar_turno", data={
+            "acao": "Abro a porta",
+            "contexto": "",
+            **{f"personagem_{i}": "on" for i in personagem_ids[::2]},
+            "rolagens": '[{"personagem_id": %d, "tipo": "forca"}]' % personagem_ids[0],
+        }, headers={"X-Requested-With": "XMLHttpRequest"}), args.verbose)
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+# benchmarks/fake_openai.py
+"""Servidor local compatível com /v1/chat/completions da OpenAI, para testes de carga.
+
+Responde com texto sintético, com e sem stream (inclusive stream_options.include_usage),
+simulando a latência até o primeiro token, a velocidade de geração e falhas
+(429/500 numa fração configurável das chamadas). Nada sai da máquina e nenhum
+token é gasto. O app usa o servidor com OPENAI_BASE_URL=http://127.0.0.1:<porta>/v1.
+
+Uso: python benchmarks/fake_openai.py [--porta 8089] [--latencia 0.3] [--tokens-por-segundo 80]
+                                       [--tokens 120] [--taxa-erro 0.0]
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PALAVRAS = ("a", "taverna", "range", "sob", "o", "vento", "e", "os", "heróis", "avançam", "pela", "trilha",
+            "enquanto", "sombras", "antigas", "observam", "cada", "passo", "da", "companhia")
+
+
+class Config:
+    def __init__(self, latencia=0.3, tokens_por_segundo=80.0, tokens=120, taxa_erro=0.0, semente=None):
+        self.latencia = latencia  # segundos até o primeiro token
+        self.tokens_por_segundo = tokens_por_segundo  # 0 = instantâneo
+        self.tokens = tokens  # tamanho da resposta (limitado por max_tokens do pedido)
+        self.taxa_erro = taxa_erro  # fração das chamadas que falham (metade 429, metade 500)
+        self.random = random.Random(semente)
+        self.chamadas = 0
+        self.erros = 0
+        self._lock = threading.Lock()
+
+    def sortear_erro(self):
+        with self._lock:
+            self.chamadas += 1
+            if self.random.random() >= self.taxa_erro:
+                return None
+            self.erros += 1
+            return 429 if self.random.random() < 0.5 else 500
+
+
+def texto(n):
+    return [(" " if i else "") + PALAVRAS[i % len(PALAVRAS)] for i in range(n)]
+
+
+def contar_tokens_prompt(mensagens):
+    return sum(len(str(m.get("content", "")).split()) for m in mensagens)
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config = Config()
+
+    def log_message(self, formato, *args):
+        pass
+
+    def _json(self, status, corpo, headers=()):
+        dados = json.dumps(corpo).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(dados)))
+        for chave, valor in headers:
+            self.send_header(chave, valor)
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def do_POST(self):
+        pedido = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            return self._json(404, {"error": {"message": f"rota desconhecida: {self.path}"}})
+
+        config = self.config
+        erro = config.sortear_erro()
+        time.sleep(config.latencia)
+        if erro:
+            # Retry-After curto: o cliente da OpenAI respeita e tenta de novo
+            return self._json(erro, {"error": {"message": "falha simulada", "type": "fake", "code": erro}},
+                              headers=[("Retry-After", "0.1")])
+
+        n = min(config.tokens, pedido.get("max_tokens") or config.tokens)
+        partes = texto(n)
+        uso = {"prompt_tokens": contar_tokens_prompt(pedido.get("messages", [])),
+               "completion_tokens": n}
+        uso["total_tokens"] = uso["prompt_tokens"] + uso["completion_tokens"]
+        base = {"id": "chatcmpl-" + uuid.uuid4().hex, "created": int(time.time()),
+                "model": pedido.get("model", "fake")}
+        intervalo = 1 / config.tokens_por_segundo if config.tokens_por_segundo else 0
+
+        if not pedido.get("stream"):
+            time.sleep(intervalo * n)
+            return self._json(200, {**base, "object": "chat.completion", "usage": uso, "choices": [{
+                "index": 0, "finish_reason": "stop",
+                "message": {"role": "assistant", "content": "".join(partes)},
+            }]})
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        def enviar(corpo):
+            self.wfile.write(f"data: {json.dumps(corpo)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        chunk = {**base, "object": "chat.completion.chunk"}
+        enviar({**chunk, "choices": [{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}]})
+        for parte in partes:
+            time.sleep(intervalo)
+            enviar({**chunk, "choices": [{"index": 0, "delta": {"content": parte}, "finish_reason": None}]})
+        enviar({**chunk, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+        if (pedido.get("stream_options") or {}).get("include_usage"):
+            enviar({**chunk, "choices": [], "usage": uso})
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+def iniciar(porta=0, **opcoes):
+    """Sobe o servidor numa thread; devolve (servidor, config). A porta real está em servidor.server_port."""
+    config = Config(**opcoes)
+    handler = type("HandlerConfigurado", (Handler,), {"config": config})
+    servidor = ThreadingHTTPServer(("127.0.0.1", porta), handler)
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, name="fake-openai", daemon=True).start()
+    return servidor, config
+
+
+def adicionar_argumentos(parser):
+    parser.add_argument("--latencia", type=float, default=0.3, help="segundos até o primeiro token")
+    parser.add_argument("--tokens-por-segundo", type=float, default=80.0, help="0 = resposta instantânea")
+    parser.add_argument("--tokens", type=int, default=120, help="tokens por resposta")
+    parser.add_argument("--taxa-erro", type=float, default=0.0, help="fração das chamadas com 429/500")
+    parser.add_argument("--semente", type=int, default=None)
+
+
+def opcoes(args):
+    return {"latencia": args.latencia, "tokens_por_segundo": args.tokens_por_segundo,
+            "tokens": args.tokens, "taxa_erro": args.taxa_erro, "semente": args.semente}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--porta", type=int, default=8089)
+    adicionar_argumentos(parser)
+    args = parser.parse_args()
+    servidor, config = iniciar(args.porta, **opcoes(args))
+    print(f"OPENAI_BASE_URL=http://127.0.0.1:{servidor.server_port}/v1")
+    try:
+        while True:
+            time.sleep(10)
+            print(f"chamadas={config.chamadas} erros={config.erros}", flush=True)
+    except KeyboardInterrupt:
+        servidor.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+# cache.py
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# -------------------------
+# Cache em memória (por processo)
+# -------------------------
+# LRU com TTL, thread-safe, com contadores de acerto/erro. Cada worker do
+# gunicorn tem o seu; a invalidação explícita vale para o processo que fez a
+# escrita e o TTL limita por quanto tempo os outros podem ficar desatualizados.
+# Quando o TTL não basta (ex.: usuário desativado precisa cair já em todos os
+# workers), InvalidacoesCompartilhadas leva a invalidação aos outros processos.
+
+_AUSENTE = object()
+
+
+class CacheTTL:
+    def __init__(self, nome, max_itens=1024, ttl=60):
+        self.nome = nome
+        self.max_itens = max_itens
+        self.ttl = ttl
+        self.acertos = 0
+        self.erros = 0
+        self.invalidacoes = 0
+        self._dados = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obter(self, chave, padrao=None):
+        agora = time.monotonic()
+        with self._lock:
+            item = self._dados.get(chave, _AUSENTE)
+            if item is not _AUSENTE:
+                expira, valor = item
+                if expira > agora:
+                    self._dados.move_to_end(chave)
+                    self.acertos += 1
+                    return valor
+                del self._dados[chave]
+            self.erros += 1
+            return padrao
+
+    def guardar(self, chave, valor, ttl=None):
+        expira = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._dados[chave] = (expira, valor)
+            self._dados.move_to_end(chave)
+            while len(self._dados) > self.max_itens:
+                self._dados.popitem(last=False)
+
+    def invalidar(self, chave):
+        with self._lock:
+            if self._dados.pop(chave, _AUSENTE) is not _AUSENTE:
+                self.invalidacoes += 1
+
+    def invalidar_se(self, condicao):
+        """Remove todas as chaves para as quais condicao(chave) é verdadeira."""
+        with self._lock:
+            for chave in [c for c in self._dados if condicao(c)]:
+                del self._dados[chave]
+                self.invalidacoes += 1
+
+    def limpar(self):
+        with self._lock:
+            self._dados.clear()
+
+    def estatisticas(self):
+        with self._lock:
+            total = self.acertos + self.erros
+            return {
+                "nome": self.nome,
+                "itens": len(self._dados),
+                "acertos": self.acertos,
+                "erros": self.erros,
+                "invalidacoes": self.invalidacoes,
+                "taxa_acerto": round(self.acertos / total, 4) if total else 0.0,
+            }
+
+
+# -------------------------
+# Invalidação entre processos
+# -------------------------
+SCHEMA_INVALIDACOES = """
+CREATE TABLE IF NOT EXISTS invalidacoes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    chave TEXT NOT NULL,
+    criado_em REAL NOT NULL
+);
+"""
+
+
+class InvalidacoesCompartilhadas:
+    """Log de chaves invalidadas num SQLite compartilhado pelos workers.
+
+    publicar(chave) grava a chave; aplicar() (chamado antes de cada leitura do
+    cache) remove do cache local as chaves publicadas pelos outros processos. O
+    arquivo só é consultado uma vez a cada `intervalo` segundos por processo; nas
+    outras chamadas aplicar() não faz nada. Uma escrita em outro worker leva,
+    portanto, até `intervalo` segundos para valer aqui (no próprio processo vale
+    na hora). Sem caminho configurado (um processo só), as duas são no-op.
+    """
+
+    def __init__(self, cache, caminho=None, intervalo=1.0, retencao=3600, converter=str):
+        self.cache = cache
+        self.caminho = caminho
+        self.intervalo = intervalo
+        self.retencao = retencao  # bem maior que o TTL do cache: depois disso a entrada já expirou
+        self.converter = converter  # texto gravado -> chave do cache
+        self._ultimo = None
+        self._proxima = 0.0  # time.monotonic() da próxima leitura do arquivo
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _conexao(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.caminho, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA_INVALIDACOES)
+            self._local.conn = conn
+        return conn
+
+    def publicar(self, chave):
+        self.cache.invalidar(chave)
+        if not self.caminho:
+            return
+        conn = self._conexao()
+        agora = time.time()
+        conn.execute("INSERT INTO invalidacoes (chave, criado_em) VALUES (?, ?)", (str(chave), agora))
+        conn.execute("DELETE FROM invalidacoes WHERE criado_em < ?", (agora - self.retencao,))
+
+    def aplicar(self):
+        if not self.caminho or time.monotonic() < self._proxima:
+            return
+        conn = self._conexao()
+        with self._lock:
+            agora = time.monotonic()
+            if agora < self._proxima:
+                return  # outra thread acabou de ler
+            self._proxima = agora + self.intervalo
+            if self._ultimo is None:
+                # o cache deste processo nasceu vazio: o que veio antes não importa
+                self._ultimo = conn.execute("SELECT COALESCE(MAX(id), 0) FROM invalidacoes").fetchone()[0]
+                return
+            linhas = conn.execute(
+                "SELECT id, chave FROM invalidacoes WHERE id > ? ORDER BY id", (self._ultimo,)
+            ).fetchall()
+            if linhas:
+                self._ultimo = linhas[-1][0]
+        for _, chave in linhas:
+            self.cache.invalidar(self.converter(chave))
@@ -0,0 +1,94 @@
+# consultas.py
+import re
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+# -------------------------
+# Contagem de consultas / detecção de N+1
+# -------------------------
+# ContadorConsultas registra o SQL emitido enquanto está ativo, só na thread
+# que o ativou (um único listener por engine repassa para os contadores
+# ativos). O mesmo SQL repetido com parâmetros diferentes dentro de uma
+# requisição é o padrão típico de N+1 (lazy load dentro de um loop).
+#
+# Uso em teste:
+#     with limite_consultas(db.engine, 8) as contador:
+#         client.get("/dashboard")
+# Uso por requisição: CONSULTAS_ORCAMENTOS = {"rpg.dashboard": 8, ...} e
+# CONSULTAS_MODO = "log" (avisa) ou "erro" (levanta OrcamentoExcedido).
+
+_NUMEROS = re.compile(r"\b\d+\b")
+_ESPACOS = re.compile(r"\s+")
+
+
+class OrcamentoExcedido(AssertionError):
+    pass
+
+
+def normalizar(sql):
+    """SQL sem literais numéricos e com espaços colapsados (agrupa repetições)."""
+    return _ESPACOS.sub(" ", _NUMEROS.sub("?", sql)).strip()
+
+
+_local = threading.local()
+
+
+def _registrar(conn, cursor, statement, parameters, context, executemany):
+    for contador in getattr(_local, "ativos", ()):
+        contador.consultas.append(statement)
+
+
+def instalar(engine):
+    """Liga o listener (uma vez por engine); os contadores ativos na thread recebem o SQL."""
+    if not event.contains(engine, "before_cursor_execute", _registrar):
+        event.listen(engine, "before_cursor_execute", _registrar)
+
+
+class ContadorConsultas:
+    def __init__(self, engine=None):
+        if engine is not None:
+            instalar(engine)
+        self.consultas = []
+
+    def __enter__(self):
+        _local.ativos = getattr(_local, "ativos", ()) + (self,)
+        return self
+
+    def __exit__(self, *exc):
+        _local.ativos = tuple(c for c in _local.ativos if c is not self)
+
+    @property
+    def total(self):
+        return len(self.consultas)
+
+    def repetidas(self, minimo=3):
+        """{sql normalizado: vezes} das consultas emitidas `minimo` vezes ou mais."""
+        contagem = Counter(normalizar(sql) for sql in self.consultas)
+        return {sql: n for sql, n in contagem.most_common() if n >= minimo}
+
+    def relatorio(self, minimo=3):
+        linhas = [f"{self.total} consulta(s)"]
+        for sql, n in self.repetidas(minimo).items():
+            linhas.append(f"  N+1? {n}x {sql[:160]}")
+        return "\n".join(linhas)
+
+    def verificar(self, maximo, nome="", minimo_repeticoes=3):
+        """Levanta OrcamentoExcedido se passar de `maximo` ou houver SQL repetido."""
+        problemas = []
+        if maximo is not None and self.total > maximo:
+            problemas.append(f"{self.total} consultas (máximo {maximo})")
+        if self.repetidas(minimo_repeticoes):
+            problemas.append("consultas repetidas (N+1)")
+        if problemas:
+            raise OrcamentoExcedido(f"{nome}: {', '.join(problemas)}\n{self.relatorio(minimo_repeticoes)}")
+
+
+@contextmanager
+def limite_consultas(engine, maximo, nome="", minimo_repeticoes=3):
+    """Context manager para testes: falha se o bloco passar do orçamento ou tiver N+1."""
+    with ContadorConsultas(engine) as contador:
+        yield contador
+    contador.verificar(maximo, nome, minimo_repeticoes)
@@ -0,0 +1,176 @@
+# correio.py
+import heapq
+import itertools
+import random
+import smtplib
+import socket
+import threading
+import time
+
+# -------------------------
+# Fila de e-mails (envio em segundo plano)
+# -------------------------
+# A rota só enfileira a mensagem e responde; uma thread por processo envia,
+# reaproveitando a mesma conexão SMTP autenticada (Connection do Flask-Mail)
+# enquanto houver mensagens. Falhas transitórias voltam para a fila com
+# backoff exponencial + jitter; a conexão ociosa é fechada após um tempo.
+# A fila é em memória: mensagens pendentes se perdem se o processo cair
+# (para recuperação de senha basta o usuário pedir de novo).
+
+
+class FilaCheia(Exception):
+    pass
+
+
+# Erros que não adianta repetir (destinatário/remetente recusado, mensagem inválida)
+ERROS_PERMANENTES = (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused,
+                     smtplib.SMTPNotSupportedError, AssertionError)
+
+
+def erro_transitorio(erro):
+    if isinstance(erro, ERROS_PERMANENTES):
+        return False
+    if isinstance(erro, smtplib.SMTPResponseException):
+        return 400 <= erro.smtp_code < 500
+    return isinstance(erro, (smtplib.SMTPException, OSError, socket.timeout))
+
+
+class FilaEmails:
+    def __init__(self, mail=None, max_itens=1000, tentativas=5, backoff=1.0, ocioso=30):
+        self.mail = mail
+        self.max_itens = max_itens
+        self.tentativas = tentativas
+        self.backoff = backoff  # espera base entre tentativas (dobra a cada falha)
+        self.ocioso = ocioso  # conexão sem uso por esse tempo é fechada
+        self.app = None
+        self.enviados = 0
+        self.falhas = 0
+        self.conexoes = 0
+        self._heap = []  # (quando, seq, tentativa, mensagem)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._parar = False
+        self._conexao = None
+        self._ultimo_uso = 0.0
+
+    def init_app(self, app, mail):
+        self.app = app
+        self.mail = mail
+        self.max_itens = int(app.config.get("MAIL_FILA_MAX", self.max_itens))
+        self.tentativas = int(app.config.get("MAIL_TENTATIVAS", self.tentativas))
+        self.backoff = float(app.config.get("MAIL_BACKOFF", self.backoff))
+        self.ocioso = float(app.config.get("MAIL_OCIOSO", self.ocioso))
+        app.extensions["fila_emails"] = self
+
+    # -------------------------
+    # API
+    # -------------------------
+    def iniciar(self):
+        """Sobe a thread de envio (idempotente, por processo)."""
+        with self._cond:
+            if self._thread is not None:
+                return
+            self._parar = False
+            self._thread = threading.Thread(target=self._loop, name="fila-emails", daemon=True)
+            self._thread.start()
+
+    def parar(self, esperar=True, timeout=30):
+        """Encerra a thread; com esperar=True, envia antes o que já está na fila."""
+        with self._cond:
+            if self._thread is None:
+                return
+            if esperar:
+                self._cond.wait_for(lambda: not self._heap, timeout=timeout)
+            self._parar = True
+            self._cond.notify_all()
+        self._thread.join(timeout=5)
+        self._thread = None
+
+    def enviar(self, mensagem):
+        """Enfileira um flask_mail.Message; levanta FilaCheia se a fila estiver no limite."""
+        self.iniciar()
+        with self._cond:
+            if len(self._heap) >= self.max_itens:
+                raise FilaCheia("Fila de e-mails cheia")
+            heapq.heappush(self._heap, (time.monotonic(), next(self._seq), 1, mensagem))
+            self._cond.notify()
+
+    def estatisticas(self):
+        with self._cond:
+            return {
+                "pendentes": len(self._heap),
+                "enviados": self.enviados,
+                "falhas": self.falhas,
+                "conexoes": self.conexoes,
+            }
+
+    # -------------------------
+    # Envio
+    # -------------------------
+    def _proximo(self):
+        """Espera a próxima mensagem vencida (ou None ao parar/ficar ocioso)."""
+        with self._cond:
+            while not self._parar:
+                agora = time.monotonic()
+                if self._heap and self._heap[0][0] <= agora:
+                    return heapq.heappop(self._heap)
+                espera = self._heap[0][0] - agora if self._heap else None
+                if self._conexao is not None:
+                    limite_ocioso = self._ultimo_uso + self.ocioso - agora
+                    if limite_ocioso <= 0:
+                        return None  # o loop fecha a conexão ociosa
+                    espera = limite_ocioso if espera is None else min(espera, limite_ocioso)
+                self._cond.wait(espera)
+            return None
+
+    def _conectar(self):
+        if self._conexao is None:
+            self._conexao = self.mail.connect()
+            self._conexao.__enter__()
+            self.conexoes += 1
+        return self._conexao
+
+    def _desconectar(self):
+        if self._conexao is not None:
+            try:
+                self._conexao.__exit__(None, None, None)
+            except Exception:
+                pass  # conexão já caída: só descarta
+            self._conexao = None
+
+    def _loop(self):
+        with self.app.app_context():
+            while True:
+                item = self._proximo()
+                if item is None:
+                    self._desconectar()
+                    with self._cond:
+                        if self._parar:
+                            return
+                    continue
+                self._enviar_um(*item)
+
+    def _enviar_um(self, quando, seq, tentativa, mensagem):
+        try:
+            self._conectar().send(mensagem)
+            self._ultimo_uso = time.monotonic()
+            with self._cond:
+                self.enviados += 1
+                self._cond.notify_all()
+        except Exception as e:
+            # resposta de erro do servidor mantém a sessão utilizável; qualquer outra
+            # falha pode ter deixado a conexão num estado ruim e a próxima tentativa reconecta
+            if not isinstance(e, smtplib.SMTPResponseException):
+                self._desconectar()
+            with self._cond:
+                if tentativa < self.tentativas and erro_transitorio(e):
+                    espera = self.backoff * 2 ** (tentativa - 1) * random.uniform(0.5, 1.5)
+                    heapq.heappush(self._heap, (time.monotonic() + espera, seq, tentativa + 1, mensagem))
+                    self.app.logger.warning("Falha enviando e-mail (tentativa %s), nova tentativa em %.1fs: %s",
+                                            tentativa, espera, e)
+                else:
+                    self.falhas += 1
+                    self.app.logger.error("E-mail para %s descartado após %s tentativa(s): %s",
+                                          mensagem.recipients, tentativa, e)
+                self._cond.notify_all()
@@ -0,0 +1,164 @@
+# dados.py
+import secrets
+from functools import lru_cache
+
+import numpy as np
+
+# -------------------------
+# Motor de dados (servidor)
+# -------------------------
+# As rolagens de uma rodada são resolvidas aqui, em lote e vetorizadas:
+# d100 + bônus do atributo ((atributo - 50) // 2), limitado a 1..100, e a faixa
+# de resultado vem dos limites em Aventura.regras. Cada rodada usa um gerador
+# PCG64 com semente própria; semente + entradas ficam registradas na Sessao,
+# então qualquer rodada pode ser reproduzida numa auditoria.
+
+TIPOS = {"forca": "Força", "destreza": "Destreza", "inteligencia": "Inteligência"}
+
+RESULTADOS = ("💀 Falha Crítica", "❌ Falha", "✅ Sucesso", "🌟 Sucesso Crítico")
+
+REGRAS_PADRAO = {"erro_critico_max": 15, "erro_normal_max": 49, "acerto_normal_max": 85}
+
+
+def limites(regras):
+    """Limites superiores (inclusivos) de falha crítica, falha e sucesso."""
+    regras = regras or {}
+    return np.array([
+        int(regras.get(chave) or padrao) for chave, padrao in REGRAS_PADRAO.items()
+    ], dtype=np.int64)
+
+
+def validar_limites(valores):
+    """Confere uma tupla (erro_critico_max, erro_normal_max, acerto_normal_max).
+
+    Os limites precisam estar em 1..100 e em ordem não decrescente (limites
+    iguais deixam a faixa entre eles vazia); levanta ValueError.
+    """
+    valores = tuple(int(v) for v in valores)
+    if len(valores) != len(REGRAS_PADRAO):
+        raise ValueError("São necessários três limites")
+    if not all(1 <= v <= 100 for v in valores):
+        raise ValueError("Os limites devem estar entre 1 e 100")
+    if not all(a <= b for a, b in zip(valores, valores[1:])):
+        raise ValueError("Os limites não podem diminuir")
+    return valores
+
+
+def nova_semente():
+    return secrets.randbits(63)
+
+
+def rolar_vetor(atributos, limites_regras, rng):
+    """Rola len(atributos) dados de uma vez.
+
+    Devolve arrays (base, bonus, final, faixa); faixa indexa RESULTADOS.
+    """
+    atributos = np.asarray(atributos, dtype=np.int64)
+    base = rng.integers(1, 101, size=atributos.shape, dtype=np.int64)
+    bonus = (atributos - 50) // 2  # divisão inteira com piso, igual ao Math.floor do front antigo
+    final = np.clip(base + bonus, 1, 100)
+    faixa = np.searchsorted(limites_regras, final, side="left")
+    return base, bonus, final, faixa
+
+
+def resolver_rodada(pedidos, personagens, regras, semente=None):
+    """Resolve todas as rolagens pedidas numa rodada.
+
+    pedidos: [{"personagem_id", "tipo"}] (tipo em TIPOS); pedidos inválidos são ignorados.
+    personagens: {id: objeto com .nome e .atributos}.
+    Devolve o registro da rodada: {"semente", "limites", "itens": [...]}.
+    """
+    validos = []
+    for pedido in pedidos or []:
+        try:
+            personagem = personagens.get(int(pedido.get("personagem_id")))
+        except (TypeError, ValueError):
+            continue
+        tipo = pedido.get("tipo")
+        if personagem is None or tipo not in TIPOS:
+            continue
+        atributo = (personagem.atributos or {}).get(TIPOS[tipo], 50)
+        validos.append((personagem, tipo, int(atributo)))
+
+    semente = nova_semente() if semente is None else semente
+    limites_regras = limites(regras)
+    registro = {"semente": semente, "limites": limites_regras.tolist(), "itens": []}
+    if not validos:
+        return registro
+
+    rng = np.random.default_rng(semente)
+    base, bonus, final, faixa = rolar_vetor([v[2] for v in validos], limites_regras, rng)
+
+    for i, (personagem, tipo, atributo) in enumerate(validos):
+        registro["itens"].append({
+            "personagem_id": personagem.id,
+            "personagem_nome": personagem.nome,
+            "tipo": tipo,
+            "atributo": atributo,
+            "base": int(base[i]),
+            "bonus": int(bonus[i]),
+            "valor": int(final[i]),
+            "resultado": RESULTADOS[int(faixa[i])],
+        })
+    return registro
+
+
+def reproduzir(registro):
+    """Refaz a rodada a partir da semente e das entradas; True se bate com o registrado."""
+    itens = registro.get("itens") or []
+    if not itens:
+        return True
+    rng = np.random.default_rng(registro["semente"])
+    _, _, final, faixa = rolar_vetor(
+        [i["atributo"] for i in itens], np.asarray(registro["limites"], dtype=np.int64), rng
+    )
+    return all(
+        int(final[n]) == item["valor"] and RESULTADOS[int(faixa[n])] == item["resultado"]
+        for n, item in enumerate(itens)
+    )
+
+
+def descrever(registro):
+    """Linhas de texto das rolagens (prompt e mensagem do jogador)."""
+    return [
+        f"- {i['personagem_nome']} | {i['tipo']} => {i['valor']} ({i['resultado']})"
+        for i in registro.get("itens") or []
+    ]
+
+
+# -------------------------
+# Probabilidades por atributo
+# -------------------------
+# Com d100 uniforme, a distribuição é exata: cada atributo 1..99 tem 100 faces
+# igualmente prováveis, então basta enumerar a matriz 99x100 (vetorizada) em
+# vez de simular. O resultado só depende dos limites, e é cacheado por tupla.
+
+ATRIBUTOS = np.arange(1, 100, dtype=np.int64)
+FACES = np.arange(1, 101, dtype=np.int64)
+
+
+@lru_cache(maxsize=256)
+def _tabela(limites_regras):
+    bonus = (ATRIBUTOS - 50) // 2
+    final = np.clip(FACES[None, :] + bonus[:, None], 1, 100)
+    faixa = np.searchsorted(np.asarray(limites_regras, dtype=np.int64), final, side="left")
+    contagens = (faixa[:, :, None] == np.arange(len(RESULTADOS))).sum(axis=1)
+    return tuple(
+        (int(a), int(b), tuple(round(c / len(FACES), 4) for c in linha.tolist()))
+        for a, b, linha in zip(ATRIBUTOS, bonus, contagens)
+    )
+
+
+def distribuicao(limites_regras):
+    """Probabilidade de cada resultado para todos os atributos 1..99.
+
+    limites_regras: tupla já validada (ver validar_limites).
+    """
+    return {
+        "limites": list(limites_regras),
+        "resultados": list(RESULTADOS),
+        "atributos": [
+            {"atributo": a, "bonus": b, "probabilidades": list(p)}
+            for a, b, p in _tabela(tuple(limites_regras))
+        ],
+    }
@@ -0,0 +1,355 @@
+# fila.py
+import json
+import sqlite3
+from contextlib import closing
+import threading
+import time
+import uuid
+
+# -------------------------
+# Fila de jobs (SQLite)
+# -------------------------
+# Tira as chamadas à IA de dentro da requisição HTTP: a rota enfileira um job
+# e devolve o id na hora; um pool de threads executa o job e grava o resultado.
+# O arquivo SQLite é compartilhado entre os workers do gunicorn, então qualquer
+# processo pode pegar o job e qualquer processo pode responder o status.
+#
+# Um job pode ficar para depois (`atraso`, adiantável com antecipar()) e pode
+# ter um `grupo`: jobs do mesmo grupo rodam um de cada vez, em qualquer
+# processo (as escritas de uma aventura não se cruzam).
+#
+# Enquanto um job está "executando", o processo dono renova atualizado_em a
+# cada timeout/4 segundos (thread de batimentos). Só um job sem batimento há
+# mais de `timeout` segundos (processo morto) volta para a fila; um job vivo,
+# por mais que demore (fila do narrador, tentativas com backoff), não roda duas vezes.
+
+PENDENTE = "pendente"
+EXECUTANDO = "executando"
+CONCLUIDO = "concluido"
+ERRO = "erro"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    tipo TEXT NOT NULL,
+    usuario_id INTEGER,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    parcial TEXT NOT NULL DEFAULT '',
+    resultado TEXT,
+    erro TEXT,
+    criado_em REAL NOT NULL,
+    atualizado_em REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_jobs_status_criado ON jobs (status, criado_em);
+"""
+
+# Chave de idempotência (opcional) por usuário: reenvios com a mesma chave
+# recebem o mesmo job, em andamento ou já concluído. Um job que terminou em
+# erro não segura a chave: o reenvio cria um job novo (é assim que o jogador
+# tenta de novo). Jobs sem usuário (rodada, resumo) usam a chave sozinha: no
+# índice, usuario_id NULL vira 0 (no SQLite, NULLs não colidem num índice único).
+SCHEMA_CHAVE = """
+DROP INDEX IF EXISTS ux_jobs_usuario_chave;
+DELETE FROM jobs WHERE chave IS NOT NULL AND usuario_id IS NULL AND rowid NOT IN
+    (SELECT MIN(rowid) FROM jobs WHERE chave IS NOT NULL AND usuario_id IS NULL GROUP BY chave);
+CREATE UNIQUE INDEX IF NOT EXISTS ux_jobs_usuario_chave_v2 ON jobs (IFNULL(usuario_id, 0), chave);
+"""
+
+# Colunas acrescentadas depois da primeira versão (arquivos antigos ganham no _preparar)
+COLUNAS_NOVAS = {
+    "chave": "TEXT",
+    "disponivel_em": "REAL NOT NULL DEFAULT 0",  # job só pode ser pego a partir daqui
+    "grupo": "TEXT",
+}
+
+
+class FilaJobs:
+    def __init__(self, caminho="fila_jobs.sqlite3", workers=4, intervalo=0.5, timeout=300, retencao=86400):
+        self.caminho = caminho
+        self.workers = workers
+        self.intervalo = intervalo  # polling para jobs enfileirados por outros processos
+        self.timeout = timeout  # job "executando" sem batimento há mais tempo que isso é considerado órfão
+        self.retencao = retencao  # jobs finalizados (e seus resultados) ficam disponíveis por esse tempo
+        self.handlers = {}
+        self.app = None
+        self._threads = []
+        self._executando = set()  # ids executando neste processo (renovados pelos batimentos)
+        self._lock = threading.Lock()
+        self._acordar = threading.Event()
+        self._parar = threading.Event()
+
+    def init_app(self, app):
+        self.app = app
+        self.caminho = app.config.get("FILA_DB_PATH", self.caminho)
+        self.workers = int(app.config.get("FILA_WORKERS", self.workers))
+        self.retencao = int(app.config.get("FILA_RETENCAO", self.retencao))
+        app.extensions["fila"] = self
+
+    def registrar(self, tipo):
+        """Decorator: registra a função que executa jobs do tipo dado.
+
+        A função recebe (payload, progresso) e devolve um dict serializável;
+        progresso(texto) grava o texto parcial visível no status do job.
+        """
+        def decorator(func):
+            self.handlers[tipo] = func
+            return func
+        return decorator
+
+    # -------------------------
+    # SQLite
+    # -------------------------
+    def _conectar(self):
+        conn = sqlite3.connect(self.caminho, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _preparar(self):
+        with closing(self._conectar()) as conn:
+            conn.executescript(SCHEMA)
+            colunas = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for coluna, tipo in COLUNAS_NOVAS.items():
+                if coluna not in colunas:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {coluna} {tipo}")
+            if conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'ux_jobs_usuario_chave_v2'"
+            ).fetchone() is None:
+                conn.executescript(SCHEMA_CHAVE)
+            self._limpar(conn)
+
+    def _limpar(self, conn):
+        # Jobs presos em "executando" sem batimento (processo morreu no meio) voltam para a fila
+        conn.execute(
+            "UPDATE jobs SET status = ?, atualizado_em = ? WHERE status = ? AND atualizado_em < ?",
+            (PENDENTE, time.time(), EXECUTANDO, time.time() - self.timeout),
+        )
+        # Limpa jobs finalizados fora da janela de retenção (libera também as chaves)
+        conn.execute(
+            "DELETE FROM jobs WHERE status IN (?, ?) AND atualizado_em < ?",
+            (CONCLUIDO, ERRO, time.time() - self.retencao),
+        )
+
+    # -------------------------
+    # API
+    # -------------------------
+    def iniciar(self):
+        """Cria a tabela e sobe o pool de workers (idempotente, por processo)."""
+        with self._lock:
+            if self._threads:
+                return
+            self._preparar()
+            for i in range(self.workers):
+                t = threading.Thread(target=self._loop, name=f"fila-worker-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+            t = threading.Thread(target=self._batimentos, name="fila-batimentos", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def parar(self):
+        self._parar.set()
+        self._acordar.set()
+        for t in self._threads:
+            t.join(timeout=5)
+        self._threads = []
+        self._parar.clear()
+
+    def enfileirar(self, tipo, payload, usuario_id=None, chave=None, grupo=None, atraso=0):
+        """Cria o job e devolve o id.
+
+        Com `chave`, um job já existente do mesmo usuário com a mesma chave é
+        reaproveitado (INSERT OR IGNORE no índice único) e o id dele é devolvido;
+        se esse job terminou em erro, ele é apagado e o novo toma o lugar.
+        Com `atraso`, o job só é executado depois de tantos segundos (ou de antecipar()).
+        """
+        job_id = self._inserir(tipo, payload, usuario_id, chave, grupo, PENDENTE, atraso)
+        self._acordar.set()
+        return job_id
+
+    def registrar_externo(self, tipo, payload, usuario_id=None, chave=None):
+        """Job executado fora dos workers (ex.: turno em stream na própria requisição).
+
+        Nasce "executando" (os workers só pegam pendentes), então a chave de
+        idempotência vale como em enfileirar(). Devolve (job_id, novo): novo=False
+        se a chave já era de outro job. Quem criou termina com finalizar(); se o
+        processo morrer antes, _limpar devolve o job à fila e o handler do tipo
+        decide o que fazer (em geral, falhar).
+        """
+        job_id = uuid.uuid4().hex
+        criado_id = self._inserir(tipo, payload, usuario_id, chave, None, EXECUTANDO, 0, job_id)
+        novo = criado_id == job_id
+        if novo:
+            with self._lock:
+                self._executando.add(job_id)
+        return criado_id, novo
+
+    def finalizar(self, job_id, resultado=None, erro=None):
+        """Conclui (ou, com `erro`, falha) um job de registrar_externo()."""
+        with self._lock:
+            self._executando.discard(job_id)
+        with closing(self._conectar()) as conn:
+            self._finalizar(conn, job_id, ERRO if erro else CONCLUIDO, resultado=resultado, erro=erro)
+
+    def _inserir(self, tipo, payload, usuario_id, chave, grupo, status, atraso, job_id=None):
+        if tipo not in self.handlers:
+            raise ValueError(f"Tipo de job desconhecido: {tipo}")
+        self.iniciar()
+        job_id = job_id or uuid.uuid4().hex
+        agora = time.time()
+        with closing(self._conectar()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            if chave is not None:
+                conn.execute(
+                    "DELETE FROM jobs WHERE IFNULL(usuario_id, 0) = IFNULL(?, 0) AND chave = ? AND status = ?",
+                    (usuario_id, chave, ERRO),
+                )
+            conn.execute(
+                "INSERT OR IGNORE INTO jobs (id, tipo, usuario_id, chave, grupo, payload, status, criado_em, "
+                "atualizado_em, disponivel_em) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, tipo, usuario_id, chave, grupo, json.dumps(payload, ensure_ascii=False), status,
+                 agora, agora, agora + atraso),
+            )
+            if chave is not None:
+                job_id = conn.execute(
+                    "SELECT id FROM jobs WHERE IFNULL(usuario_id, 0) = IFNULL(?, 0) AND chave = ?", (usuario_id, chave)
+                ).fetchone()["id"]
+            conn.execute("COMMIT")
+        return job_id
+
+    def antecipar(self, job_id):
+        """Libera já um job enfileirado com atraso (sem efeito se ele já saiu da fila)."""
+        with closing(self._conectar()) as conn:
+            conn.execute(
+                "UPDATE jobs SET disponivel_em = ? WHERE id = ? AND status = ? AND disponivel_em > ?",
+                (time.time(), job_id, PENDENTE, time.time()),
+            )
+        self._acordar.set()
+
+    def buscar_por_chave(self, usuario_id, chave):
+        """Id do job pendente, executando ou concluído com esta chave de idempotência (ou None)."""
+        if not chave:
+            return None
+        self.iniciar()
+        with closing(self._conectar()) as conn:
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE IFNULL(usuario_id, 0) = IFNULL(?, 0) AND chave = ? AND status != ?",
+                (usuario_id, chave, ERRO),
+            ).fetchone()
+        return row["id"] if row else None
+
+    def status(self, job_id):
+        """Devolve o job como dict (sem o payload) ou None se não existir."""
+        with closing(self._conectar()) as conn:
+            row = conn.execute(
+                "SELECT id, tipo, usuario_id, grupo, status, parcial, resultado, erro FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["resultado"] = json.loads(job["resultado"]) if job["resultado"] else None
+        return job
+
+    # -------------------------
+    # Workers
+    # -------------------------
+    def _reservar(self, conn):
+        """Pega o job disponível mais antigo de forma atômica entre processos.
+
+        Pula jobs cujo grupo já tem outro job executando.
+        """
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT id, tipo, payload FROM jobs WHERE status = ? AND disponivel_em <= ? "
+                "AND (grupo IS NULL OR grupo NOT IN "
+                "(SELECT grupo FROM jobs WHERE status = ? AND grupo IS NOT NULL)) "
+                "ORDER BY criado_em LIMIT 1",
+                (PENDENTE, time.time(), EXECUTANDO),
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE jobs SET status = ?, atualizado_em = ? WHERE id = ?",
+                    (EXECUTANDO, time.time(), row["id"]),
+                )
+            conn.execute("COMMIT")
+            return row
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _finalizar(self, conn, job_id, status, resultado=None, erro=None):
+        conn.execute(
+            "UPDATE jobs SET status = ?, resultado = ?, erro = ?, atualizado_em = ? WHERE id = ?",
+            (status, json.dumps(resultado, ensure_ascii=False) if resultado is not None else None,
+             erro, time.time(), job_id),
+        )
+
+    def _loop(self):
+        conn = self._conectar()
+        ultima_limpeza = time.monotonic()
+        while not self._parar.is_set():
+            try:
+                row = self._reservar(conn)
+            except sqlite3.OperationalError:
+                row = None
+            if row is None:
+                if time.monotonic() - ultima_limpeza > 60:
+                    try:
+                        self._limpar(conn)
+                    except sqlite3.OperationalError:
+                        pass
+                    ultima_limpeza = time.monotonic()
+                self._acordar.wait(self.intervalo)
+                self._acordar.clear()
+                continue
+            self._executar(conn, row)
+            self._acordar.set()  # outro job do mesmo grupo pode ter ficado liberado
+        conn.close()
+
+    def _batimentos(self):
+        conn = self._conectar()
+        while not self._parar.wait(self.timeout / 4):
+            with self._lock:
+                ids = list(self._executando)
+            if not ids:
+                continue
+            try:
+                conn.execute(
+                    f"UPDATE jobs SET atualizado_em = ? WHERE status = ? AND id IN ({','.join('?' * len(ids))})",
+                    (time.time(), EXECUTANDO, *ids),
+                )
+            except sqlite3.OperationalError:
+                pass  # tenta de novo no próximo batimento, bem antes do timeout
+        conn.close()
+
+    def _executar(self, conn, row):
+        job_id = row["id"]
+
+        def progresso(texto):
+            conn.execute(
+                "UPDATE jobs SET parcial = ?, atualizado_em = ? WHERE id = ?",
+                (texto, time.time(), job_id),
+            )
+
+        with self._lock:
+            self._executando.add(job_id)
+        try:
+            handler = self.handlers[row["tipo"]]
+            payload = json.loads(row["payload"])
+            if self.app is not None:
+                with self.app.app_context():
+                    resultado = handler(payload, progresso)
+            else:
+                resultado = handler(payload, progresso)
+            self._finalizar(conn, job_id, CONCLUIDO, resultado=resultado)
+        except Exception as e:
+            if self.app is not None:
+                self.app.logger.exception("Erro executando job %s (%s)", job_id, row["tipo"])
+            self._finalizar(conn, job_id, ERRO, erro=str(e))
+        finally:
+            with self._lock:
+                self._executando.discard(job_id)
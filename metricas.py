@@ -0,0 +1,238 @@
+# metricas.py
+import atexit
+import json
+import sqlite3
+import threading
+import time
+from contextlib import closing, contextmanager
+
+# -------------------------
+# Métricas (formato texto do Prometheus)
+# -------------------------
+# Cada processo acumula contadores e histogramas em memória e, a cada
+# `intervalo` segundos, soma o acumulado num arquivo SQLite compartilhado
+# (UPSERT com valor = valor + delta). O /metrics de qualquer worker lê o
+# arquivo, então o scrape enxerga o total de todos os workers do gunicorn.
+#
+# A medição da requisição/job em andamento fica num thread-local: as fases
+# (db, llm, render, json) somam tempo nela e são observadas no final.
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+DEFINICOES = {
+    "rpg_requisicao_segundos": ("histogram", "Latência por rota (requisição HTTP ou job da fila)."),
+    "rpg_fase_segundos": ("histogram", "Tempo gasto em cada fase (db, llm, render, json) por rota."),
+    "rpg_db_consultas_total": ("counter", "Consultas SQL executadas, por rota."),
+    "rpg_llm_chamadas_total": ("counter", "Chamadas à IA, por rota e status."),
+    "rpg_llm_tokens_total": ("counter", "Tokens da IA (prompt/completion), por rota."),
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS metricas (
+    nome TEXT NOT NULL,
+    rotulos TEXT NOT NULL,
+    campo TEXT NOT NULL,
+    valor REAL NOT NULL,
+    PRIMARY KEY (nome, rotulos, campo)
+);
+"""
+
+FASES = ("db", "llm", "render", "json")
+
+
+class Medicao:
+    def __init__(self, rota):
+        self.rota = rota
+        self.inicio = time.perf_counter()
+        self.fases = dict.fromkeys(FASES, 0.0)
+        self.consultas = 0
+
+
+class Metricas:
+    def __init__(self, caminho="metricas.sqlite3", intervalo=5.0):
+        self.caminho = caminho
+        self.intervalo = intervalo
+        self._pendente = {}  # (nome, rotulos_json, campo) -> delta
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._ultimo_envio = time.monotonic()
+        self._preparado = False
+
+    def init_app(self, app):
+        self.caminho = app.config.get("METRICAS_DB_PATH", self.caminho)
+        self.intervalo = float(app.config.get("METRICAS_INTERVALO", self.intervalo))
+        app.extensions["metricas"] = self
+        atexit.register(self.enviar)
+
+    # -------------------------
+    # Registro
+    # -------------------------
+    def _somar(self, nome, rotulos, campo, valor):
+        chave = (nome, json.dumps(rotulos, sort_keys=True, ensure_ascii=False), campo)
+        with self._lock:
+            self._pendente[chave] = self._pendente.get(chave, 0.0) + valor
+
+    def contar(self, nome, rotulos, valor=1):
+        self._somar(nome, rotulos, "total", valor)
+
+    def observar(self, nome, rotulos, segundos):
+        self._somar(nome, rotulos, "sum", segundos)
+        self._somar(nome, rotulos, "count", 1)
+        for limite in BUCKETS:
+            if segundos <= limite:
+                self._somar(nome, rotulos, f"le:{limite}", 1)
+
+    # -------------------------
+    # Medição da requisição/job atual
+    # -------------------------
+    @property
+    def atual(self):
+        return getattr(self._local, "medicao", None)
+
+    def iniciar(self, rota):
+        self._local.medicao = Medicao(rota)
+
+    def finalizar(self, status=None, rotulos=None):
+        medicao = self.atual
+        if medicao is None:
+            return
+        self._local.medicao = None
+        rotulos = {"rota": medicao.rota, **(rotulos or {})}
+        if status is not None:
+            rotulos["status"] = str(status)
+        self.observar("rpg_requisicao_segundos", rotulos, time.perf_counter() - medicao.inicio)
+        for fase, segundos in medicao.fases.items():
+            if segundos:
+                self.observar("rpg_fase_segundos", {"rota": medicao.rota, "fase": fase}, segundos)
+        if medicao.consultas:
+            self.contar("rpg_db_consultas_total", {"rota": medicao.rota}, medicao.consultas)
+        if time.monotonic() - self._ultimo_envio >= self.intervalo:
+            self.enviar()
+
+    def somar_fase(self, fase, segundos):
+        medicao = self.atual
+        if medicao is not None:
+            medicao.fases[fase] += segundos
+
+    @contextmanager
+    def fase(self, nome):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.somar_fase(nome, time.perf_counter() - inicio)
+
+    def instrumentado(self, rota):
+        """Decorator para código fora de requisição (jobs da fila)."""
+        def decorator(func):
+            def wrapper(*args, **kwargs):
+                self.iniciar(rota)
+                status = "erro"
+                try:
+                    resultado = func(*args, **kwargs)
+                    status = "ok"
+                    return resultado
+                finally:
+                    self.finalizar(status)
+            wrapper.__name__ = func.__name__
+            wrapper.__doc__ = func.__doc__
+            return wrapper
+        return decorator
+
+    def registrar_llm(self, status, prompt_tokens=0, completion_tokens=0):
+        rota = self.atual.rota if self.atual else "-"
+        self.contar("rpg_llm_chamadas_total", {"rota": rota, "status": status})
+        if prompt_tokens:
+            self.contar("rpg_llm_tokens_total", {"rota": rota, "tipo": "prompt"}, prompt_tokens)
+        if completion_tokens:
+            self.contar("rpg_llm_tokens_total", {"rota": rota, "tipo": "completion"}, completion_tokens)
+
+    def conectar_engine(self, engine):
+        """Conta consultas e soma o tempo de banco na medição atual."""
+        from sqlalchemy import event
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def antes(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault("metricas_inicio", []).append(time.perf_counter())
+
+        @event.listens_for(engine, "after_cursor_execute")
+        def depois(conn, cursor, statement, parameters, context, executemany):
+            inicio = conn.info["metricas_inicio"].pop()
+            medicao = self.atual
+            if medicao is not None:
+                medicao.fases["db"] += time.perf_counter() - inicio
+                medicao.consultas += 1
+
+    # -------------------------
+    # Armazenamento compartilhado
+    # -------------------------
+    def _conectar(self):
+        conn = sqlite3.connect(self.caminho, timeout=10, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        if not self._preparado:
+            conn.executescript(SCHEMA)
+            self._preparado = True
+        return conn
+
+    def enviar(self):
+        """Soma o acumulado deste processo no arquivo compartilhado."""
+        with self._lock:
+            pendente, self._pendente = self._pendente, {}
+            self._ultimo_envio = time.monotonic()
+        if not pendente:
+            return
+        try:
+            with closing(self._conectar()) as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                conn.executemany(
+                    "INSERT INTO metricas (nome, rotulos, campo, valor) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (nome, rotulos, campo) DO UPDATE SET valor = valor + excluded.valor",
+                    [(*chave, valor) for chave, valor in pendente.items()],
+                )
+                conn.execute("COMMIT")
+        except sqlite3.Error:
+            # não perde o acumulado: volta para a próxima tentativa
+            with self._lock:
+                for chave, valor in pendente.items():
+                    self._pendente[chave] = self._pendente.get(chave, 0.0) + valor
+
+    def exportar(self):
+        """Texto no formato de exposição do Prometheus (todos os workers)."""
+        self.enviar()
+        with closing(self._conectar()) as conn:
+            linhas = conn.execute("SELECT nome, rotulos, campo, valor FROM metricas ORDER BY nome, rotulos").fetchall()
+
+        series = {}
+        for nome, rotulos, campo, valor in linhas:
+            series.setdefault(nome, {}).setdefault(rotulos, {})[campo] = valor
+
+        saida = []
+        for nome, (tipo, ajuda) in DEFINICOES.items():
+            saida.append(f"# HELP {nome} {ajuda}")
+            saida.append(f"# TYPE {nome} {tipo}")
+            for rotulos, campos in series.get(nome, {}).items():
+                rotulos = json.loads(rotulos)
+                if tipo == "counter":
+                    saida.append(f"{nome}{_rotulos(rotulos)} {_numero(campos.get('total', 0))}")
+                    continue
+                for limite in BUCKETS:
+                    saida.append(f"{nome}_bucket{_rotulos({**rotulos, 'le': str(limite)})} "
+                                 f"{_numero(campos.get(f'le:{limite}', 0))}")
+                saida.append(f"{nome}_bucket{_rotulos({**rotulos, 'le': '+Inf'})} {_numero(campos.get('count', 0))}")
+                saida.append(f"{nome}_sum{_rotulos(rotulos)} {_numero(campos.get('sum', 0))}")
+                saida.append(f"{nome}_count{_rotulos(rotulos)} {_numero(campos.get('count', 0))}")
+        return "\n".join(saida) + "\n"
+
+
+def _rotulos(rotulos):
+    if not rotulos:
+        return ""
+    partes = []
+    for chave, valor in rotulos.items():
+        valor = str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        partes.append(f'{chave}="{valor}"')
+    return "{" + ",".join(partes) + "}"
+
+
+def _numero(valor):
+    return str(int(valor)) if float(valor).is_integer() else repr(float(valor))
@@ -1,11 +1,72 @@
 import os
+import zlib
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
+
+try:
+    import zstandard
+except ImportError:  # zstd é opcional; zlib sempre disponível
+    zstandard = None
 
 db = SQLAlchemy()
 
+# Codec usado ao gravar auditorias novas ("zstd" só se o pacote zstandard existir)
+CODEC_AUDITORIA = os.getenv("AUDITORIA_CODEC", "zstd" if zstandard else "zlib")
+
+
+def comprimir(texto, codec=None):
+    codec = codec or CODEC_AUDITORIA
+    dados = (texto or "").encode("utf-8")
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=10).compress(dados)
+    return zlib.compress(dados, 6)
+
+
+def descomprimir(blob, codec):
+    if blob is None:
+        return ""
+    if codec == "zstd":
+        return zstandard.ZstdDecompressor().decompress(blob).decode("utf-8")
+    return zlib.decompress(blob).decode("utf-8")
+
+# -------------------------
+# Engine
+# -------------------------
+def opcoes_engine(config):
+    """SQLALCHEMY_ENGINE_OPTIONS a partir da config: pool no Postgres (SQLite não usa)."""
+    if config["SQLALCHEMY_DATABASE_URI"].startswith("sqlite"):
+        return {}
+    return {
+        "pool_size": config["DB_POOL_SIZE"],
+        "max_overflow": config["DB_MAX_OVERFLOW"],
+        "pool_timeout": config["DB_POOL_TIMEOUT"],
+        "pool_recycle": config["DB_POOL_RECYCLE"],
+        "pool_pre_ping": config["DB_POOL_PRE_PING"],
+    }
+
+
+def configurar_sqlite(engine, config):
+    """Pragmas aplicados a cada conexão SQLite nova.
+
+    Em WAL leitores não bloqueiam o escritor (e vice-versa); synchronous=NORMAL
+    só faz fsync no checkpoint; busy_timeout faz a escrita concorrente esperar
+    a vez em vez de falhar na hora com "database is locked".
+    """
+    if engine.dialect.name != "sqlite":
+        return
+
+    @event.listens_for(engine, "connect")
+    def pragmas(dbapi_conn, _):
+        cursor = dbapi_conn.cursor()
+        cursor.execute(f"PRAGMA busy_timeout = {int(config['SQLITE_BUSY_TIMEOUT'])}")
+        if config["SQLITE_JOURNAL_MODE"]:
+            cursor.execute(f"PRAGMA journal_mode = {config['SQLITE_JOURNAL_MODE']}")
+        if config["SQLITE_SYNCHRONOUS"]:
+            cursor.execute(f"PRAGMA synchronous = {config['SQLITE_SYNCHRONOUS']}")
+        cursor.close()
+
 # -------------------------
 # Models
 # -------------------------
@@ -20,12 +81,6 @@ class Usuario(db.Model, UserMixin):
     is_superuser = db.Column(db.Boolean, default=False)
     data_criacao = db.Column(db.DateTime, default=datetime.utcnow)
 
-    def set_password(self, pw):
-        self.password_hash = generate_password_hash(pw)
-
-    def check_password(self, pw):
-        return check_password_hash(self.password_hash, pw)
-
     def get_id(self):
         return str(self.id)
 
@@ -70,23 +125,91 @@ class Aventura(db.Model):
     metadados = db.Column(db.JSON, default={})
     estado_personagens = db.Column(db.JSON, default={})
     estado_aventura = db.Column(db.JSON, default={})
+    # Incrementada a cada escrita que muda o dashboard (chave do cache / ETag)
+    versao = db.Column(db.Integer, nullable=False, default=0, server_default="0")
     criador_id = db.Column(db.Integer, db.ForeignKey("core_usuario.id"), nullable=True)
     criador = db.relationship("Usuario", backref="aventuras_criadas")
 
 class Sessao(db.Model):
     __tablename__ = "core_sessao"
+    __table_args__ = (
+        db.Index("ix_sessao_aventura_criado", "aventura_id", "criado_em"),
+    )
     id = db.Column(db.Integer, primary_key=True)
     aventura_id = db.Column(db.Integer, db.ForeignKey("core_aventura.id"))
     aventura = db.relationship("Aventura", backref="sessoes")
     narrador_ia = db.Column(db.Text)
     acoes_jogadores = db.Column(db.JSON, default=list)
+    # Registro das rolagens da rodada (semente + entradas + resultados), ver dados.py
+    rolagens = db.Column(db.JSON, nullable=True)
     resultado = db.Column(db.Text)
     criado_em = db.Column(db.DateTime, default=datetime.utcnow)
-    prompt_usado = db.Column(db.Text, default="")
-    resposta_bruta = db.Column(db.Text, default="")
+    # Legado: prompt/resposta agora ficam comprimidos em SessaoAuditoria.
+    # Colunas só são lidas sob demanda e esvaziadas por `flask compactar-auditoria`.
+    prompt_usado_legado = db.deferred(db.Column("prompt_usado", db.Text, nullable=True))
+    resposta_bruta_legado = db.deferred(db.Column("resposta_bruta", db.Text, nullable=True))
+    auditoria = db.relationship(
+        "SessaoAuditoria", uselist=False, lazy="select",
+        back_populates="sessao", cascade="all, delete-orphan"
+    )
+
+    def _auditoria(self):
+        if self.auditoria is None:
+            self.auditoria = SessaoAuditoria(codec=CODEC_AUDITORIA)
+        return self.auditoria
+
+    @property
+    def prompt_usado(self):
+        if self.auditoria is not None:
+            return self.auditoria.prompt_usado
+        return self.prompt_usado_legado or ""
+
+    @prompt_usado.setter
+    def prompt_usado(self, texto):
+        self._auditoria().prompt_usado = texto
+
+    @property
+    def resposta_bruta(self):
+        if self.auditoria is not None:
+            return self.auditoria.resposta_bruta
+        return self.resposta_bruta_legado or ""
+
+    @resposta_bruta.setter
+    def resposta_bruta(self, texto):
+        self._auditoria().resposta_bruta = texto
+
+
+class SessaoAuditoria(db.Model):
+    """Payloads de auditoria de uma Sessao (prompt enviado e resposta bruta), comprimidos."""
+    __tablename__ = "core_sessaoauditoria"
+    id = db.Column(db.Integer, primary_key=True)
+    sessao_id = db.Column(db.Integer, db.ForeignKey("core_sessao.id", ondelete="CASCADE"), unique=True, nullable=False)
+    sessao = db.relationship("Sessao", back_populates="auditoria")
+    codec = db.Column(db.String(10), nullable=False, default="zlib")
+    prompt_comprimido = db.Column(db.LargeBinary)
+    resposta_comprimida = db.Column(db.LargeBinary)
+
+    @property
+    def prompt_usado(self):
+        return descomprimir(self.prompt_comprimido, self.codec)
+
+    @prompt_usado.setter
+    def prompt_usado(self, texto):
+        self.prompt_comprimido = comprimir(texto, self.codec)
+
+    @property
+    def resposta_bruta(self):
+        return descomprimir(self.resposta_comprimida, self.codec)
+
+    @resposta_bruta.setter
+    def resposta_bruta(self, texto):
+        self.resposta_comprimida = comprimir(texto, self.codec)
 
 class Participacao(db.Model):
     __tablename__ = "core_participacao"
+    __table_args__ = (
+        db.Index("ix_participacao_usuario_aventura", "usuario_id", "aventura_id"),
+    )
     id = db.Column(db.Integer, primary_key=True)
     usuario_id = db.Column(db.Integer, db.ForeignKey("core_usuario.id"))
     usuario = db.relationship("Usuario", backref="participacoes")
@@ -96,8 +219,39 @@ class Participacao(db.Model):
     aventura = db.relationship("Aventura", backref="participantes")
     papel = db.Column(db.String(50))
 
+class AcaoRodada(db.Model):
+    """Ação de um jogador esperando a narração da rodada (TURNO_MODO="rodada").
+
+    Uma linha por jogador por rodada; as linhas saem da tabela quando a rodada
+    é narrada e gravada em Sessao/HistoricoMensagens.
+    """
+    __tablename__ = "core_acaorodada"
+    __table_args__ = (
+        db.Index("ix_acaorodada_aventura_fechada", "aventura_id", "fechada"),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    aventura_id = db.Column(db.Integer, db.ForeignKey("core_aventura.id", ondelete="CASCADE"), nullable=False)
+    aventura = db.relationship("Aventura", backref=db.backref("acoes_rodada", cascade="all, delete-orphan"))
+    usuario_id = db.Column(db.Integer, db.ForeignKey("core_usuario.id"), nullable=False)
+    personagem_id = db.Column(db.Integer, db.ForeignKey("core_personagem.id"))
+    autor = db.Column(db.String(100))
+    acao = db.Column(db.Text, nullable=False)
+    contexto = db.Column(db.Text)
+    rolagens = db.Column(db.JSON, nullable=True)
+    # id da rodada (payload do job que vai narrá-la); None = sobra de rodada que falhou
+    rodada = db.Column(db.String(32), nullable=True)
+    # fechada = o job já pegou a ação para narrar; ações novas vão para a próxima rodada
+    fechada = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
+    apos_id = db.Column(db.Integer)  # cursor do histórico do jogador ao enviar
+    chave = db.Column(db.String(100))  # chave de idempotência do envio
+    criado_em = db.Column(db.DateTime, default=datetime.utcnow)
+
 class HistoricoMensagens(db.Model):
     __tablename__ = "core_historicomensagens"
+    __table_args__ = (
+        # id entra no índice para o keyset (criado_em, id) da paginação do histórico
+        db.Index("ix_historico_aventura_criado", "aventura_id", "criado_em", "id"),
+    )
     id = db.Column(db.Integer, primary_key=True)
     usuario_id = db.Column(db.Integer, db.ForeignKey("core_usuario.id"), nullable=True)
     usuario = db.relationship("Usuario", backref="mensagens")
@@ -0,0 +1,280 @@
+# narrador.py
+import hashlib
+import os
+import random
+import threading
+import time
+
+# -------------------------
+# Narrador (backend da IA)
+# -------------------------
+# As rotas e jobs não falam com a OpenAI diretamente: chamam narrador.completar()
+# ou narrador.stream(), e o backend vem de NARRADOR_BACKEND ("openai" ou "local",
+# este determinístico e sem rede, para testes e desenvolvimento).
+#
+# Em volta do backend:
+# - timeout por chamada (NARRADOR_TIMEOUT);
+# - no máximo NARRADOR_CONCORRENCIA chamadas simultâneas por processo; quem não
+#   consegue vaga em NARRADOR_ESPERA segundos recebe NarradorOcupado;
+# - falhas transitórias (timeout, conexão, 429, 5xx) são repetidas até
+#   NARRADOR_TENTATIVAS vezes, com backoff exponencial + jitter;
+# - disjuntor: após NARRADOR_FALHAS falhas transitórias seguidas, as chamadas
+#   falham na hora com NarradorIndisponivel por NARRADOR_PAUSA segundos; depois
+#   uma chamada de teste decide se volta ao normal.
+# Num stream, só dá para repetir enquanto nenhum trecho foi entregue.
+
+
+class NarradorIndisponivel(Exception):
+    def __init__(self, mensagem, tentar_em=5):
+        super().__init__(mensagem)
+        self.tentar_em = tentar_em
+
+
+class NarradorOcupado(NarradorIndisponivel):
+    pass
+
+
+class Resposta:
+    """Texto (ou trecho, num stream) + uso de tokens; `bruto` é o objeto do provedor."""
+
+    def __init__(self, texto, prompt_tokens=0, completion_tokens=0, bruto=None):
+        self.texto = texto
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+        self.bruto = bruto
+
+    def __str__(self):
+        return str(self.bruto) if self.bruto is not None else self.texto
+
+
+# -------------------------
+# Backends
+# -------------------------
+class BackendOpenAI:
+    def __init__(self, modelo, base_url=None):
+        self.modelo = modelo
+        self.base_url = base_url
+        self._cliente = None
+        self._lock = threading.Lock()
+
+    @property
+    def cliente(self):
+        # importar o pacote openai é a parte mais cara do boot: só no primeiro uso
+        with self._lock:
+            if self._cliente is None:
+                from openai import OpenAI
+                # as repetições ficam com o Narrador (o disjuntor precisa enxergar cada falha)
+                self._cliente = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), base_url=self.base_url, max_retries=0)
+            return self._cliente
+
+    def transitorio(self, erro):
+        import openai
+        if isinstance(erro, openai.APIStatusError):
+            return erro.status_code in (408, 409, 429) or erro.status_code >= 500
+        return isinstance(erro, (openai.APIConnectionError, TimeoutError, ConnectionError))
+
+    def completar(self, mensagens, temperatura, max_tokens, timeout):
+        response = self.cliente.chat.completions.create(
+            model=self.modelo, messages=mensagens, temperature=temperatura, max_tokens=max_tokens, timeout=timeout)
+        uso = response.usage
+        return Resposta(response.choices[0].message.content or "",
+                        getattr(uso, "prompt_tokens", 0), getattr(uso, "completion_tokens", 0), response)
+
+    def stream(self, mensagens, temperatura, max_tokens, timeout):
+        stream = self.cliente.chat.completions.create(
+            model=self.modelo, messages=mensagens, temperature=temperatura, max_tokens=max_tokens, timeout=timeout,
+            stream=True,
+            stream_options={"include_usage": True}  # último chunk traz usage (sem choices)
+        )
+        for chunk in stream:
+            uso = chunk.usage
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            yield Resposta(delta or "", getattr(uso, "prompt_tokens", 0), getattr(uso, "completion_tokens", 0), chunk)
+
+
+class BackendLocal:
+    """Narração determinística (o mesmo pedido gera o mesmo texto), sem rede."""
+
+    FRASES = (
+        "A névoa se abre devagar diante do grupo.",
+        "Um rumor distante ecoa pelas pedras antigas.",
+        "O vento traz cheiro de chuva e de fumaça.",
+        "Uma figura encapuzada observa da beira da estrada.",
+        "As tochas tremulam, e as sombras parecem se mover.",
+        "Algo brilha no chão, meio enterrado na lama.",
+        "Ao longe, um sino toca três vezes.",
+        "A trilha se divide, e nenhum dos caminhos parece seguro.",
+    )
+
+    def __init__(self, modelo="local", latencia=0.0):
+        self.modelo = modelo
+        self.latencia = latencia
+
+    def transitorio(self, erro):
+        return isinstance(erro, (TimeoutError, ConnectionError))
+
+    def _texto(self, mensagens, max_tokens):
+        semente = hashlib.sha256(repr(mensagens).encode("utf-8")).digest()
+        frases = [self.FRASES[b % len(self.FRASES)] for b in semente[:4]]
+        palavras = " ".join(frases).split()[:max_tokens or None]
+        prompt_tokens = sum(len(str(m.get("content", "")).split()) for m in mensagens)
+        return " ".join(palavras), prompt_tokens, len(palavras)
+
+    def completar(self, mensagens, temperatura, max_tokens, timeout):
+        time.sleep(self.latencia)
+        texto, prompt_tokens, completion_tokens = self._texto(mensagens, max_tokens)
+        return Resposta(texto, prompt_tokens, completion_tokens, {"backend": "local", "texto": texto})
+
+    def stream(self, mensagens, temperatura, max_tokens, timeout):
+        time.sleep(self.latencia)
+        texto, prompt_tokens, completion_tokens = self._texto(mensagens, max_tokens)
+        palavras = texto.split(" ")
+        for i, palavra in enumerate(palavras):
+            yield Resposta((" " if i else "") + palavra, bruto={"backend": "local", "delta": palavra})
+        yield Resposta("", prompt_tokens, completion_tokens, {"backend": "local", "texto": texto})
+
+
+BACKENDS = {"openai": BackendOpenAI, "local": BackendLocal}
+
+
+# -------------------------
+# Disjuntor
+# -------------------------
+class Disjuntor:
+    def __init__(self, limite=5, pausa=30):
+        self.limite = limite  # falhas seguidas até abrir
+        self.pausa = pausa  # segundos aberto antes da chamada de teste
+        self.falhas = 0
+        self.aberto_ate = 0.0
+        self._testando = False
+        self._lock = threading.Lock()
+
+    @property
+    def aberto(self):
+        return self.falhas >= self.limite
+
+    def permitir(self):
+        """Levanta NarradorIndisponivel se aberto; passada a pausa, libera uma chamada de teste."""
+        with self._lock:
+            if not self.aberto:
+                return
+            restante = self.aberto_ate - time.monotonic()
+            if restante > 0 or self._testando:
+                raise NarradorIndisponivel(
+                    "O Mestre IA está indisponível no momento (muitas falhas seguidas do provedor). "
+                    "Tente novamente em instantes.", tentar_em=max(1, int(restante) + 1))
+            self._testando = True
+
+    def sucesso(self):
+        with self._lock:
+            self.falhas = 0
+            self._testando = False
+
+    def falha(self):
+        with self._lock:
+            self.falhas += 1
+            self._testando = False
+            if self.aberto:
+                self.aberto_ate = time.monotonic() + self.pausa
+
+    def liberar(self):
+        """Chamada de teste terminou sem dizer nada sobre o provedor (erro do pedido)."""
+        with self._lock:
+            self._testando = False
+
+
+# -------------------------
+# Narrador
+# -------------------------
+class Narrador:
+    def __init__(self, backend=None, timeout=60, concorrencia=8, espera=10, tentativas=3, backoff=1.0,
+                 falhas=5, pausa=30):
+        self.backend = backend
+        self.timeout = timeout
+        self.concorrencia = concorrencia
+        self.espera = espera
+        self.tentativas = tentativas
+        self.backoff = backoff
+        self.disjuntor = Disjuntor(falhas, pausa)
+        self._vagas = threading.BoundedSemaphore(concorrencia)
+
+    def init_app(self, app):
+        nome = app.config.get("NARRADOR_BACKEND", "openai")
+        if nome not in BACKENDS:
+            raise ValueError(f"NARRADOR_BACKEND desconhecido: {nome!r} (opções: {', '.join(BACKENDS)})")
+        if nome == "openai":
+            self.backend = BackendOpenAI(app.config["NARRADOR_MODELO"], app.config.get("OPENAI_BASE_URL"))
+        else:
+            self.backend = BACKENDS[nome](app.config["NARRADOR_MODELO"])
+        self.timeout = float(app.config.get("NARRADOR_TIMEOUT", self.timeout))
+        self.concorrencia = int(app.config.get("NARRADOR_CONCORRENCIA", self.concorrencia))
+        self.espera = float(app.config.get("NARRADOR_ESPERA", self.espera))
+        self.tentativas = int(app.config.get("NARRADOR_TENTATIVAS", self.tentativas))
+        self.backoff = float(app.config.get("NARRADOR_BACKOFF", self.backoff))
+        self.disjuntor = Disjuntor(int(app.config.get("NARRADOR_FALHAS", self.disjuntor.limite)),
+                                   float(app.config.get("NARRADOR_PAUSA", self.disjuntor.pausa)))
+        self._vagas = threading.BoundedSemaphore(self.concorrencia)
+        app.extensions["narrador"] = self
+
+    @property
+    def modelo(self):
+        return self.backend.modelo
+
+    def verificar(self):
+        """Falha na hora (NarradorIndisponivel) se o disjuntor estiver aberto, sem gastar a chamada de teste."""
+        if self.disjuntor.aberto and self.disjuntor.aberto_ate > time.monotonic():
+            self.disjuntor.permitir()
+
+    def _ocupar(self):
+        if not self._vagas.acquire(timeout=self.espera):
+            raise NarradorOcupado("Muitas narrações em andamento; tente novamente em instantes.")
+
+    def _esperar(self, tentativa):
+        time.sleep(self.backoff * 2 ** (tentativa - 1) * random.uniform(0.5, 1.5))
+
+    def _falhou(self, erro, tentativa):
+        """Registra a falha; devolve True se vale tentar de novo."""
+        if not self.backend.transitorio(erro):
+            self.disjuntor.liberar()
+            return False
+        self.disjuntor.falha()
+        return tentativa < self.tentativas and not self.disjuntor.aberto
+
+    def completar(self, mensagens, temperatura=0.8, max_tokens=800):
+        for tentativa in range(1, self.tentativas + 1):
+            self.disjuntor.permitir()
+            self._ocupar()
+            try:
+                resposta = self.backend.completar(mensagens, temperatura, max_tokens, self.timeout)
+            except Exception as e:
+                if not self._falhou(e, tentativa):
+                    raise
+            else:
+                self.disjuntor.sucesso()
+                return resposta
+            finally:
+                self._vagas.release()
+            self._esperar(tentativa)
+
+    def stream(self, mensagens, temperatura=0.8, max_tokens=800):
+        """Gera Resposta por trecho; o último traz o uso de tokens."""
+        for tentativa in range(1, self.tentativas + 1):
+            self.disjuntor.permitir()
+            self._ocupar()
+            entregou = False
+            try:
+                for trecho in self.backend.stream(mensagens, temperatura, max_tokens, self.timeout):
+                    entregou = entregou or bool(trecho.texto)
+                    yield trecho
+            except GeneratorExit:
+                self.disjuntor.liberar()
+                raise
+            except Exception as e:
+                if not self._falhou(e, tentativa) or entregou:
+                    raise
+            else:
+                self.disjuntor.sucesso()
+                return
+            finally:
+                self._vagas.release()
+            self._esperar(tentativa)
@@ -0,0 +1,154 @@
+# prompts.py
+import logging
+from functools import lru_cache
+
+try:
+    import tiktoken
+except ImportError:  # contagem cai na estimativa por caracteres
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# -------------------------
+# Montagem de prompts com orçamento de tokens
+# -------------------------
+# Cada prompt é montado a partir de seções com prioridade. As seções são
+# medidas com o tokenizer do modelo (tiktoken) e, se o total passar do
+# orçamento, as de menor prioridade são cortadas primeiro (ou descartadas).
+# O tamanho medido de cada seção fica disponível para log/diagnóstico.
+
+# Orçamento de tokens de entrada por modelo (o contexto real é bem maior;
+# o limite aqui é de custo/latência, não de capacidade).
+ORCAMENTOS = {
+    "gpt-4o-mini": 6000,
+    "gpt-4o": 6000,
+}
+ORCAMENTO_PADRAO = 4000
+
+# Prioridades usadas pelas rotas (maior = mais importante, cortada por último)
+PRIORIDADE_ESSENCIAL = 100  # nunca cortada
+PRIORIDADE_ALTA = 80
+PRIORIDADE_MEDIA = 50
+PRIORIDADE_BAIXA = 20
+
+SEPARADOR = "\n\n"
+
+
+@lru_cache(maxsize=8)
+def _encoding(modelo):
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(modelo)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+    except Exception:
+        # tiktoken baixa o vocabulário na primeira vez; sem rede, usa a estimativa
+        logger.warning("tiktoken indisponível para %s; usando estimativa de tokens", modelo)
+        return None
+
+
+def contar_tokens(texto, modelo="gpt-4o-mini"):
+    texto = texto or ""
+    enc = _encoding(modelo)
+    if enc is None:
+        return len(texto) // 4 + 1 if texto else 0
+    return len(enc.encode(texto))
+
+
+def cortar_tokens(texto, max_tokens, modelo="gpt-4o-mini", manter="fim"):
+    """Corta o texto para no máximo max_tokens, mantendo o início ou o fim."""
+    texto = texto or ""
+    if max_tokens <= 0:
+        return ""
+    enc = _encoding(modelo)
+    if enc is None:
+        limite = max_tokens * 4
+        if len(texto) <= limite:
+            return texto
+        return "…" + texto[-limite:] if manter == "fim" else texto[:limite] + "…"
+
+    tokens = enc.encode(texto)
+    if len(tokens) <= max_tokens:
+        return texto
+    if manter == "fim":
+        return "…" + enc.decode(tokens[-max_tokens:])
+    return enc.decode(tokens[:max_tokens]) + "…"
+
+
+class Secao:
+    def __init__(self, nome, texto, prioridade=PRIORIDADE_MEDIA, titulo=None, manter="fim"):
+        self.nome = nome
+        self.texto = texto or ""
+        self.prioridade = prioridade
+        self.titulo = titulo
+        self.manter = manter  # ao cortar, preserva o "inicio" ou o "fim" do texto
+        self.tokens_originais = 0
+        self.tokens = 0
+
+    def renderizar(self, texto=None):
+        texto = self.texto if texto is None else texto
+        return f"{self.titulo}\n{texto}" if self.titulo else texto
+
+
+class PromptMontado:
+    def __init__(self, texto, secoes, orcamento):
+        self.texto = texto
+        self.secoes = secoes
+        self.orcamento = orcamento
+
+    @property
+    def total_tokens(self):
+        return sum(s.tokens for s in self.secoes)
+
+    def tamanhos(self):
+        """{nome: {"tokens", "originais"}} de cada seção, para log e diagnóstico."""
+        return {s.nome: {"tokens": s.tokens, "originais": s.tokens_originais} for s in self.secoes}
+
+    def __str__(self):
+        return self.texto
+
+
+class PromptBuilder:
+    def __init__(self, modelo="gpt-4o-mini", orcamento=None):
+        self.modelo = modelo
+        self.orcamento = orcamento or ORCAMENTOS.get(modelo, ORCAMENTO_PADRAO)
+        self.secoes = []
+
+    def adicionar(self, nome, texto, prioridade=PRIORIDADE_MEDIA, titulo=None, manter="fim"):
+        """Adiciona uma seção (ignorada se o texto for vazio). Ordem de inserção = ordem no prompt."""
+        if texto:
+            self.secoes.append(Secao(nome, texto, prioridade, titulo, manter))
+        return self
+
+    def montar(self):
+        for s in self.secoes:
+            s.tokens = s.tokens_originais = contar_tokens(s.renderizar(), self.modelo)
+        separadores = contar_tokens(SEPARADOR, self.modelo) * max(len(self.secoes) - 1, 0)
+
+        excesso = sum(s.tokens for s in self.secoes) + separadores - self.orcamento
+        cortaveis = sorted(
+            (s for s in self.secoes if s.prioridade < PRIORIDADE_ESSENCIAL),
+            key=lambda s: s.prioridade
+        )
+        textos = {id(s): s.texto for s in self.secoes}
+        for s in cortaveis:
+            if excesso <= 0:
+                break
+            cabecalho = contar_tokens(s.renderizar(""), self.modelo)
+            disponivel = s.tokens - cabecalho - excesso
+            if disponivel <= 0:
+                # não sobra espaço útil: descarta a seção inteira
+                excesso -= s.tokens
+                s.tokens = 0
+                textos[id(s)] = None
+                continue
+            textos[id(s)] = cortar_tokens(s.texto, disponivel, self.modelo, s.manter)
+            novo = contar_tokens(s.renderizar(textos[id(s)]), self.modelo)
+            excesso -= s.tokens - novo
+            s.tokens = novo
+
+        partes = [s.renderizar(textos[id(s)]) for s in self.secoes if textos[id(s)] is not None]
+        if excesso > 0:
+            logger.warning("Prompt excede o orçamento em %s tokens mesmo após cortes", excesso)
+        return PromptMontado(SEPARADOR.join(partes), self.secoes, self.orcamento)
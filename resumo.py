@@ -0,0 +1,64 @@
+# resumo.py
+from models import Sessao
+from prompts import cortar_tokens
+
+# -------------------------
+# Resumo incremental da aventura
+# -------------------------
+# A cada N sessões novas, as narrações ainda não resumidas são "dobradas" em
+# Aventura.resumo_atual por um job da fila. O id da última Sessao incorporada
+# fica em Aventura.metadados, então cada rodada só lê o que é novo e o prompt
+# do turno carrega um resumo de tamanho limitado em vez do histórico inteiro.
+
+CHAVE_CURSOR = "resumo_ate_sessao_id"
+
+SYSTEM_PROMPT_RESUMO = (
+    "Você é o cronista de uma campanha de RPG. Mantenha um resumo fiel e enxuto "
+    "dos acontecimentos, preservando nomes, objetivos, pistas e pendências."
+)
+
+
+def cursor_resumo(aventura):
+    return (aventura.metadados or {}).get(CHAVE_CURSOR, 0)
+
+
+def sessoes_nao_resumidas(aventura, limite):
+    return (
+        Sessao.query
+        .filter(Sessao.aventura_id == aventura.id, Sessao.id > cursor_resumo(aventura))
+        .order_by(Sessao.id.asc())
+        .limit(limite)
+        .all()
+    )
+
+
+def precisa_resumir(aventura, a_cada):
+    """True quando já há pelo menos `a_cada` sessões fora do resumo."""
+    return len(sessoes_nao_resumidas(aventura, a_cada)) >= a_cada
+
+
+def montar_prompt_resumo(resumo_atual, sessoes, max_tokens):
+    """Prompt para consolidar o resumo atual com as sessões novas.
+
+    Cada narração entra cortada (em tokens do modelo) para o orçamento total
+    caber em ~3x max_tokens.
+    """
+    por_sessao = max(50, (2 * max_tokens) // max(len(sessoes), 1))
+    eventos = []
+    for s in sessoes:
+        acoes = "; ".join(a for a in (s.acoes_jogadores or []) if a)
+        linha = f"- Ações: {acoes}\n  Narração: " if acoes else "- Narração: "
+        eventos.append(linha + cortar_tokens(s.resultado or s.narrador_ia, por_sessao))
+
+    return (
+        f"Resumo até agora:\n{cortar_tokens(resumo_atual, max_tokens) or '(vazio)'}\n\n"
+        f"Novos acontecimentos:\n" + "\n".join(eventos) + "\n\n"
+        f"Reescreva o resumo consolidado da aventura incorporando os novos acontecimentos, "
+        f"em no máximo {max_tokens} tokens, em prosa corrida e sem mencionar IA."
+    )
+
+
+def aplicar_resumo(aventura, texto, ultima_sessao_id):
+    aventura.resumo_atual = texto
+    # JSON sem MutableDict: é preciso atribuir um dict novo para o SQLAlchemy detectar
+    aventura.metadados = {**(aventura.metadados or {}), CHAVE_CURSOR: ultima_sessao_id}
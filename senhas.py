@@ -0,0 +1,70 @@
+# senhas.py
+import os
+import threading
+
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+# -------------------------
+# Hash de senhas com concorrência limitada
+# -------------------------
+# scrypt/pbkdf2 são CPU puro: uma rajada de logins ocuparia todos os núcleos.
+# O hash roda na própria thread da requisição (hashlib libera o GIL nesses
+# algoritmos), mas no máximo SENHA_WORKERS ao mesmo tempo por processo; quem
+# não consegue vaga em SENHA_ESPERA segundos recebe SenhasOcupadas (503) em vez
+# de empilhar trabalho. O objetivo é só limitar a concorrência: a requisição
+# espera o hash de qualquer jeito. O custo vem de SENHA_METODO (formato do
+# Werkzeug, ex. "scrypt:32768:8:1" ou "pbkdf2:sha256:600000"); hashes com custo
+# diferente são refeitos no login.
+
+METODO_PADRAO = "scrypt:32768:8:1"
+
+
+class SenhasOcupadas(Exception):
+    pass
+
+
+def normalizar_metodo(metodo):
+    """Completa o método com os parâmetros padrão do Werkzeug ("scrypt" -> "scrypt:32768:8:1")."""
+    nome, *args = metodo.split(":")
+    if nome == "scrypt" and not args:
+        return "scrypt:32768:8:1"
+    if nome == "pbkdf2" and len(args) < 2:
+        return f"pbkdf2:{args[0] if args else 'sha256'}:{DEFAULT_PBKDF2_ITERATIONS}"
+    return metodo
+
+
+def metodo_do_hash(senha_hash):
+    return normalizar_metodo((senha_hash or "").split("$", 1)[0])
+
+
+class PoolSenhas:
+    def __init__(self, metodo=METODO_PADRAO, workers=None, espera=10):
+        self.metodo = normalizar_metodo(metodo)
+        self.workers = workers or os.cpu_count() or 1  # hashes simultâneos
+        self.espera = espera
+        self._vagas = threading.BoundedSemaphore(self.workers)
+
+    def init_app(self, app):
+        self.metodo = normalizar_metodo(app.config.get("SENHA_METODO", self.metodo))
+        self.workers = int(app.config.get("SENHA_WORKERS") or self.workers)
+        self.espera = float(app.config.get("SENHA_ESPERA", self.espera))
+        self._vagas = threading.BoundedSemaphore(self.workers)
+        app.extensions["senhas"] = self
+
+    def _executar(self, func, *args):
+        if not self._vagas.acquire(timeout=self.espera):
+            raise SenhasOcupadas("Muitas verificações de senha em andamento")
+        try:
+            return func(*args)
+        finally:
+            self._vagas.release()
+
+    def gerar(self, senha):
+        return self._executar(generate_password_hash, senha, self.metodo)
+
+    def verificar(self, senha_hash, senha):
+        return self._executar(check_password_hash, senha_hash, senha)
+
+    def desatualizado(self, senha_hash):
+        """True se o hash foi gerado com outro método/custo que o configurado."""
+        return metodo_do_hash(senha_hash) != self.metodo
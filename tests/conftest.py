@@ -0,0 +1,80 @@
+# tests/conftest.py
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "x")
+
+from app import create_app, definir_senha  # noqa: E402
+from models import Aventura, HistoricoMensagens, Participacao, Personagem, Sessao, Usuario, db  # noqa: E402
+
+REGRAS = {"erro_critico_max": 15, "erro_normal_max": 49, "acerto_normal_max": 85, "acerto_critico_min": 100}
+
+
+@pytest.fixture
+def config(tmp_path):
+    """Config de teste: tudo num diretório temporário, narrador local, orçamentos de consultas valendo."""
+    return {
+        "TESTING": True,
+        "WTF_CSRF_ENABLED": False,
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'db.sqlite3'}",
+        "FILA_DB_PATH": str(tmp_path / "fila.sqlite3"),
+        "METRICAS_DB_PATH": str(tmp_path / "metricas.sqlite3"),
+        "AOVIVO_DB_PATH": str(tmp_path / "aovivo.sqlite3"),
+        "CACHE_USUARIOS_DB_PATH": str(tmp_path / "cache_usuarios.sqlite3"),
+        "ARQUIVO_DIR": str(tmp_path / "arquivo"),
+        "NARRADOR_BACKEND": "local",
+        "SENHA_METODO": "pbkdf2:sha256:1000",
+        "CONSULTAS_MODO": "erro",
+    }
+
+
+@pytest.fixture
+def app(config):
+    app = create_app(config)
+    with app.app_context():
+        db.create_all()
+    yield app
+    app.extensions["fila"].parar()
+    with app.app_context():
+        db.engine.dispose()
+
+
+@pytest.fixture
+def dados(app):
+    """Um jogador numa aventura com vários personagens, histórico e sessões."""
+    with app.app_context():
+        u = Usuario(username="jogador", email="jogador@example.com")
+        definir_senha(u, "segredo1")
+        db.session.add(u)
+        db.session.flush()
+        aventuras = [Aventura(titulo=f"Aventura {i}", descricao="...", cenario="Floresta", status="ativa",
+                              regras=REGRAS, criador_id=u.id) for i in range(5)]
+        personagens = [Personagem(nome=f"P{i}", classe="Mago", raca="Elfo", descricao="...",
+                                  atributos={"Força": 50, "Destreza": 50, "Inteligência": 50}, usuario_id=u.id)
+                       for i in range(6)]
+        db.session.add_all(aventuras + personagens)
+        db.session.flush()
+        aventura = aventuras[0]
+        db.session.add_all(Participacao(usuario_id=u.id, aventura_id=aventura.id, personagem_id=p.id, papel="Jogador")
+                           for p in personagens)
+        for i in range(60):
+            db.session.add(HistoricoMensagens(usuario_id=u.id if i % 2 == 0 else None, aventura_id=aventura.id,
+                                              autor="P0" if i % 2 == 0 else "Mestre IA", mensagem=f"Mensagem {i}"))
+            if i % 2:
+                db.session.add(Sessao(aventura_id=aventura.id, narrador_ia=f"Narração {i}",
+                                      acoes_jogadores=[f"Ação {i}"]))
+        db.session.commit()
+        return {"usuario_id": u.id, "aventura_id": aventura.id, "personagem_ids": [p.id for p in personagens]}
+
+
+@pytest.fixture
+def cliente(app, dados):
+    """Cliente logado e já dentro da aventura."""
+    with app.test_client() as c:
+        resposta = c.post("/", data={"username": "jogador", "password": "segredo1", "submit": "Entrar"})
+        assert resposta.status_code == 302
+        c.get(f"/aventuras/{dados['aventura_id']}/entrar/")
+        yield c
@@ -0,0 +1,175 @@
+# tests/test_concorrencia.py
+"""Escrita de turnos concorrente no SQLite: journal DELETE sem espera x WAL + busy_timeout.
+
+Um leitor com transação aberta (o dashboard lendo o histórico) segura o lock
+SHARED do arquivo. Em journal DELETE o commit do escritor precisa do lock
+EXCLUSIVE e, sem busy_timeout, falha na hora com "database is locked". Em WAL
+o leitor lê o próprio snapshot e não bloqueia ninguém; entre escritores o
+busy_timeout faz o segundo esperar a vez em vez de falhar.
+"""
+import sqlite3
+import threading
+import time
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from app import create_app, gravar_turno, pagina_historico
+from models import Aventura, HistoricoMensagens, Usuario, db
+
+ANTIGO = {"SQLITE_JOURNAL_MODE": "DELETE", "SQLITE_SYNCHRONOUS": "FULL", "SQLITE_BUSY_TIMEOUT": 0}
+NOVO = {}  # padrão do app: WAL, synchronous NORMAL, busy_timeout 5000 ms
+
+
+@pytest.fixture
+def criar_app(config, tmp_path):
+    """Fábrica de apps com pragmas diferentes; cada uma com seu arquivo e aventuras já criadas."""
+    apps = []
+
+    def criar(pragmas, aventuras=1):
+        caminho = tmp_path / f"turnos{len(apps)}.sqlite3"
+        app = create_app({**config, **pragmas, "SQLALCHEMY_DATABASE_URI": f"sqlite:///{caminho}",
+                          "CONSULTAS_MODO": "desligado"})
+        apps.append(app)
+        with app.app_context():
+            db.create_all()
+            u = Usuario(username="jogador", email="jogador@example.com", password_hash="x")
+            db.session.add(u)
+            db.session.flush()
+            lista = [Aventura(titulo=f"A{i}", regras={}, criador_id=u.id) for i in range(aventuras)]
+            db.session.add_all(lista)
+            db.session.commit()
+            return app, str(caminho), u.id, [a.id for a in lista]
+
+    yield criar
+    for app in apps:
+        app.extensions["fila"].parar()
+        with app.app_context():
+            db.engine.dispose()
+
+
+def gravar(app, usuario_id, aventura_id, i=0):
+    with app.app_context():
+        try:
+            aventura = db.session.get(Aventura, aventura_id)
+            gravar_turno(aventura, usuario_id, "P0", f"ação {i}", "prompt", f"narração {i}", "{}")
+        except OperationalError:
+            db.session.rollback()
+            raise
+
+
+def leitor_com_transacao(caminho):
+    conn = sqlite3.connect(caminho, isolation_level=None)
+    conn.execute("BEGIN")
+    conn.execute("SELECT COUNT(*) FROM core_historicomensagens").fetchone()
+    return conn
+
+
+def escritor_com_transacao(caminho):
+    # liberado por um Timer, de outra thread
+    conn = sqlite3.connect(caminho, isolation_level=None, check_same_thread=False)
+    conn.execute("BEGIN IMMEDIATE")
+    return conn
+
+
+def mensagens(app, aventura_id):
+    with app.app_context():
+        return db.session.scalar(db.select(db.func.count(HistoricoMensagens.id))
+                                 .where(HistoricoMensagens.aventura_id == aventura_id))
+
+
+def test_leitor_aberto_trava_o_turno_no_modo_antigo(criar_app):
+    app, caminho, usuario_id, (aventura_id,) = criar_app(ANTIGO)
+    leitor = leitor_com_transacao(caminho)
+    try:
+        with pytest.raises(OperationalError, match="database is locked"):
+            gravar(app, usuario_id, aventura_id)
+    finally:
+        leitor.close()
+    assert mensagens(app, aventura_id) == 0
+
+
+def test_leitor_aberto_nao_trava_o_turno_em_wal(criar_app):
+    app, caminho, usuario_id, (aventura_id,) = criar_app(NOVO)
+    leitor = leitor_com_transacao(caminho)
+    try:
+        gravar(app, usuario_id, aventura_id)
+        # o leitor continua no snapshot de antes do turno
+        assert leitor.execute("SELECT COUNT(*) FROM core_historicomensagens").fetchone() == (0,)
+    finally:
+        leitor.close()
+    assert mensagens(app, aventura_id) == 2
+
+
+def test_escritor_ocupado_sem_busy_timeout_falha(criar_app):
+    app, caminho, usuario_id, (aventura_id,) = criar_app({"SQLITE_BUSY_TIMEOUT": 0})
+    outro = escritor_com_transacao(caminho)
+    try:
+        with pytest.raises(OperationalError, match="database is locked"):
+            gravar(app, usuario_id, aventura_id)
+    finally:
+        outro.close()
+
+
+def test_escritor_ocupado_com_busy_timeout_espera_a_vez(criar_app):
+    app, caminho, usuario_id, (aventura_id,) = criar_app(NOVO)
+    outro = escritor_com_transacao(caminho)
+    liberar = threading.Timer(0.2, outro.execute, ("COMMIT",))
+    liberar.start()
+    try:
+        inicio = time.monotonic()
+        gravar(app, usuario_id, aventura_id)
+        assert time.monotonic() - inicio >= 0.15  # esperou o outro escritor
+    finally:
+        liberar.join()
+        outro.close()
+    assert mensagens(app, aventura_id) == 2
+
+
+def rodar_em_paralelo(app, usuario_id, aventura_ids, turnos=20, leitores=4):
+    """Escritores (um por aventura) gravando turnos enquanto leitores paginam o histórico."""
+    erros = []
+    parar = threading.Event()
+
+    def escritor(aventura_id):
+        for i in range(turnos):
+            try:
+                gravar(app, usuario_id, aventura_id, i)
+            except OperationalError as e:
+                erros.append(str(e.orig))
+
+    def leitor():
+        with app.app_context():
+            while not parar.is_set():
+                for aventura_id in aventura_ids:
+                    try:
+                        pagina_historico(aventura_id, None, 50)
+                    except OperationalError as e:
+                        erros.append(str(e.orig))
+                    db.session.rollback()
+
+    threads_leitores = [threading.Thread(target=leitor) for _ in range(leitores)]
+    threads_escritores = [threading.Thread(target=escritor, args=(aid,)) for aid in aventura_ids]
+    for t in threads_leitores + threads_escritores:
+        t.start()
+    for t in threads_escritores:
+        t.join()
+    parar.set()
+    for t in threads_leitores:
+        t.join()
+    return erros
+
+
+def test_turnos_em_paralelo_sem_database_is_locked(criar_app):
+    app, _, usuario_id, aventura_ids = criar_app(NOVO, aventuras=4)
+    erros = rodar_em_paralelo(app, usuario_id, aventura_ids)
+    assert erros == []
+    for aventura_id in aventura_ids:
+        assert mensagens(app, aventura_id) == 40
+
+
+def test_turnos_em_paralelo_no_modo_antigo_travam(criar_app):
+    app, _, usuario_id, aventura_ids = criar_app(ANTIGO, aventuras=4)
+    erros = rodar_em_paralelo(app, usuario_id, aventura_ids)
+    assert erros
+    assert all("database is locked" in e for e in erros)
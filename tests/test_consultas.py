@@ -0,0 +1,123 @@
+# tests/test_consultas.py
+"""Orçamento de consultas por rota (CONSULTAS_ORCAMENTOS) e ausência de N+1.
+
+O app de teste roda com CONSULTAS_MODO="erro": a própria requisição falha se
+passar do orçamento da rota ou repetir SQL. Os testes ainda contam por fora com
+limite_consultas, para o número ficar no relatório do pytest.
+"""
+import json
+
+import pytest
+
+from consultas import OrcamentoExcedido, limite_consultas
+from models import HistoricoMensagens, Personagem, db
+
+XHR = {"X-Requested-With": "XMLHttpRequest"}
+
+
+def orcamento(app, rota):
+    return app.config["CONSULTAS_ORCAMENTOS"][rota]
+
+
+def form_turno(dados, acao="Abro a porta"):
+    ativos = {f"personagem_{pid}": "on" for pid in dados["personagem_ids"][::2]}
+    return {"acao": acao, "contexto": "", **ativos}
+
+
+def eventos_sse(corpo):
+    eventos = []
+    for bloco in corpo.decode().split("\n\n"):
+        campos = dict(linha.split(": ", 1) for linha in bloco.splitlines() if ": " in linha)
+        if "event" in campos:
+            eventos.append((campos["event"], json.loads(campos["data"])))
+    return eventos
+
+
+@pytest.mark.parametrize("url, rota", [
+    ("/aventuras/", "rpg.lista_aventuras"),
+    ("/dashboard", "rpg.dashboard"),
+])
+def test_paginas_dentro_do_orcamento(app, cliente, url, rota):
+    with app.app_context():
+        engine = db.engine
+    with limite_consultas(engine, orcamento(app, rota), rota):
+        resposta = cliente.get(url)
+    assert resposta.status_code == 200
+    assert int(resposta.headers["X-Consultas"]) <= orcamento(app, rota)
+
+
+def test_historico(app, cliente, dados):
+    with app.app_context():
+        engine = db.engine
+        ultima = db.session.scalars(
+            db.select(HistoricoMensagens).order_by(HistoricoMensagens.id.desc()).limit(1)
+        ).one()
+        cursor = f"{ultima.criado_em.isoformat()}|{ultima.id}"
+    with limite_consultas(engine, orcamento(app, "rpg.historico"), "rpg.historico"):
+        resposta = cliente.get("/historico", query_string={"antes": cursor, "limite": 20})
+    assert resposta.status_code == 200
+    assert len(resposta.get_json()["mensagens"]) == 20
+
+
+def test_enviar_turno_fila(app, cliente, dados):
+    with app.app_context():
+        engine = db.engine
+    with limite_consultas(engine, orcamento(app, "rpg.enviar_turno"), "rpg.enviar_turno"):
+        resposta = cliente.post("/enviar_turno", data=form_turno(dados), headers=XHR)
+    assert resposta.status_code == 202
+
+
+def test_enviar_turno_rodada(app, cliente, dados):
+    app.config["TURNO_MODO"] = "rodada"
+    with app.app_context():
+        engine = db.engine
+    with limite_consultas(engine, orcamento(app, "rpg.enviar_turno"), "rpg.enviar_turno (rodada)"):
+        resposta = cliente.post("/enviar_turno", data=form_turno(dados), headers=XHR)
+    assert resposta.status_code == 202
+
+
+def test_enviar_turno_stream(app, cliente, dados):
+    """A requisição e o stream têm orçamentos separados; o stream é consumido aqui dentro."""
+    with app.app_context():
+        engine = db.engine
+    with limite_consultas(engine, orcamento(app, "rpg.enviar_turno_stream"), "rpg.enviar_turno_stream"):
+        resposta = cliente.post("/enviar_turno/stream", data=form_turno(dados), headers={"Idempotency-Key": "k1"})
+    assert resposta.status_code == 200
+
+    with limite_consultas(engine, orcamento(app, "rpg.enviar_turno_stream:sse"), "rpg.enviar_turno_stream:sse"):
+        corpo = resposta.get_data()
+    eventos = eventos_sse(corpo)
+    assert eventos[0][0] == "delta"
+    assert eventos[-1][0] == "fim"
+
+    with app.app_context():
+        ultimas = db.session.scalars(
+            db.select(HistoricoMensagens.autor).order_by(HistoricoMensagens.id.desc()).limit(2)
+        ).all()
+    assert ultimas == ["Mestre IA", "P0"]
+
+
+def test_criar_personagem(app, cliente, dados):
+    dados_form = {"nome": "Novo", "classe": "Ladino", "raca": "Humano", "descricao": "Ágil",
+                  "forca": 40, "destreza": 70, "inteligencia": 50}
+    with app.app_context():
+        engine = db.engine
+    with limite_consultas(engine, orcamento(app, "rpg.criar_personagem"), "rpg.criar_personagem"):
+        resposta = cliente.post("/criar_personagem", data=dados_form)
+    assert resposta.status_code == 302
+    with app.app_context():
+        assert db.session.scalar(db.select(Personagem.classe).where(Personagem.nome == "Novo")) == "Ladino"
+
+
+def test_modo_erro_barra_a_requisicao_fora_do_orcamento(app, cliente):
+    app.config["CONSULTAS_ORCAMENTOS"] = {**app.config["CONSULTAS_ORCAMENTOS"], "rpg.dashboard": 1}
+    with pytest.raises(OrcamentoExcedido, match="rpg.dashboard"):
+        cliente.get("/dashboard")
+
+
+def test_enviar_turno_stream_no_modo_rodada(app, cliente, dados):
+    """No modo rodada o stream só repassa para enviar_turno: mesmo orçamento."""
+    app.config["TURNO_MODO"] = "rodada"
+    resposta = cliente.post("/enviar_turno/stream", data=form_turno(dados), headers=XHR)
+    assert resposta.status_code == 202
+    assert int(resposta.headers["X-Consultas"]) <= orcamento(app, "rpg.enviar_turno_stream")
@@ -0,0 +1,6 @@
+# wsgi.py
+# Ponto de entrada do servidor (ex.: gunicorn -w 4 wsgi:app). Importar app.py
+# não cria nada; a instância do processo nasce aqui.
+from app import create_app
+
+app = create_app()